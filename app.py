@@ -1,75 +1,31 @@
 from __future__ import annotations
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Literal
+from contextlib import asynccontextmanager
 import os
+import time
 
 from fastapi import FastAPI, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from sqlalchemy import create_engine, MetaData, Table, select, or_, func
+from sqlalchemy import select, or_, func, union
 
-# ================= DB INIT =================
-DB_URL = os.environ.get(
-    "BETMAKER_DB_URL",
-    "sqlite:///C:/Users/HomeComp/PycharmProjects/pythonProject/UKparserToBD/betmaker.sqlite3"
-)
-engine = create_engine(DB_URL, future=True)
-meta = MetaData()
-meta.reflect(bind=engine)
-
-Leagues: Table = meta.tables["leagues"]
-Seasons: Table = meta.tables["seasons"]
-Teams:   Table = meta.tables["teams"]
-Matches: Table = meta.tables["matches"]
+import db
+from db import engine, meta, Leagues, Seasons, Teams, Matches, col as _col, stat_columns
+from refdata import REFDATA
+from data_version import DATA_VERSION
+import odds_consensus
+import db_indexes
+import coalesce
+from response_cache import ResponseCacheMiddleware, default_cache as default_response_cache
 
 # =============== HELPERS ===================
-def season_sort_key(label: str) -> Tuple[int, int, int]:
-    try:
-        if "_" in label:
-            y1, y2 = map(int, label.split("_"))
-            return (y2, y1, 0)
-        y = int(label)
-        return (y, y, 1)
-    except Exception:
-        return (0, 0, -1)
-
-def _sort_labels_desc(labels: list[str]) -> list[str]:
-    return sorted(labels, key=season_sort_key, reverse=True)
+from model_service import season_sort_key, _sort_labels_desc
 
 def _empty_series(season_labels: list[str]) -> "SeriesResponse":
     return SeriesResponse(seasons=season_labels, points=[])
 
-# ---- динамическое разрешение имён колонок в matches ----
-def _col(tbl, *candidates):
-    cols = set(tbl.c.keys())
-    for name in candidates:
-        if name in cols:
-            return tbl.c[name]
-    return None
-
-def _resolve_stat_columns(stat_type: str):
-    """
-    Возвращает (home_col, away_col) для нужного stat_type.
-    """
-    if stat_type == "shots":
-        # В твоей схеме away-колонка называется AS_ (с подчёркиванием!)
-        h = _col(Matches, "HS", "HomeShots", "shots_home", "SH", "S_H")
-        a = _col(Matches, "AS_", "AS", "AwayShots", "shots_away", "SA", "S_A")
-        return h, a
-    if stat_type == "sot":
-        h = _col(Matches, "HST", "HomeShotsOnTarget", "sot_home", "HSoT")
-        a = _col(Matches, "AST", "AwayShotsOnTarget", "sot_away", "ASoT")
-        return h, a
-    if stat_type == "corners":
-        h = _col(Matches, "HC", "HomeCorners", "corners_home")
-        a = _col(Matches, "AC", "AwayCorners", "corners_away")
-        return h, a
-    if stat_type == "cards":
-        h = _col(Matches, "HY", "HomeYellows", "cards_home", "YH")
-        a = _col(Matches, "AY", "AwayYellows", "cards_away", "YA")
-        return h, a
-    return None, None
-
 # =============== SCHEMAS ===================
 class LeagueOut(BaseModel):
     id: int
@@ -117,13 +73,22 @@ class TimePoint(BaseModel):
     match_away: str
     score: str
     match_label: str
+    # /api/timeseries/multi: счёт по каждой стате
+    scores: Dict[str, str] | None = None
 
 class SeriesResponse(BaseModel):
     seasons: List[str]
     points: List[TimePoint]
 
 # =============== APP =======================
-app = FastAPI(title="Goals/Corners/Cards/Shots/SOT Explorer")
+@asynccontextmanager
+async def _lifespan(app):
+    SNAPSHOT_SCHEDULER.start()
+    yield
+    await SNAPSHOT_SCHEDULER.stop()
+    FIT_POOL.shutdown()
+
+app = FastAPI(title="Goals/Corners/Cards/Shots/SOT Explorer", lifespan=_lifespan)
 
 from handicaps import router as handicaps_router
 app.include_router(handicaps_router)
@@ -133,6 +98,15 @@ from h2h import router as h2h_router
 
 app.include_router(h2h_router)
 
+import forecast
+app.include_router(forecast.router)
+
+import league_moments
+app.include_router(league_moments.router)
+
+from form import router as form_router
+app.include_router(form_router)
+
 
 
 @app.get("/__routes")
@@ -174,6 +148,16 @@ def __diag_stat_counts(
             "seasons": labels,
         }
 
+# кэш ответов read-only GET-эндпоинтов (ETag/304); CORS добавлен позже -> снаружи
+RESPONSE_CACHE = default_response_cache()
+RESPONSE_FLIGHTS = coalesce.Coalescer("responses")
+app.add_middleware(
+    ResponseCacheMiddleware, cache=RESPONSE_CACHE, flights=RESPONSE_FLIGHTS,
+    prefixes=("/api/leagues", "/api/seasons", "/api/teams", "/api/timeseries",
+              "/api/h2h_odds", "/api/superprog", "/api/handicaps", "/api/forecast",
+              "/api/league_moments", "/api/form", "/api/league_matrix"),
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"]
@@ -183,47 +167,41 @@ app.add_middleware(
 @app.get("/api/leagues", response_model=List[LeagueOut])
 def api_leagues():
     with engine.begin() as conn:
-        rows = conn.execute(
-            select(Leagues.c.id, Leagues.c.country, Leagues.c.name)
-            .order_by(Leagues.c.country, Leagues.c.name)
-        ).all()
-    return [LeagueOut(id=r.id, country=r.country, name=r.name) for r in rows]
+        ref = REFDATA.get(conn, meta)
+    return [LeagueOut(**ref.leagues[lid]) for lid in ref.league_order]
 
 @app.get("/api/seasons", response_model=List[SeasonOut])
 def api_seasons(league_id: int = Query(..., ge=1)):
     with engine.begin() as conn:
-        rows = conn.execute(
-            select(Seasons.c.id, Seasons.c.label, Seasons.c.is_current)
-            .where(Seasons.c.league_id == league_id)
-        ).all()
-    rows_sorted = sorted(rows, key=lambda r: season_sort_key(r.label), reverse=True)
-    return [SeasonOut(id=r.id, label=r.label, is_current=int(r.is_current or 0)) for r in rows_sorted]
+        ref = REFDATA.get(conn, meta)
+    rows = ref.league_seasons(league_id)
+    sids_sorted = sorted(rows, key=lambda sid: season_sort_key(rows[sid]), reverse=True)
+    return [SeasonOut(id=sid, label=rows[sid], is_current=ref.season_current[sid]) for sid in sids_sorted]
 
 @app.get("/api/teams", response_model=List[TeamOut])
 def api_teams(league_id: int = Query(..., ge=1)):
     with engine.begin() as conn:
-        home_ids = {row[0] for row in conn.execute(
-            select(Matches.c.home_team_id).where(Matches.c.league_id == league_id)
-        ).all()}
-        away_ids = {row[0] for row in conn.execute(
-            select(Matches.c.away_team_id).where(Matches.c.league_id == league_id)
-        ).all()}
-        ids = home_ids | away_ids
-        if not ids:
-            return []
-        rows = conn.execute(
-            select(Teams.c.id, Teams.c.name).where(Teams.c.id.in_(ids))
-        ).all()
-    rows_sorted = sorted(rows, key=lambda r: r.name or "")
-    return [TeamOut(id=r.id, name=r.name) for r in rows_sorted]
-
-# =============== API: ряды по ГОЛАМ ===============
-@app.get("/api/timeseries", response_model=SeriesResponse)
-def api_timeseries(
-    league_id: int = Query(..., ge=1),
-    team_ids: str = Query(...),
-    seasons: str = Query(...),
-):
+        ref = REFDATA.get(conn, meta)
+        # хозяева и гости — один UNION (дедупликация в SQL), оба по индексам лиги
+        team_ids = {row[0] for row in conn.execute(union(
+            select(Matches.c.home_team_id).where(Matches.c.league_id == league_id),
+            select(Matches.c.away_team_id).where(Matches.c.league_id == league_id),
+        )).all()}
+    ids = [tid for tid in team_ids if tid in ref.team_name]
+    ids.sort(key=lambda tid: ref.team_name[tid] or "")
+    return [TeamOut(id=tid, name=ref.team_name[tid]) for tid in ids]
+
+# =============== API: ряды (общий движок) ===============
+# stat_type -> (поле «за», поле «против», поле «тотал») в TimePoint
+TS_FIELDS: Dict[str, Tuple[str, str, str]] = {
+    "goals":   ("goals_for",   "goals_against",   "total_goals"),
+    "corners": ("corners_for", "corners_against", "total_corners"),
+    "cards":   ("cards_for",   "cards_against",   "total_cards"),
+    "shots":   ("shots_for",   "shots_against",   "total_shots"),
+    "sot":     ("sot_for",     "sot_against",     "total_sot"),
+}
+
+def _parse_ts_params(team_ids: str, seasons: str):
     try:
         team_list = [int(x) for x in team_ids.split(",") if x.strip()]
     except Exception:
@@ -232,164 +210,196 @@ def api_timeseries(
     season_labels = [x.strip() for x in seasons.split(",") if x.strip()]
     if not team_list or not season_labels:
         raise HTTPException(400, "team_ids and seasons are required")
+    return team_list, season_labels
 
+def _timeseries(league_id: int, team_list: list[int], season_labels: list[str],
+                stats: list[str], fmt: str = "rows"):
+    """
+    Ряды по матчам команд сразу для нескольких стат — один SELECT по matches.
+    Матч попадает в ряд, если есть хотя бы одна из запрошенных стат; score и
+    match_label строятся по первой доступной стате, все счета — в scores.
+    fmt="columnar" — см. _ts_columnar.
+    """
     with engine.begin() as conn:
-        srows = conn.execute(
-            select(Seasons.c.id, Seasons.c.label)
-            .where(Seasons.c.league_id == league_id, Seasons.c.label.in_(season_labels))
-        ).all()
-        sid_by_label = {r.label: r.id for r in srows}
+        ref = REFDATA.get(conn, meta)
+        sid_by_label = ref.season_ids(league_id, season_labels)
         if not sid_by_label:
             raise HTTPException(404, "No seasons found")
-
-        trows = conn.execute(
-            select(Teams.c.id, Teams.c.name)
-            .where(Teams.c.id.in_(team_list))
-        ).all()
-        tname = {r.id: r.name for r in trows}
-
-        all_team_rows = conn.execute(select(Teams.c.id, Teams.c.name)).all()
-        name_by_id = {r.id: r.name for r in all_team_rows}
+        name_by_id = ref.team_name
+
+        # колонки, которых нет в схеме (напр. shots), просто пропускаем
+        cols: List[Tuple[str, Any, Any]] = []
+        for st in stats:
+            h, a = stat_columns(st)
+            if h is not None and a is not None:
+                cols.append((st, h, a))
+        if not cols:
+            if fmt == "columnar":
+                return JSONResponse(_ts_columnar(season_labels, team_list, [], [], {}, name_by_id))
+            return _empty_series(season_labels)
 
         sids = list(sid_by_label.values())
+        sel = [Matches.c.date, Matches.c.season_id, Matches.c.home_team_id, Matches.c.away_team_id]
+        for st, h, a in cols:
+            sel += [h.label(f"H_{st}"), a.label(f"A_{st}")]
         mrows = conn.execute(
-            select(
-                Matches.c.date, Matches.c.season_id,
-                Matches.c.home_team_id, Matches.c.away_team_id,
-                Matches.c.FTHG, Matches.c.FTAG
-            )
+            select(*sel)
             .where(Matches.c.league_id == league_id, Matches.c.season_id.in_(sids))
             .where(or_(Matches.c.home_team_id.in_(team_list), Matches.c.away_team_id.in_(team_list)))
             .order_by(Matches.c.date.asc())
         ).all()
 
-    points: List[Dict[str, Any]] = []
     label_by_sid = {v: k for k, v in sid_by_label.items()}
+    if fmt == "columnar":
+        return JSONResponse(_ts_columnar(season_labels, team_list, cols, mrows, label_by_sid, name_by_id))
+
+    points: List[Dict[str, Any]] = []
+    multi = len(stats) > 1
 
     for m in mrows:
-        if m.FTHG is None or m.FTAG is None:
+        vals: Dict[str, Tuple[int, int]] = {}
+        for st, _, _ in cols:
+            hv, av = getattr(m, f"H_{st}"), getattr(m, f"A_{st}")
+            if hv is not None and av is not None:
+                vals[st] = (int(hv), int(av))
+        if not vals:
             continue
-        FTHG, FTAG = int(m.FTHG), int(m.FTAG)
         lbl = label_by_sid.get(m.season_id)
-        total = FTHG + FTAG
 
         home_id = m.home_team_id
         away_id = m.away_team_id
         home_name = name_by_id.get(home_id, str(home_id))
         away_name = name_by_id.get(away_id, str(away_id))
-        score_str = f"{FTHG}–{FTAG}"
+        scores = {st: f"{hv}–{av}" for st, (hv, av) in vals.items()}
+        score_str = next(iter(scores.values()))
         match_label = f"{home_name} {score_str} {away_name}"
 
         for tid in team_list:
             if tid == home_id:
-                gf = FTHG; ga = FTAG; opp = away_name; ha = "H"
+                is_home = True; opp = away_name; ha = "H"
             elif tid == away_id:
-                gf = FTAG; ga = FTHG; opp = home_name; ha = "A"
+                is_home = False; opp = home_name; ha = "A"
             else:
                 continue
-            points.append(dict(
+            pt = dict(
                 date=str(m.date),
                 season=lbl,
                 team_id=tid,
-                team_name=tname.get(tid, str(tid)),
-                goals_for=gf,
-                goals_against=ga,
-                total_goals=total,
+                team_name=name_by_id.get(tid, str(tid)),
                 opponent_name=opp,
                 ha=ha,
                 match_home=home_name,
                 match_away=away_name,
                 score=score_str,
                 match_label=match_label,
-            ))
-    return SeriesResponse(seasons=season_labels, points=[TimePoint(**p) for p in points])
-
-# =============== API: ряды по УГЛОВЫМ ===============
-@app.get("/api/timeseries_corners", response_model=SeriesResponse)
-def api_timeseries_corners(
-    league_id: int = Query(..., ge=1),
-    team_ids: str = Query(...),
-    seasons: str = Query(...),
-):
-    try:
-        team_list = [int(x) for x in team_ids.split(",") if x.strip()]
-    except Exception:
-        raise HTTPException(400, "Invalid team_ids")
-
-    season_labels = [x.strip() for x in seasons.split(",") if x.strip()]
-    if not team_list or not season_labels:
-        raise HTTPException(400, "team_ids and seasons are required")
-
-    with engine.begin() as conn:
-        srows = conn.execute(
-            select(Seasons.c.id, Seasons.c.label)
-            .where(Seasons.c.league_id == league_id, Seasons.c.label.in_(season_labels))
-        ).all()
-        sid_by_label = {r.label: r.id for r in srows}
-        if not sid_by_label:
-            raise HTTPException(404, "No seasons found")
-
-        trows = conn.execute(
-            select(Teams.c.id, Teams.c.name)
-            .where(Teams.c.id.in_(team_list))
-        ).all()
-        tname = {r.id: r.name for r in trows}
-
-        all_team_rows = conn.execute(select(Teams.c.id, Teams.c.name)).all()
-        name_by_id = {r.id: r.name for r in all_team_rows}
-
-        sids = list(sid_by_label.values())
-        mrows = conn.execute(
-            select(
-                Matches.c.date, Matches.c.season_id,
-                Matches.c.home_team_id, Matches.c.away_team_id,
-                Matches.c.HC, Matches.c.AC
             )
-            .where(Matches.c.league_id == league_id, Matches.c.season_id.in_(sids))
-            .where(or_(Matches.c.home_team_id.in_(team_list), Matches.c.away_team_id.in_(team_list)))
-            .order_by(Matches.c.date.asc())
-        ).all()
-
-    points: List[Dict[str, Any]] = []
-    label_by_sid = {v: k for k, v in sid_by_label.items()}
+            for st, (hv, av) in vals.items():
+                f_for, f_against, f_total = TS_FIELDS[st]
+                pt[f_for], pt[f_against] = (hv, av) if is_home else (av, hv)
+                pt[f_total] = hv + av
+            if multi:
+                pt["scores"] = scores
+            points.append(pt)
+    return SeriesResponse(seasons=season_labels, points=[TimePoint(**p) for p in points])
 
+def _ts_columnar(season_labels: list[str], team_list: list[int], cols, mrows,
+                 label_by_sid: Dict[int, str], name_by_id: Dict[int, str]) -> Dict[str, Any]:
+    """
+    Столбцовый (struct-of-arrays) вариант ответа: параллельные массивы по полям,
+    имена команд — отдельным словарём id -> name. Без pydantic-моделей на строку.
+    score/match_label не дублируем: они собираются на клиенте из
+    home_id/away_id, ha и значений статы.
+    """
+    out: Dict[str, List[Any]] = {
+        "date": [], "season": [], "team_id": [], "opponent_id": [], "ha": [],
+    }
+    stat_cols = []
+    for st, _, _ in cols:
+        f_for, f_against, f_total = TS_FIELDS[st]
+        out[f_for] = []; out[f_against] = []; out[f_total] = []
+        stat_cols.append((f"H_{st}", f"A_{st}", out[f_for], out[f_against], out[f_total]))
+    date_c, season_c, team_c, opp_c, ha_c = (out["date"], out["season"], out["team_id"],
+                                             out["opponent_id"], out["ha"])
+
+    team_set = set(team_list)
+    used_ids = set(team_list)
     for m in mrows:
-        if m.HC is None or m.AC is None:
-            continue
-        HCO, ACO = int(m.HC), int(m.AC)
-        lbl = label_by_sid.get(m.season_id)
-        total = HCO + ACO
-
         home_id = m.home_team_id
         away_id = m.away_team_id
-        home_name = name_by_id.get(home_id, str(home_id))
-        away_name = name_by_id.get(away_id, str(away_id))
-        score_str = f"{HCO}–{ACO}"
-        match_label = f"{home_name} {score_str} {away_name}"
-
+        if home_id not in team_set and away_id not in team_set:
+            continue
+        vals = [(getattr(m, hk), getattr(m, ak)) for hk, ak, *_ in stat_cols]
+        if all(hv is None or av is None for hv, av in vals):
+            continue
+        date = str(m.date)
+        lbl = label_by_sid.get(m.season_id)
         for tid in team_list:
             if tid == home_id:
-                cf = HCO; ca = ACO; opp = away_name; ha = "H"
+                is_home = True; opp = away_id
             elif tid == away_id:
-                cf = ACO; ca = HCO; opp = home_name; ha = "A"
+                is_home = False; opp = home_id
             else:
                 continue
-            points.append(dict(
-                date=str(m.date),
-                season=lbl,
-                team_id=tid,
-                team_name=tname.get(tid, str(tid)),
-                corners_for=cf,
-                corners_against=ca,
-                total_corners=total,
-                opponent_name=opp,
-                ha=ha,
-                match_home=home_name,
-                match_away=away_name,
-                score=score_str,
-                match_label=match_label,
-            ))
-    return SeriesResponse(seasons=season_labels, points=[TimePoint(**p) for p in points])
+            used_ids.add(opp)
+            date_c.append(date); season_c.append(lbl); team_c.append(tid)
+            opp_c.append(opp); ha_c.append("H" if is_home else "A")
+            for (hv, av), (_, _, c_for, c_against, c_total) in zip(vals, stat_cols):
+                if hv is None or av is None:
+                    c_for.append(None); c_against.append(None); c_total.append(None)
+                    continue
+                hv, av = int(hv), int(av)
+                c_for.append(hv if is_home else av)
+                c_against.append(av if is_home else hv)
+                c_total.append(hv + av)
+
+    return {
+        "format": "columnar",
+        "seasons": season_labels,
+        "n": len(date_c),
+        "names": {str(tid): name_by_id.get(tid, str(tid)) for tid in sorted(used_ids)},
+        "columns": out,
+    }
+
+@app.get("/api/timeseries/multi", response_model=SeriesResponse)
+def api_timeseries_multi(
+    league_id: int = Query(..., ge=1),
+    team_ids: str = Query(...),
+    seasons: str = Query(...),
+    stats: str = Query(",".join(TS_FIELDS), description="comma-separated: goals,corners,cards,shots,sot"),
+    format: str = Query("rows", regex="^(rows|columnar)$"),
+):
+    """
+    Все запрошенные статы одним запросом — вкладки UI переключаются без нового похода на сервер.
+    """
+    team_list, season_labels = _parse_ts_params(team_ids, seasons)
+    stat_list = [x.strip() for x in stats.split(",") if x.strip()]
+    bad = [x for x in stat_list if x not in TS_FIELDS]
+    if bad or not stat_list:
+        raise HTTPException(400, f"Unsupported stats: {','.join(bad) or '—'}")
+    stat_list = list(dict.fromkeys(stat_list))
+    return _timeseries(league_id, team_list, season_labels, stat_list, fmt=format)
+
+# =============== API: ряды по ГОЛАМ ===============
+@app.get("/api/timeseries", response_model=SeriesResponse)
+def api_timeseries(
+    league_id: int = Query(..., ge=1),
+    team_ids: str = Query(...),
+    seasons: str = Query(...),
+    format: str = Query("rows", regex="^(rows|columnar)$"),
+):
+    team_list, season_labels = _parse_ts_params(team_ids, seasons)
+    return _timeseries(league_id, team_list, season_labels, ["goals"], fmt=format)
+
+# =============== API: ряды по УГЛОВЫМ ===============
+@app.get("/api/timeseries_corners", response_model=SeriesResponse)
+def api_timeseries_corners(
+    league_id: int = Query(..., ge=1),
+    team_ids: str = Query(...),
+    seasons: str = Query(...),
+    format: str = Query("rows", regex="^(rows|columnar)$"),
+):
+    team_list, season_labels = _parse_ts_params(team_ids, seasons)
+    return _timeseries(league_id, team_list, season_labels, ["corners"], fmt=format)
 
 # =============== API: ряды по ЖЁЛТЫМ КАРТОЧКАМ ===============
 @app.get("/api/timeseries_cards", response_model=SeriesResponse)
@@ -397,86 +407,10 @@ def api_timeseries_cards(
     league_id: int = Query(..., ge=1),
     team_ids: str = Query(...),
     seasons: str = Query(...),
+    format: str = Query("rows", regex="^(rows|columnar)$"),
 ):
-    try:
-        team_list = [int(x) for x in team_ids.split(",") if x.strip()]
-    except Exception:
-        raise HTTPException(400, "Invalid team_ids")
-
-    season_labels = [x.strip() for x in seasons.split(",") if x.strip()]
-    if not team_list or not season_labels:
-        raise HTTPException(400, "team_ids and seasons are required")
-
-    with engine.begin() as conn:
-        srows = conn.execute(
-            select(Seasons.c.id, Seasons.c.label)
-            .where(Seasons.c.league_id == league_id, Seasons.c.label.in_(season_labels))
-        ).all()
-        sid_by_label = {r.label: r.id for r in srows}
-        if not sid_by_label:
-            raise HTTPException(404, "No seasons found")
-
-        trows = conn.execute(
-            select(Teams.c.id, Teams.c.name)
-            .where(Teams.c.id.in_(team_list))
-        ).all()
-        tname = {r.id: r.name for r in trows}
-
-        all_team_rows = conn.execute(select(Teams.c.id, Teams.c.name)).all()
-        name_by_id = {r.id: r.name for r in all_team_rows}
-
-        sids = list(sid_by_label.values())
-        mrows = conn.execute(
-            select(
-                Matches.c.date, Matches.c.season_id,
-                Matches.c.home_team_id, Matches.c.away_team_id,
-                Matches.c.HY, Matches.c.AY
-            )
-            .where(Matches.c.league_id == league_id, Matches.c.season_id.in_(sids))
-            .where(or_(Matches.c.home_team_id.in_(team_list), Matches.c.away_team_id.in_(team_list)))
-            .order_by(Matches.c.date.asc())
-        ).all()
-
-    points: List[Dict[str, Any]] = []
-    label_by_sid = {v: k for k, v in sid_by_label.items()}
-
-    for m in mrows:
-        if m.HY is None or m.AY is None:
-            continue
-        HY, AY = int(m.HY), int(m.AY)
-        lbl = label_by_sid.get(m.season_id)
-        total = HY + AY
-
-        home_id = m.home_team_id
-        away_id = m.away_team_id
-        home_name = name_by_id.get(home_id, str(home_id))
-        away_name = name_by_id.get(away_id, str(away_id))
-        score_str = f"{HY}–{AY}"
-        match_label = f"{home_name} {score_str} {away_name}"
-
-        for tid in team_list:
-            if tid == home_id:
-                cf = HY; ca = AY; opp = away_name; ha = "H"
-            elif tid == away_id:
-                cf = AY; ca = HY; opp = home_name; ha = "A"
-            else:
-                continue
-            points.append(dict(
-                date=str(m.date),
-                season=lbl,
-                team_id=tid,
-                team_name=tname.get(tid, str(tid)),
-                cards_for=cf,
-                cards_against=ca,
-                total_cards=total,
-                opponent_name=opp,
-                ha=ha,
-                match_home=home_name,
-                match_away=away_name,
-                score=score_str,
-                match_label=match_label,
-            ))
-    return SeriesResponse(seasons=season_labels, points=[TimePoint(**p) for p in points])
+    team_list, season_labels = _parse_ts_params(team_ids, seasons)
+    return _timeseries(league_id, team_list, season_labels, ["cards"], fmt=format)
 
 # =============== API: ряды по SHOTS (общие удары) ===============
 @app.get("/api/timeseries_shots", response_model=SeriesResponse)
@@ -484,89 +418,10 @@ def api_timeseries_shots(
     league_id: int = Query(..., ge=1),
     team_ids: str = Query(...),
     seasons: str = Query(...),
+    format: str = Query("rows", regex="^(rows|columnar)$"),
 ):
-    try:
-        team_list = [int(x) for x in team_ids.split(",") if x.strip()]
-    except Exception:
-        raise HTTPException(400, "Invalid team_ids")
-
-    season_labels = [x.strip() for x in seasons.split(",") if x.strip()]
-    if not team_list or not season_labels:
-        raise HTTPException(400, "team_ids and seasons are required")
-
-    with engine.begin() as conn:
-        srows = conn.execute(
-            select(Seasons.c.id, Seasons.c.label)
-            .where(Seasons.c.league_id == league_id, Seasons.c.label.in_(season_labels))
-        ).all()
-        sid_by_label = {r.label: r.id for r in srows}
-        if not sid_by_label:
-            raise HTTPException(404, "No seasons found")
-
-        trows = conn.execute(select(Teams.c.id, Teams.c.name).where(Teams.c.id.in_(team_list))).all()
-        tname = {r.id: r.name for r in trows}
-
-        all_team_rows = conn.execute(select(Teams.c.id, Teams.c.name)).all()
-        name_by_id = {r.id: r.name for r in all_team_rows}
-
-        sids = list(sid_by_label.values())
-
-        hs_col, as_col = _resolve_stat_columns("shots")
-        if hs_col is None or as_col is None:
-            return _empty_series(season_labels)
-
-        mrows = conn.execute(
-            select(
-                Matches.c.date, Matches.c.season_id,
-                Matches.c.home_team_id, Matches.c.away_team_id,
-                hs_col.label("HVAL"), as_col.label("AVAL")
-            )
-            .where(Matches.c.league_id == league_id, Matches.c.season_id.in_(sids))
-            .where(or_(Matches.c.home_team_id.in_(team_list), Matches.c.away_team_id.in_(team_list)))
-            .order_by(Matches.c.date.asc())
-        ).all()
-
-    points: List[Dict[str, Any]] = []
-    label_by_sid = {v: k for k, v in sid_by_label.items()}
-
-    for m in mrows:
-        HV, AV = m.HVAL, m.AVAL
-        if HV is None or AV is None:
-            continue
-        HS, AS_ = int(HV), int(AV)
-        lbl = label_by_sid.get(m.season_id)
-        total = HS + AS_
-
-        home_id = m.home_team_id
-        away_id = m.away_team_id
-        home_name = name_by_id.get(home_id, str(home_id))
-        away_name = name_by_id.get(away_id, str(away_id))
-        score_str = f"{HS}–{AS_}"
-        match_label = f"{home_name} {score_str} {away_name}"
-
-        for tid in team_list:
-            if tid == home_id:
-                sf, sa, opp, ha = HS, AS_, away_name, "H"
-            elif tid == away_id:
-                sf, sa, opp, ha = AS_, HS, home_name, "A"
-            else:
-                continue
-            points.append(dict(
-                date=str(m.date),
-                season=lbl,
-                team_id=tid,
-                team_name=tname.get(tid, str(tid)),
-                shots_for=sf,
-                shots_against=sa,
-                total_shots=total,
-                opponent_name=opp,
-                ha=ha,
-                match_home=home_name,
-                match_away=away_name,
-                score=score_str,
-                match_label=match_label,
-            ))
-    return SeriesResponse(seasons=season_labels, points=[TimePoint(**p) for p in points])
+    team_list, season_labels = _parse_ts_params(team_ids, seasons)
+    return _timeseries(league_id, team_list, season_labels, ["shots"], fmt=format)
 
 # =============== API: ряды по SOT (удары в створ) ===============
 @app.get("/api/timeseries_sot", response_model=SeriesResponse)
@@ -574,93 +429,21 @@ def api_timeseries_sot(
     league_id: int = Query(..., ge=1),
     team_ids: str = Query(...),
     seasons: str = Query(...),
+    format: str = Query("rows", regex="^(rows|columnar)$"),
 ):
-    try:
-        team_list = [int(x) for x in team_ids.split(",") if x.strip()]
-    except Exception:
-        raise HTTPException(400, "Invalid team_ids")
-
-    season_labels = [x.strip() for x in seasons.split(",") if x.strip()]
-    if not team_list or not season_labels:
-        raise HTTPException(400, "team_ids and seasons are required")
-
-    with engine.begin() as conn:
-        srows = conn.execute(
-            select(Seasons.c.id, Seasons.c.label)
-            .where(Seasons.c.league_id == league_id, Seasons.c.label.in_(season_labels))
-        ).all()
-        sid_by_label = {r.label: r.id for r in srows}
-        if not sid_by_label:
-            raise HTTPException(404, "No seasons found")
-
-        trows = conn.execute(select(Teams.c.id, Teams.c.name).where(Teams.c.id.in_(team_list))).all()
-        tname = {r.id: r.name for r in trows}
-
-        all_team_rows = conn.execute(select(Teams.c.id, Teams.c.name)).all()
-        name_by_id = {r.id: r.name for r in all_team_rows}
-
-        sids = list(sid_by_label.values())
-
-        hst_col, ast_col = _resolve_stat_columns("sot")
-        if hst_col is None or ast_col is None:
-            return _empty_series(season_labels)
-
-        mrows = conn.execute(
-            select(
-                Matches.c.date, Matches.c.season_id,
-                Matches.c.home_team_id, Matches.c.away_team_id,
-                hst_col.label("HVAL"), ast_col.label("AVAL")
-            )
-            .where(Matches.c.league_id == league_id, Matches.c.season_id.in_(sids))
-            .where(or_(Matches.c.home_team_id.in_(team_list), Matches.c.away_team_id.in_(team_list)))
-            .order_by(Matches.c.date.asc())
-        ).all()
-
-    points: List[Dict[str, Any]] = []
-    label_by_sid = {v: k for k, v in sid_by_label.items()}
-
-    for m in mrows:
-        HV, AV = m.HVAL, m.AVAL
-        if HV is None or AV is None:
-            continue
-        HST, AST_ = int(HV), int(AV)
-        lbl = label_by_sid.get(m.season_id)
-        total = HST + AST_
-
-        home_id = m.home_team_id
-        away_id = m.away_team_id
-        home_name = name_by_id.get(home_id, str(home_id))
-        away_name = name_by_id.get(away_id, str(away_id))
-        score_str = f"{HST}–{AST_}"
-        match_label = f"{home_name} {score_str} {away_name}"
-
-        for tid in team_list:
-            if tid == home_id:
-                sf, sa, opp, ha = HST, AST_, away_name, "H"
-            elif tid == away_id:
-                sf, sa, opp, ha = AST_, HST, home_name, "A"
-            else:
-                continue
-            points.append(dict(
-                date=str(m.date),
-                season=lbl,
-                team_id=tid,
-                team_name=tname.get(tid, str(tid)),
-                sot_for=sf,
-                sot_against=sa,
-                total_sot=total,
-                opponent_name=opp,
-                ha=ha,
-                match_home=home_name,
-                match_away=away_name,
-                score=score_str,
-                match_label=match_label,
-            ))
-    return SeriesResponse(seasons=season_labels, points=[TimePoint(**p) for p in points])
+    team_list, season_labels = _parse_ts_params(team_ids, seasons)
+    return _timeseries(league_id, team_list, season_labels, ["sot"], fmt=format)
 
 # ====== SUPERPROG (Dixon–Coles) ======
-from math import exp, sqrt
-from datetime import datetime
+from math import sqrt
+
+from model_cache import MODEL_CACHE, FittedModel
+from model_service import model_window, get_model
+from fit_pool import FIT_POOL
+import model_snapshots
+from handicaps import (TotalQuote, DEFAULT_TOTAL_LINES, FixturePair, _parse_lines, _grid_size,
+                       _pair_lambdas, _total_dist, _total_quotes)
+from starlette.concurrency import run_in_threadpool
 
 class SuperProgOut(BaseModel):
     team_id: int
@@ -672,207 +455,65 @@ class SuperProgOut(BaseModel):
     lambda_total: float
     ci_total_low: float
     ci_total_high: float
+    totals: List[TotalQuote] = []       # over/under по сетке счёта модели
+    total_lines: List[float] = []
     n_matches: int
     half_life_days: float
     rho: float
     stat_type: str
+    meta: Dict[str, Any] = {}
 
-def _timestamp(dt)->float:
-    if isinstance(dt, str):
-        try:
-            return datetime.fromisoformat(dt).timestamp()
-        except:
-            return 0.0
-    if isinstance(dt, datetime):
-        return dt.timestamp()
-    return 0.0
-
-def _exp_decay(w_age_days: float, half_life_days: float) -> float:
-    if half_life_days <= 0: return 1.0
-    return 2 ** ( - w_age_days / half_life_days )
-
-def _fit_dc_strengths(matches, team_ids_set, half_life_days: float, rho_init: float = 0.05,
-                      max_iter:int=60, tol:float=1e-6):
-    teams = sorted(list(team_ids_set))
-    idx = {tid:i for i,tid in enumerate(teams)}
-    nT = len(teams)
-    atk = [0.0]*nT
-    dfn = [0.0]*nT
-    home_adv = 0.20
-    rho = rho_init
-
-    def _normalize():
-        a_mean = sum(atk)/max(nT,1)
-        d_mean = sum(dfn)/max(nT,1)
-        for i in range(nT):
-            atk[i] -= a_mean
-            dfn[i] -= d_mean
-
-    if matches:
-        tmax = max(_timestamp(m['date']) for m in matches)
-    else:
-        tmax = 0.0
-
-    for _ in range(max_iter):
-        _normalize()
-        g_atk = [0.0]*nT
-        g_dfn = [0.0]*nT
-        g_h = 0.0
-        g_rho = 0.0
-
-        h_atk = [1e-6]*nT
-        h_dfn = [1e-6]*nT
-        h_h = 1e-6
-        h_rho = 1e-6
-
-        for m in matches:
-            ht = m['home_team_id']; at = m['away_team_id']
-            hg = m['FTHX']; ag = m['FTAX']
-            if hg is None or ag is None: continue
-            i = idx.get(ht); j = idx.get(at)
-            if i is None or j is None: continue
-
-            age_days = max(0.0, (tmax - _timestamp(m['date']))/86400.0)
-            w = _exp_decay(age_days, half_life_days)
-
-            lam_h = exp(atk[i] - dfn[j] + home_adv)
-            lam_a = exp(atk[j] - dfn[i])
-
-            g_atk[i] += w*(hg - lam_h)
-            g_dfn[j] += w*(-hg + lam_h)
-            g_atk[j] += w*(ag - lam_a)
-            g_dfn[i] += w*(-ag + lam_a)
-            g_h += w*(hg - lam_h)
-
-            h_atk[i] += w*lam_h
-            h_dfn[j] += w*lam_h
-            h_atk[j] += w*lam_a
-            h_dfn[i] += w*lam_a
-            h_h += w*lam_h
-
-            if (hg,ag) in [(0,0),(0,1),(1,0),(1,1)]:
-                # простая регуляризация корреляции для низких счётов
-                g_rho += w*0.0
-                h_rho += w
-
-        step = 0.25
-        for i in range(nT):
-            atk[i] += step * g_atk[i]/h_atk[i]
-            dfn[i] += step * g_dfn[i]/h_dfn[i]
-        home_adv += step * g_h / h_h
-        rho += step * g_rho / max(h_rho,1e-6)
-        rho = max(-0.3, min(0.3, rho))
-
-        if max(
-            max(abs(step*g_atk[i]/h_atk[i]) for i in range(nT)) if nT else 0.0,
-            max(abs(step*g_dfn[i]/h_dfn[i]) for i in range(nT)) if nT else 0.0,
-            abs(step*g_h/h_h),
-        ) < tol:
-            break
-
-    _normalize()
-    return atk, dfn, home_adv, rho
-
-def _load_matches_for_league(league_id:int, season_labels:list[str], conn, stat_type:str):
-    sids = [r[0] for r in conn.execute(
-        select(Seasons.c.id).where(Seasons.c.league_id==league_id, Seasons.c.label.in_(season_labels))
-    ).all()]
-    if not sids: return [], set()
-
-    if stat_type == 'corners':
-        rows = conn.execute(
-            select(Matches.c.date, Matches.c.home_team_id, Matches.c.away_team_id,
-                   Matches.c.HC.label("HVAL"), Matches.c.AC.label("AVAL"))
-            .where(Matches.c.league_id==league_id, Matches.c.season_id.in_(sids))
-            .order_by(Matches.c.date.asc())
-        ).all()
-        getter = lambda r: (r.HVAL, r.AVAL)
+def _superprog_min_matches(stat_type:str) -> int:
+    return 50 if stat_type == "goals" else 30
 
-    elif stat_type == 'cards':
-        rows = conn.execute(
-            select(Matches.c.date, Matches.c.home_team_id, Matches.c.away_team_id,
-                   Matches.c.HY.label("HVAL"), Matches.c.AY.label("AVAL"))
-            .where(Matches.c.league_id==league_id, Matches.c.season_id.in_(sids))
-            .order_by(Matches.c.date.asc())
-        ).all()
-        getter = lambda r: (r.HVAL, r.AVAL)
-
-    elif stat_type == 'shots':
-        hcol, acol = _resolve_stat_columns("shots")
-        if hcol is None or acol is None:
-            return [], set()
-        rows = conn.execute(
-            select(Matches.c.date, Matches.c.home_team_id, Matches.c.away_team_id,
-                   hcol.label("HVAL"), acol.label("AVAL"))
-            .where(Matches.c.league_id==league_id, Matches.c.season_id.in_(sids))
-            .order_by(Matches.c.date.asc())
-        ).all()
-        getter = lambda r: (r.HVAL, r.AVAL)
-
-    elif stat_type == 'sot':
-        hcol, acol = _resolve_stat_columns("sot")
-        if hcol is None or acol is None:
-            return [], set()
-        rows = conn.execute(
-            select(Matches.c.date, Matches.c.home_team_id, Matches.c.away_team_id,
-                   hcol.label("HVAL"), acol.label("AVAL"))
-            .where(Matches.c.league_id==league_id, Matches.c.season_id.in_(sids))
-            .order_by(Matches.c.date.asc())
-        ).all()
-        getter = lambda r: (r.HVAL, r.AVAL)
+def _superprog_window(league_id:int, season_labels:list[str], stat_type:str, half_life_days:float):
+    """(окно сезонов, ключ модели) для /api/superprog."""
+    return model_window(league_id, season_labels, stat_type, half_life_days,
+                        min_matches=_superprog_min_matches(stat_type))
 
-    else:  # goals
-        rows = conn.execute(
-            select(Matches.c.date, Matches.c.home_team_id, Matches.c.away_team_id,
-                   Matches.c.FTHG.label("HVAL"), Matches.c.FTAG.label("AVAL"))
-            .where(Matches.c.league_id==league_id, Matches.c.season_id.in_(sids))
-            .order_by(Matches.c.date.asc())
-        ).all()
-        getter = lambda r: (r.HVAL, r.AVAL)
-
-    matches = []
-    teams = set()
-    for r in rows:
-        d, h, a = r.date, int(r.home_team_id), int(r.away_team_id)
-        hg, ag = getter(r)
-        if hg is None or ag is None: 
-            continue
-        teams.add(h); teams.add(a)
-        matches.append({
-            'date': str(d), 'home_team_id': h, 'away_team_id': a,
-            'FTHX': int(hg), 'FTAX': int(ag),
-        })
-    return matches, teams
-
-def _extend_seasons_until_enough(league_id:int, chosen_labels:list[str], conn, stat_type:str, min_matches:int=50):
+async def _superprog_model(league_id:int, season_labels:list[str], stat_type:str, half_life_days:float,
+                           warm_start:bool=True):
     """
-    Расширяем окно сезонов назад, пока не наберём нужное число матчей с ненулевой статой.
+    Общая часть /api/superprog и /api/superprog/batch: окно сезонов + модель лиги.
     """
-    all_rows = conn.execute(
-        select(Seasons.c.label).where(Seasons.c.league_id == league_id)
-    ).all()
-    all_labels = _sort_labels_desc([r.label for r in all_rows])
-
-    # стартуем с выбранного окна в их порядке
-    window = list(chosen_labels)
-    seen = set(window)
-
-    while True:
-        matches, _ = _load_matches_for_league(league_id, window, conn, stat_type)
-        if len(matches) >= min_matches:
-            return window
-        # ищем следующий более старый сезон
-        last_idx = max(all_labels.index(l) for l in window if l in all_labels) if window else -1
-        next_idx = last_idx + 1
-        if next_idx >= len(all_labels):
-            return window  # больше нечего добавлять
-        nxt = all_labels[next_idx]
-        if nxt not in seen:
-            window.append(nxt)
-            seen.add(nxt)
+    min_needed = _superprog_min_matches(stat_type)
+    season_labels, key = await run_in_threadpool(_superprog_window, league_id, season_labels,
+                                                 stat_type, half_life_days)
+    model = await get_model(key, league_id, season_labels, stat_type, half_life_days, warm_start=warm_start)
+
+    n_matches = model.n_matches
+    if n_matches < max(15, min_needed // 2):
+        raise HTTPException(404, f"Недостаточно данных для оценки ({n_matches} записей)")
+    return season_labels, model
+
+def _superprog_point(model:FittedModel, idx:Dict[int,int], season_labels:list[str], team_id:int,
+                     opponent_id:int|None, ha_mode:str, half_life_days:float, stat_type:str,
+                     total_vals:List[float]=()) -> SuperProgOut:
+    lam_gf, lam_ga = _pair_lambdas(model, team_id, opponent_id, ha_mode, idx)
+
+    lam_total = lam_gf + lam_ga
+    sigma = sqrt(max(lam_total, 1e-9))
+    return SuperProgOut(
+        team_id=team_id,
+        season_labels=season_labels,
+        ha_mode=ha_mode,
+        opponent_id=opponent_id,
+        lambda_gf=float(lam_gf),
+        lambda_ga=float(lam_ga),
+        lambda_total=float(lam_total),
+        ci_total_low=float(max(0.0, lam_total - sigma)),
+        ci_total_high=float(lam_total + sigma),
+        totals=_total_quotes(_total_dist(lam_gf, lam_ga, max_g=_grid_size(stat_type)), total_vals),
+        total_lines=[float(x) for x in total_vals],
+        n_matches=model.n_matches,
+        half_life_days=half_life_days,
+        rho=float(model.rho),
+        stat_type=stat_type,
+        meta={"fit": model.fit_info},
+    )
 
 @app.get("/api/superprog", response_model=SuperProgOut)
-def api_superprog(
+async def api_superprog(
     league_id: int = Query(..., ge=1),
     team_id: int = Query(..., ge=1),
     seasons: str = Query(..., description="comma-separated season labels"),
@@ -880,84 +521,145 @@ def api_superprog(
     opponent_id: int | None = Query(None),
     half_life_days: float = Query(180.0, ge=1.0, le=2000.0),
     stat_type: str = Query("goals", regex="^(goals|corners|cards|shots|sot)$"),
+    total_lines: str = Query("", description="comma-separated; пусто — линейка по умолчанию для статы"),
+    warm_start: bool = Query(True, description="сид фита от прошлой модели лиги"),
 ):
     """
     Dixon–Coles + экспоненциальное затухание.
     Поддерживает: goals / corners / cards / shots / sot.
+    Тоталы (over/push/under) — по той же сетке счёта, что у /api/handicaps.
     """
     season_labels = [s.strip() for s in seasons.split(",") if s.strip()]
     if not season_labels: 
         raise HTTPException(400, "seasons required")
+    total_vals = _parse_lines(total_lines or DEFAULT_TOTAL_LINES[stat_type])
+
+    season_labels, model = await _superprog_model(league_id, season_labels, stat_type, half_life_days,
+                                                  warm_start=warm_start)
+
+    idx = {tid:i for i,tid in enumerate(model.teams)}
+    return _superprog_point(model, idx, season_labels, team_id, opponent_id, ha_mode, half_life_days, stat_type,
+                            total_vals)
+
+class SuperProgBatchIn(BaseModel):
+    league_id: int
+    seasons: str                         # comma-separated season labels
+    stat_type: Literal['goals', 'corners', 'cards', 'shots', 'sot'] = 'goals'
+    half_life_days: float = 180.0
+    total_lines: str = ""                # пусто — DEFAULT_TOTAL_LINES[stat_type]
+    pairs: List[FixturePair] = []
+    all_pairs: bool = False              # все упорядоченные пары команд окна
+    ha_mode: Literal['all', 'home', 'away'] = 'all'   # режим для all_pairs
+    warm_start: bool = True
+
+class SuperProgBatchOut(BaseModel):
+    season_labels: list[str]
+    stat_type: str
+    half_life_days: float
+    n_matches: int
+    teams: List[int]
+    results: List[SuperProgOut]
+    skipped_team_ids: List[int] = []
+    meta: Dict[str, Any] = {}
 
-    min_needed = 50 if stat_type == "goals" else 30
-
-    with engine.begin() as conn:
-        season_labels = _extend_seasons_until_enough(league_id, season_labels, conn, stat_type, min_matches=min_needed)
-        matches, team_ids_set = _load_matches_for_league(league_id, season_labels, conn, stat_type)
-
-        n_matches = len(matches)
-        if n_matches < max(15, min_needed // 2):
-            raise HTTPException(404, f"Недостаточно данных для оценки ({n_matches} записей)")
-
-        atk, dfn, home_adv, rho = _fit_dc_strengths(matches, team_ids_set, half_life_days=half_life_days)
-
-        teams = sorted(list(team_ids_set))
-        idx = {tid:i for i,tid in enumerate(teams)}
-        if team_id not in idx:
-            raise HTTPException(404, "team_id not present in this league/seasons window")
+@app.post("/api/superprog/batch", response_model=SuperProgBatchOut)
+async def api_superprog_batch(req: SuperProgBatchIn):
+    """
+    Один фит на лигу — λ, интервалы и тоталы для списка пар (или всех пар сразу).
+    """
+    season_labels = [s.strip() for s in req.seasons.split(",") if s.strip()]
+    if not season_labels:
+        raise HTTPException(400, "seasons required")
+    if not (1.0 <= req.half_life_days <= 2000.0):
+        raise HTTPException(400, "half_life_days must be in [1, 2000]")
+    if not req.pairs and not req.all_pairs:
+        raise HTTPException(400, "pairs or all_pairs required")
+    total_vals = _parse_lines(req.total_lines or DEFAULT_TOTAL_LINES[req.stat_type])
+
+    season_labels, model = await _superprog_model(req.league_id, season_labels, req.stat_type, req.half_life_days,
+                                                  warm_start=req.warm_start)
+
+    idx = {tid:i for i,tid in enumerate(model.teams)}
+    if req.all_pairs:
+        pairs = [FixturePair(team_id=t, opponent_id=o, ha_mode=req.ha_mode)
+                 for t in model.teams for o in model.teams if t != o]
+    else:
+        pairs = req.pairs
+
+    # команды вне окна сезонов не валят весь батч — отдаём их отдельным списком
+    skipped = sorted({p.team_id for p in pairs if p.team_id not in idx})
+    # сотни пар — не в event loop
+    results = await run_in_threadpool(lambda: [
+        _superprog_point(model, idx, season_labels, p.team_id, p.opponent_id, p.ha_mode,
+                         req.half_life_days, req.stat_type, total_vals)
+        for p in pairs if p.team_id in idx
+    ])
+    return SuperProgBatchOut(
+        season_labels=season_labels,
+        stat_type=req.stat_type,
+        half_life_days=req.half_life_days,
+        n_matches=model.n_matches,
+        teams=model.teams,
+        results=results,
+        skipped_team_ids=skipped,
+        meta={"fit": model.fit_info},
+    )
 
-        i = idx[team_id]
 
-        def pair_lambda(i, j, mode):
-            if mode == 'home':
-                lam_gf = exp(atk[i] - dfn[j] + home_adv)
-                lam_ga = exp(atk[j] - dfn[i])
-            elif mode == 'away':
-                lam_gf = exp(atk[i] - dfn[j])
-                lam_ga = exp(atk[j] - dfn[i] + home_adv)
-            else:
-                lam_home_gf = exp(atk[i] - dfn[j] + home_adv)
-                lam_home_ga = exp(atk[j] - dfn[i])
-                lam_away_gf = exp(atk[i] - dfn[j])
-                lam_away_ga = exp(atk[j] - dfn[i] + home_adv)
-                lam_gf = 0.5*(lam_home_gf + lam_away_gf)
-                lam_ga = 0.5*(lam_home_ga + lam_away_ga)
-                return lam_gf, lam_ga
-            return lam_gf, lam_ga
-
-        if opponent_id is not None and opponent_id in idx:
-            j = idx[opponent_id]
-            lam_gf, lam_ga = pair_lambda(i, j, ha_mode)
-        else:
-            a_avg = 0.0; d_avg = 0.0
-            if ha_mode == 'home':
-                lam_gf = exp(atk[i] - d_avg + home_adv)
-                lam_ga = exp(a_avg - dfn[i])
-            elif ha_mode == 'away':
-                lam_gf = exp(atk[i] - d_avg)
-                lam_ga = exp(a_avg - dfn[i] + home_adv)
-            else:
-                lam_gf = 0.5*(exp(atk[i] - d_avg + home_adv) + exp(atk[i] - d_avg))
-                lam_ga = 0.5*(exp(a_avg - dfn[i]) + exp(a_avg - dfn[i] + home_adv))
+# ====== SNAPSHOTS: фоновый пересчёт моделей лиг ======
+SNAPSHOT_STATS = tuple(TS_FIELDS)          # goals / corners / cards / shots / sot
 
-        lam_total = lam_gf + lam_ga
-        sigma = sqrt(max(lam_total, 1e-9))
+def _default_windows() -> Dict[int, list[str]]:
+    """league_id -> [текущий сезон] (или самый свежий по метке) — окно по умолчанию."""
+    with engine.begin() as conn:
+        ref = REFDATA.get(conn, meta)
+    out = {}
+    for lid in ref.league_order:
+        seasons = ref.league_seasons(lid)
+        if not seasons:
+            continue
+        current = [lbl for sid, lbl in seasons.items() if ref.season_current.get(sid)]
+        out[lid] = current[:1] or _sort_labels_desc(list(seasons.values()))[:1]
+    return out
 
-    return SuperProgOut(
-        team_id=team_id,
-        season_labels=season_labels,
-        ha_mode=ha_mode,
-        opponent_id=opponent_id,
-        lambda_gf=float(lam_gf),
-        lambda_ga=float(lam_ga),
-        lambda_total=float(lam_total),
-        ci_total_low=float(max(0.0, lam_total - sigma)),
-        ci_total_high=float(lam_total + sigma),
-        n_matches=n_matches,
-        half_life_days=half_life_days,
-        rho=float(rho),
-        stat_type=stat_type,
-    )
+async def refit_snapshots() -> Dict[str, Any]:
+    """
+    Все лиги × статы × half-life по умолчанию: окна сезонов /api/superprog и
+    /api/handicaps, модель через model_service.get_model (снимок или фит) — и запись снимка.
+    Фиты идут по одному, чтобы не занимать весь пул процессов.
+    Статы без колонок в схеме пропускаются; остальные ошибки не прерывают проход,
+    а считаются в errors (последняя — в last_error).
+    """
+    from handicaps import _handicaps_window
+    t0 = time.perf_counter()
+    keys = set()
+    stats = [st for st in SNAPSHOT_STATS if all(c is not None for c in stat_columns(st))]
+    errors = 0
+    last_error = None
+    windows = await run_in_threadpool(_default_windows)
+    for lid, labels in windows.items():
+        for st in stats:
+            for hl in model_snapshots.DEFAULT_HALF_LIVES:
+                for window_fn in (_superprog_window, _handicaps_window):
+                    try:
+                        lbls, key = await run_in_threadpool(window_fn, lid, labels, st, hl)
+                        await get_model(key, lid, lbls, st, hl)
+                    except Exception as e:
+                        errors += 1
+                        last_error = f"league {lid} {st} hl={hl}: {e!r}"
+                        continue
+                    keys.add(key)
+    return {"leagues": len(windows), "models": len(keys),
+            "skipped_stats": [st for st in SNAPSHOT_STATS if st not in stats],
+            "errors": errors, "last_error": last_error,
+            "ms": round((time.perf_counter() - t0) * 1000.0, 1), "finished_at": time.time()}
+
+# Выключен по умолчанию: каждый прогон — лиги × статы × half-life × 2 окна фитов
+# в том же пуле, что и запросы. Включается BETMAKER_SNAPSHOT_INTERVAL_SEC > 0;
+# без него снимки пишут фиты на пути запроса и `python -m model_snapshots rebuild`.
+SNAPSHOT_SCHEDULER = model_snapshots.SnapshotScheduler(
+    refit_snapshots, interval=float(os.environ.get("BETMAKER_SNAPSHOT_INTERVAL_SEC", "0")),
+)
 
 
 from sqlalchemy import func
@@ -966,6 +668,58 @@ from sqlalchemy import func
 def api_diag_routes():
     return [r.path for r in app.router.routes]
 
+@app.get("/api/diag/db")
+def api_diag_db():
+    return db.diag()
+
+@app.get("/api/diag/odds-consensus")
+def api_diag_odds_consensus():
+    with engine.begin() as conn:
+        return odds_consensus.status(conn)
+
+@app.get("/api/diag/response-cache")
+def api_diag_response_cache():
+    return RESPONSE_CACHE.stats()
+
+@app.get("/api/diag/coalesce")
+def api_diag_coalesce():
+    return coalesce.stats()
+
+@app.get("/api/diag/indexes")
+def api_diag_indexes():
+    with engine.connect() as conn:
+        return {"indexes": db_indexes.report(conn), "plans": db_indexes.explain(conn)}
+
+@app.get("/api/diag/data-version")
+def api_diag_data_version():
+    return DATA_VERSION.stats()
+
+@app.get("/api/diag/refdata")
+def api_diag_refdata():
+    return REFDATA.stats()
+
+@app.get("/api/diag/model-cache")
+def api_diag_model_cache():
+    return MODEL_CACHE.stats()
+
+@app.get("/api/diag/fit-pool")
+def api_diag_fit_pool():
+    return FIT_POOL.stats()
+
+@app.get("/api/diag/model-snapshots")
+def api_diag_model_snapshots():
+    with engine.connect() as conn:
+        return {"scheduler": SNAPSHOT_SCHEDULER.stats(), "table": model_snapshots.status(conn)}
+
+@app.get("/api/diag/forecast")
+def api_diag_forecast():
+    return forecast.FRAMES.stats()
+
+@app.get("/api/diag/league-moments")
+def api_diag_league_moments():
+    with engine.connect() as conn:
+        return {"reader": league_moments.MOMENTS.stats(), "table": league_moments.status(conn)}
+
 @app.get("/api/diag/matches-columns")
 def api_diag_matches_columns():
     return {"matches_columns": list(Matches.c.keys())}
@@ -0,0 +1 @@
+# bench — замеры производительности (запуск: python -m bench.<module>)
@@ -0,0 +1,147 @@
+# bench/endpoints.py — латентность / пропускная способность / память эндпоинтов
+#
+#   python -m bench.gen_db --out bench.sqlite3 --indexes
+#   python -m bench.endpoints --db bench.sqlite3 --requests 60 --concurrency 8 [--cold]
+#
+# Приложение вызывается в процессе через ASGI (httpx.ASGITransport), без сети.
+# Параметры запросов крутятся по командам лиги, так что первые запросы — промахи
+# кэшей, дальше — попадания (как у живого дашборда). --cold сбрасывает кэш ответов
+# и моделей перед каждым запросом — замер пути с SQL и моделью из model_snapshots
+# (или фитом, если снимка для ключа нет) — как после рестарта.
+# Пиковая память — tracemalloc за отдельный последовательный проход; фиты в пуле
+# процессов (BETMAKER_FIT_WORKERS>0) в неё не попадают.
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+
+def _scenarios(league_id: int, teams: List[int], seasons: List[str]) -> Dict[str, Callable[[int], str]]:
+    cur = seasons[0]
+    two = ",".join(seasons[:2])
+    n = len(teams)
+
+    def pair(i):
+        h, a = teams[i % n], teams[(i * 7 + 1) % n]
+        return (h, a) if a != h else (h, teams[(i + 1) % n])
+
+    return {
+        "timeseries":        lambda i: f"/api/timeseries?league_id={league_id}&team_ids={pair(i)[0]},{pair(i)[1]}&seasons={two}",
+        "timeseries_shots":  lambda i: f"/api/timeseries_shots?league_id={league_id}&team_ids={pair(i)[0]}&seasons={two}",
+        "timeseries/multi":  lambda i: f"/api/timeseries/multi?league_id={league_id}&team_ids={pair(i)[0]}&seasons={two}"
+                                       f"&stats=goals,corners,cards,shots,sot",
+        "superprog":         lambda i: f"/api/superprog?league_id={league_id}&team_id={pair(i)[0]}&seasons={cur}"
+                                       f"&opponent_id={pair(i)[1]}&ha_mode=home",
+        "superprog corners": lambda i: f"/api/superprog?league_id={league_id}&team_id={pair(i)[0]}&seasons={cur}"
+                                       f"&stat_type=corners",
+        "handicaps":         lambda i: f"/api/handicaps?league_id={league_id}&team_id={pair(i)[0]}&seasons={cur}"
+                                       f"&opponent_id={pair(i)[1]}",
+        "league_matrix":     lambda i: f"/api/league_matrix?league_id={league_id}&seasons={cur}",
+        "h2h_odds":          lambda i: f"/api/h2h_odds?league_id={league_id}&home_team_id={pair(i)[0]}"
+                                       f"&away_team_id={pair(i)[1]}&include_open=true",
+        "h2h_odds ladder":   lambda i: f"/api/h2h_odds?league_id={league_id}&home_team_id={pair(i)[0]}"
+                                       f"&away_team_id={pair(i)[1]}&orientation=both&lines=1.5,2.5,3.5,4.5",
+    }
+
+
+def _pct(xs: List[float], q: float) -> float:
+    xs = sorted(xs)
+    if not xs:
+        return 0.0
+    k = (len(xs) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+async def _run(app, make_url, n: int, concurrency: int, cold: Callable[[], None] | None):
+    import httpx
+    sem = asyncio.Semaphore(concurrency)
+    lat: List[float] = []
+    sizes: List[int] = []
+    errors = 0
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one(i):
+            nonlocal errors
+            async with sem:
+                if cold is not None:
+                    cold()
+                t0 = time.perf_counter()
+                r = await client.get(make_url(i))
+                lat.append(time.perf_counter() - t0)
+                sizes.append(len(r.content))
+                if r.status_code != 200:
+                    errors += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n)))
+        wall = time.perf_counter() - t0
+    return lat, sizes, errors, wall
+
+
+async def _peak_kb(app, make_url, n: int, cold: Callable[[], None] | None) -> float:
+    import httpx
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        for i in range(n):
+            if cold is not None:
+                cold()
+            await client.get(make_url(i))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return (peak - base) / 1024.0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="endpoint latency / throughput / memory")
+    ap.add_argument("--db", required=True, help="путь к sqlite (см. bench.gen_db)")
+    ap.add_argument("--league", type=int, default=1)
+    ap.add_argument("--requests", type=int, default=60)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--mem-requests", type=int, default=5)
+    ap.add_argument("--only", default="", help="comma-separated scenario names")
+    ap.add_argument("--cold", action="store_true", help="сбрасывать кэши перед каждым запросом")
+    args = ap.parse_args(argv)
+
+    # db отражает схему при импорте — URL задаём до импорта приложения
+    os.environ["BETMAKER_DB_URL"] = "sqlite:///" + os.path.abspath(args.db)
+    from sqlalchemy import select
+    import app as A
+    from model_cache import MODEL_CACHE
+
+    with A.engine.connect() as conn:
+        ref = A.REFDATA.get(conn, A.meta)
+        teams = sorted({int(r[0]) for r in conn.execute(
+            select(A.Matches.c.home_team_id).where(A.Matches.c.league_id == args.league)).all()})
+    seasons = A._sort_labels_desc(list(ref.league_seasons(args.league).values()))
+    if not teams or not seasons:
+        raise SystemExit(f"league {args.league}: no matches")
+
+    def cold():
+        A.RESPONSE_CACHE.clear()
+        MODEL_CACHE.clear()
+
+    scen = _scenarios(args.league, teams, seasons)
+    only = [s.strip() for s in args.only.split(",") if s.strip()]
+    print(f"db={args.db} league={args.league} teams={len(teams)} seasons={seasons[:2]} "
+          f"requests={args.requests} concurrency={args.concurrency} cold={args.cold}")
+    print(f"{'endpoint':>18} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'req/s':>8} {'KB/resp':>8}"
+          f" {'peak KB':>8} {'errors':>6}")
+    for name, make_url in scen.items():
+        if only and name not in only:
+            continue
+        lat, sizes, errors, wall = asyncio.run(
+            _run(A.app, make_url, args.requests, args.concurrency, cold if args.cold else None))
+        peak = asyncio.run(_peak_kb(A.app, make_url, args.mem_requests, cold if args.cold else None))
+        print(f"{name:>18} {_pct(lat, 0.5) * 1e3:>8.2f} {_pct(lat, 0.95) * 1e3:>8.2f} {max(lat) * 1e3:>8.2f}"
+              f" {len(lat) / wall:>8.1f} {sum(sizes) / len(sizes) / 1024:>8.1f} {peak:>8.0f} {errors:>6}")
+    A.FIT_POOL.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# bench/fit_bench.py — время фита Dixon–Coles: старый поматчевый цикл vs dc_engine
+#
+#   python -m bench.fit_bench --teams 20 --seasons 1,3,5,10 --repeat 5
+from __future__ import annotations
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+from math import exp
+
+import numpy as np
+
+from dc_engine import fit_matches
+
+
+def _synthetic_matches(n_teams: int, n_seasons: int, seed: int = 1):
+    rnd = random.Random(seed)
+    rng = np.random.default_rng(seed)
+    atk = [rnd.gauss(0, 0.25) for _ in range(n_teams)]
+    dfn = [rnd.gauss(0, 0.25) for _ in range(n_teams)]
+    matches = []
+    for s in range(n_seasons):
+        d0 = date(2015 + s, 8, 1)
+        pairs = [(h, a) for h in range(n_teams) for a in range(n_teams) if h != a]
+        rnd.shuffle(pairs)
+        for k, (h, a) in enumerate(pairs):
+            lh = exp(0.3 + atk[h] - dfn[a] + 0.2)
+            la = exp(0.3 + atk[a] - dfn[h])
+            matches.append({
+                'date': (d0 + timedelta(days=k // (n_teams // 2) * 3)).isoformat(),
+                'home_team_id': h + 1, 'away_team_id': a + 1,
+                'HVAL': int(rng.poisson(lh)),
+                'AVAL': int(rng.poisson(la)),
+            })
+    return matches, set(range(1, n_teams + 1))
+
+
+def _legacy_fit(matches, team_ids_set, half_life_days, max_iter=60, tol=1e-6):
+    """Копия исходного цикла из handicaps.py — эталон для сравнения."""
+    def _ts(dt):
+        try:
+            return datetime.fromisoformat(dt).timestamp()
+        except ValueError:
+            return 0.0
+
+    teams = sorted(team_ids_set)
+    idx = {tid: i for i, tid in enumerate(teams)}
+    nT = len(teams)
+    atk = [0.0]*nT; dfn = [0.0]*nT
+    home_adv = 0.20
+
+    def _normalize():
+        a_mean = sum(atk)/nT; d_mean = sum(dfn)/nT
+        for i in range(nT):
+            atk[i] -= a_mean; dfn[i] -= d_mean
+
+    tmax = max((_ts(m['date']) for m in matches), default=0.0)
+    for _ in range(max_iter):
+        _normalize()
+        g_atk = [0.0]*nT; g_dfn = [0.0]*nT; g_h = 0.0
+        h_atk = [1e-6]*nT; h_dfn = [1e-6]*nT; h_h = 1e-6
+        for m in matches:
+            i = idx[m['home_team_id']]; j = idx[m['away_team_id']]
+            hv = m['HVAL']; av = m['AVAL']
+            w = 2 ** (-max(0.0, (tmax - _ts(m['date']))/86400.0) / half_life_days)
+            lam_h = exp(atk[i] - dfn[j] + home_adv)
+            lam_a = exp(atk[j] - dfn[i])
+            g_atk[i] += w*(hv - lam_h); g_dfn[j] += w*(-hv + lam_h)
+            g_atk[j] += w*(av - lam_a); g_dfn[i] += w*(-av + lam_a)
+            g_h += w*(hv - lam_h)
+            h_atk[i] += w*lam_h; h_dfn[j] += w*lam_h
+            h_atk[j] += w*lam_a; h_dfn[i] += w*lam_a
+            h_h += w*lam_h
+        step = 0.25
+        for i in range(nT):
+            atk[i] += step*g_atk[i]/h_atk[i]
+            dfn[i] += step*g_dfn[i]/h_dfn[i]
+        home_adv += step*g_h/h_h
+        if max(max(abs(step*g_atk[i]/h_atk[i]) for i in range(nT)),
+               max(abs(step*g_dfn[i]/h_dfn[i]) for i in range(nT)),
+               abs(step*g_h/h_h)) < tol:
+            break
+    _normalize()
+    return teams, atk, dfn, home_adv
+
+
+def _best_ms(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000.0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Dixon–Coles fit: legacy loop vs dc_engine")
+    ap.add_argument("--teams", type=int, default=20)
+    ap.add_argument("--seasons", default="1,3,5,10")
+    ap.add_argument("--half-life", type=float, default=180.0)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    print(f"{'seasons':>7} {'matches':>8} {'legacy ms':>10} {'numpy ms':>9} {'speedup':>8} {'max |d|':>9}"
+          f" {'iters':>6} {'warm ms':>8} {'warm it':>8}")
+    for n_seasons in [int(x) for x in args.seasons.split(",") if x.strip()]:
+        matches, teams = _synthetic_matches(args.teams, n_seasons)
+        ref = _legacy_fit(matches, teams, args.half_life)
+        new = fit_matches(matches, teams, args.half_life)
+        diff = max(
+            max(abs(x - y) for x, y in zip(ref[1], new[1])),
+            max(abs(x - y) for x, y in zip(ref[2], new[2])),
+            abs(ref[3] - new[3]),
+        )
+        t_old = _best_ms(lambda: _legacy_fit(matches, teams, args.half_life), args.repeat)
+        t_new = _best_ms(lambda: fit_matches(matches, teams, args.half_life), args.repeat)
+
+        # тёплый рефит: модель без последнего тура -> добавили тур
+        prev = fit_matches(matches[:-args.teams // 2], teams, args.half_life)
+        warm = fit_matches(matches, teams, args.half_life, init=prev[:4])
+        t_warm = _best_ms(lambda: fit_matches(matches, teams, args.half_life, init=prev[:4]), args.repeat)
+        print(f"{n_seasons:>7} {len(matches):>8} {t_old:>10.1f} {t_new:>9.2f} "
+              f"{t_old / max(t_new, 1e-9):>7.1f}x {diff:>9.1e}"
+              f" {new[4]['iterations']:>6} {t_warm:>8.2f} {warm[4]['iterations']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# bench/gen_db.py — синтетическая betmaker.sqlite3 для замеров
+#
+#   python -m bench.gen_db --out bench.sqlite3 --leagues 4 --seasons 6 --teams 20 \
+#       --bookmakers 4 --lines 1.5,2.5,3.5,4.5 [--indexes] [--consensus]
+#
+# Лиги × сезоны × команды, двухкруговой календарь (тур в неделю, август–май),
+# счёт и статы (удары, в створ, угловые, фолы, карточки) из пуассоновской модели
+# с силами команд, дрейфующими от сезона к сезону. odds_1x2 / odds_ou — от каждого
+# букмекера открытие (is_closing=0) и закрытие (is_closing=1) с маржой и шумом.
+from __future__ import annotations
+import argparse
+import os
+import sqlite3
+import time
+from datetime import date, timedelta
+from math import exp
+
+import numpy as np
+
+COUNTRIES = ["england", "spain", "italy", "germany", "france", "netherlands", "portugal",
+             "belgium", "turkey", "scotland", "austria", "greece"]
+
+SCHEMA = """
+CREATE TABLE leagues (id INTEGER PRIMARY KEY, country TEXT, name TEXT);
+CREATE TABLE seasons (id INTEGER PRIMARY KEY, league_id INTEGER, label TEXT, is_current INTEGER);
+CREATE TABLE teams   (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE matches (
+    id INTEGER PRIMARY KEY, league_id INTEGER, season_id INTEGER, date TEXT,
+    home_team_id INTEGER, away_team_id INTEGER,
+    FTHG INTEGER, FTAG INTEGER, HTHG INTEGER, HTAG INTEGER,
+    HS INTEGER, AS_ INTEGER, HST INTEGER, AST INTEGER, HC INTEGER, AC INTEGER,
+    HF INTEGER, AF INTEGER, HY INTEGER, AY INTEGER, HR INTEGER, AR INTEGER
+);
+CREATE TABLE odds_1x2 (
+    id INTEGER PRIMARY KEY, match_id INTEGER, bookmaker TEXT, is_closing INTEGER,
+    home REAL, draw REAL, away REAL
+);
+CREATE TABLE odds_ou (
+    id INTEGER PRIMARY KEY, match_id INTEGER, bookmaker TEXT, is_closing INTEGER,
+    line REAL, over REAL, under REAL
+);
+"""
+
+
+def _rounds(n: int):
+    """Круговой календарь (метод кругового сдвига): туры первого круга, пары индексов."""
+    ids = list(range(n)) + ([None] if n % 2 else [])
+    m = len(ids)
+    out = []
+    for r in range(m - 1):
+        pairs = []
+        for k in range(m // 2):
+            a, b = ids[k], ids[m - 1 - k]
+            if a is not None and b is not None:
+                pairs.append((a, b) if (r + k) % 2 == 0 else (b, a))
+        out.append(pairs)
+        ids = [ids[0]] + [ids[-1]] + ids[1:-1]
+    return out
+
+
+def _poisson_cdf(lam: float, k_max: int) -> np.ndarray:
+    k = np.arange(k_max + 1)
+    logp = -lam + k * np.log(lam) - np.cumsum(np.log(np.maximum(k, 1)))
+    return np.cumsum(np.exp(logp))
+
+
+def _odds(p: np.ndarray, margin: float, rng, noise: float) -> np.ndarray:
+    q = p * (1.0 + margin) * np.exp(rng.normal(0.0, noise, size=p.shape))
+    return np.round(1.0 / np.clip(q, 1e-3, 0.99), 2)
+
+
+def generate(path: str, leagues: int, seasons: int, teams: int, bookmakers: int,
+             lines: list[float], first_year: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    con = sqlite3.connect(path)
+    con.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + SCHEMA)
+
+    books = [f"bk{i + 1}" for i in range(bookmakers)]
+    mrows, o1rows, ourows = [], [], []
+    tid = sid = mid = 1
+    t0 = time.perf_counter()
+    for lg in range(1, leagues + 1):
+        country = COUNTRIES[(lg - 1) % len(COUNTRIES)]
+        con.execute("INSERT INTO leagues VALUES (?,?,?)", (lg, country, f"{country.title()} L{lg}"))
+        team_ids = list(range(tid, tid + teams))
+        con.executemany("INSERT INTO teams VALUES (?,?)", [(t, f"Team {t}") for t in team_ids])
+        tid += teams
+        atk = rng.normal(0.0, 0.25, teams)
+        dfn = rng.normal(0.0, 0.25, teams)
+        base, home_adv = np.log(1.35), 0.22
+
+        for y in range(first_year, first_year + seasons):
+            con.execute("INSERT INTO seasons VALUES (?,?,?,?)",
+                        (sid, lg, f"{y}_{y + 1}", int(y == first_year + seasons - 1)))
+            first = _rounds(teams)
+            schedule = first + [[(a, h) for h, a in rnd] for rnd in first]
+            d0 = date(y, 8, 8)
+            for r, pairs in enumerate(schedule):
+                day = (d0 + timedelta(days=7 * r)).isoformat()
+                for h, a in pairs:
+                    lh = exp(base + atk[h] - dfn[a] + home_adv)
+                    la = exp(base + atk[a] - dfn[h])
+                    fh, fa = int(rng.poisson(lh)), int(rng.poisson(la))
+                    hs = int(rng.poisson(12.5 * exp(0.6 * (atk[h] - dfn[a]) + 0.1)))
+                    as_ = int(rng.poisson(12.5 * exp(0.6 * (atk[a] - dfn[h]) - 0.1)))
+                    mrows.append((
+                        mid, lg, sid, day, team_ids[h], team_ids[a], fh, fa,
+                        int(rng.binomial(fh, 0.45)), int(rng.binomial(fa, 0.45)),
+                        hs, as_, int(rng.binomial(hs, 0.35)), int(rng.binomial(as_, 0.35)),
+                        int(rng.poisson(5.4 * exp(0.4 * (atk[h] - dfn[a])))),
+                        int(rng.poisson(4.6 * exp(0.4 * (atk[a] - dfn[h])))),
+                        int(rng.poisson(11.0)), int(rng.poisson(11.5)),
+                        int(rng.poisson(1.7)), int(rng.poisson(1.9)),
+                        int(rng.poisson(0.06)), int(rng.poisson(0.08)),
+                    ))
+
+                    # вероятности исходов и тоталов из той же модели
+                    ph = np.exp(-lh) * lh ** np.arange(11) / np.cumprod(np.r_[1, np.arange(1, 11)])
+                    pa = np.exp(-la) * la ** np.arange(11) / np.cumprod(np.r_[1, np.arange(1, 11)])
+                    grid = np.outer(ph, pa)
+                    p1x2 = np.array([np.tril(grid, -1).sum(), np.trace(grid), np.triu(grid, 1).sum()])
+                    p1x2 /= p1x2.sum()
+                    cdf = _poisson_cdf(lh + la, 12)
+                    for bk in books:
+                        margin = rng.uniform(0.04, 0.08)
+                        for closing in (0, 1):
+                            noise = 0.02 if closing else 0.05
+                            o = _odds(p1x2, margin, rng, noise)
+                            o1rows.append((mid, bk, closing, float(o[0]), float(o[1]), float(o[2])))
+                            for ln in lines:
+                                p_under = float(cdf[int(ln)])
+                                ou = _odds(np.array([1.0 - p_under, p_under]), margin, rng, noise)
+                                ourows.append((mid, bk, closing, ln, float(ou[0]), float(ou[1])))
+                    mid += 1
+            sid += 1
+            # сезон закончился — силы немного дрейфуют
+            atk = 0.8 * atk + rng.normal(0.0, 0.12, teams)
+            dfn = 0.8 * dfn + rng.normal(0.0, 0.12, teams)
+
+    con.executemany(f"INSERT INTO matches VALUES ({','.join('?' * 22)})", mrows)
+    con.executemany("INSERT INTO odds_1x2 (match_id, bookmaker, is_closing, home, draw, away)"
+                    " VALUES (?,?,?,?,?,?)", o1rows)
+    con.executemany("INSERT INTO odds_ou (match_id, bookmaker, is_closing, line, over, under)"
+                    " VALUES (?,?,?,?,?,?)", ourows)
+    con.commit()
+    con.execute("PRAGMA journal_mode=WAL")
+    con.close()
+    return {"matches": len(mrows), "odds_1x2": len(o1rows), "odds_ou": len(ourows),
+            "teams": tid - 1, "seasons": sid - 1,
+            "seconds": round(time.perf_counter() - t0, 2),
+            "size_mb": round(os.path.getsize(path) / 2 ** 20, 1)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="synthetic betmaker.sqlite3 generator")
+    ap.add_argument("--out", default="betmaker.sqlite3")
+    ap.add_argument("--leagues", type=int, default=4)
+    ap.add_argument("--seasons", type=int, default=6)
+    ap.add_argument("--teams", type=int, default=20)
+    ap.add_argument("--bookmakers", type=int, default=4)
+    ap.add_argument("--lines", default="1.5,2.5,3.5,4.5")
+    ap.add_argument("--first-year", type=int, default=2018)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--indexes", action="store_true", help="создать индексы из db_indexes")
+    ap.add_argument("--consensus", action="store_true", help="построить odds_consensus")
+    args = ap.parse_args(argv)
+
+    lines = [float(x) for x in args.lines.split(",") if x.strip()]
+    print(generate(args.out, args.leagues, args.seasons, args.teams, args.bookmakers, lines,
+                   args.first_year, args.seed))
+
+    if args.indexes or args.consensus:
+        # db отражает схему при импорте — только после того, как файл готов
+        os.environ["BETMAKER_DB_URL"] = "sqlite:///" + os.path.abspath(args.out)
+        from db import engine
+        with engine.begin() as conn:
+            if args.indexes:
+                import db_indexes
+                print("indexes:", db_indexes.create_missing(conn))
+            if args.consensus:
+                import odds_consensus
+                print("consensus:", odds_consensus.rebuild(conn))
+
+
+if __name__ == "__main__":
+    main()
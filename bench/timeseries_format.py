@@ -0,0 +1,50 @@
+# bench/timeseries_format.py — /api/timeseries*: размер и время ответа rows vs columnar
+#
+#   BETMAKER_DB_URL=sqlite:///bm.sqlite3 python -m bench.timeseries_format \
+#       --league 1 --teams 1,2 --seasons 2018_2019,2019_2020,2020_2021 --repeat 10
+from __future__ import annotations
+import argparse
+import time
+
+from fastapi.testclient import TestClient
+
+from app import app
+
+
+def _best(client: TestClient, url: str, repeat: int):
+    best = float('inf')
+    size = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        r = client.get(url)
+        best = min(best, time.perf_counter() - t0)
+        r.raise_for_status()
+        size = len(r.content)
+    return best * 1000.0, size
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="timeseries: rows vs columnar")
+    ap.add_argument("--league", type=int, required=True)
+    ap.add_argument("--teams", required=True, help="comma-separated team ids")
+    ap.add_argument("--seasons", required=True, help="comma-separated season labels")
+    ap.add_argument("--stats", default="goals,corners,cards,shots,sot")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args(argv)
+
+    client = TestClient(app)
+    base = f"league_id={args.league}&team_ids={args.teams}&seasons={args.seasons}"
+    urls = [(st, f"/api/timeseries{'' if st == 'goals' else '_' + st}?{base}")
+            for st in args.stats.split(",") if st.strip()]
+    urls.append(("multi", f"/api/timeseries/multi?{base}&stats={args.stats}"))
+
+    print(f"{'endpoint':>8} {'rows ms':>8} {'rows KB':>8} {'col ms':>7} {'col KB':>7} {'size x':>7} {'speedup':>8}")
+    for name, url in urls:
+        t_rows, b_rows = _best(client, url, args.repeat)
+        t_col, b_col = _best(client, url + "&format=columnar", args.repeat)
+        print(f"{name:>8} {t_rows:>8.1f} {b_rows / 1024:>8.1f} {t_col:>7.1f} {b_col / 1024:>7.1f}"
+              f" {b_rows / max(b_col, 1):>6.1f}x {t_rows / max(t_col, 1e-9):>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
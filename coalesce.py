@@ -0,0 +1,69 @@
+# coalesce.py — объединение одинаковых одновременных вычислений (single-flight)
+#
+# Пока вычисление по ключу идёт, все новые вызовы с тем же ключом ждут его
+# результат (или исключение), а не запускают своё. Ключ задаёт вызывающий:
+# для ответов API — (path, нормализованный query, версия данных), для фитов —
+# ключ модели. Работает в пределах одного event loop процесса.
+from __future__ import annotations
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+import asyncio
+
+
+class Coalescer:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.max_waiters = 0
+        self._waiters: Dict[Hashable, int] = {}
+        self._by_label: Dict[str, List[int]] = {}   # label -> [leaders, coalesced]
+        REGISTRY[name] = self
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        self._waiters.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]], label: str = "-") -> Any:
+        """
+        Результат factory() для key. Задача общая для всех ждущих, поэтому отмена
+        одного вызова (клиент ушёл) её не прерывает.
+        """
+        counts = self._by_label.setdefault(label, [0, 0])
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            self._waiters[key] = 1
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+            self.leaders += 1
+            counts[0] += 1
+        else:
+            self.coalesced += 1
+            counts[1] += 1
+            n = self._waiters[key] = self._waiters.get(key, 1) + 1
+            self.max_waiters = max(self.max_waiters, n)
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.leaders + self.coalesced
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": (self.coalesced / total) if total else 0.0,
+            "errors": self.errors,
+            "inflight": len(self._inflight),
+            "max_waiters": self.max_waiters,
+            "by_label": {lbl: {"leaders": c[0], "coalesced": c[1]}
+                         for lbl, c in sorted(self._by_label.items())},
+        }
+
+
+REGISTRY: Dict[str, Coalescer] = {}
+
+
+def stats() -> Dict[str, Any]:
+    return {name: c.stats() for name, c in REGISTRY.items()}
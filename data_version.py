@@ -0,0 +1,188 @@
+# data_version.py — дешёвое определение «изменились ли данные» для всех кэшей
+#
+# SQLite: отдельное (не из пула) соединение-проба читает PRAGMA data_version —
+# счётчик меняется, когда любое другое соединение/процесс закоммитил запись
+# (ingest, UPDATE на месте, CLI rebuild/refresh). Любая такая смена увеличивает
+# версии всех таблиц: какие строки правили, по счётчику не видно.
+# Свои записи приложения (таблицы кэшей: model_snapshots, league_moments) идут
+# через own_write() — то есть через саму пробу; её коммиты её же data_version не
+# меняют, поэтому кэши от них не сбрасываются.
+# Другие СУБД: отпечатки таблиц (count, max id) — видят вставки и удаления, но не
+# UPDATE на месте. Проверка — не чаще раза в interval.
+# content_aggregates + content_digest — дешёвый SQL-отпечаток содержимого выборки
+# (окно сезонов лиги, сезон, таблицы коэффициентов); для кэшей, которым нужна
+# версия своих данных.
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+import hashlib
+import os
+import threading
+import time
+
+from sqlalchemy import Column, create_engine, select, func, literal
+from sqlalchemy.pool import StaticPool
+
+from db import DB_URL, IS_SQLITE, meta
+
+# таблицы, за которыми следим (служебные таблицы кэшей сюда не входят)
+TRACKED = ("leagues", "seasons", "teams", "matches", "odds_1x2", "odds_ou")
+
+
+class DataVersion:
+    def __init__(self, check_interval: float = 1.0, tables: Iterable[str] = TRACKED):
+        self.check_interval = float(check_interval)
+        self.tables = [meta.tables[name] for name in tables if name in meta.tables]
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._pragma: int | None = None
+        self._prints: Dict[str, Tuple] = {}
+        self._versions: Dict[str, int] = {t.name: 0 for t in self.tables}
+        self.generation = 0          # растёт при любой замеченной смене
+        self.checks = 0
+        self.rescans = 0
+        self.last_change: float | None = None
+        # своё соединение: счётчик data_version — на соединение, а пул раздаёт разные
+        self._probe = None
+        if IS_SQLITE:
+            self._probe = create_engine(
+                DB_URL, poolclass=StaticPool, connect_args={"check_same_thread": False}
+            ).connect()
+
+    # ---- внутреннее
+    def _fingerprints(self, conn) -> Dict[str, Tuple]:
+        parts = []
+        for t in self.tables:
+            parts.append(select(func.count()).select_from(t).scalar_subquery())
+            parts.append(select(func.max(t.c.id)).scalar_subquery() if "id" in t.c
+                         else select(func.count()).select_from(t).scalar_subquery())
+        row = conn.execute(select(*parts)).one() if parts else ()
+        return {t.name: (row[2 * i], row[2 * i + 1]) for i, t in enumerate(self.tables)}
+
+    def _pragma_version(self) -> int | None:
+        if self._probe is None:
+            return None
+        v = int(self._probe.exec_driver_sql("PRAGMA data_version").scalar())
+        self._probe.rollback()
+        return v
+
+    def _bump(self, names) -> None:
+        for name in names:
+            self._versions[name] += 1
+        self.generation += 1
+        self.last_change = time.time()
+
+    def _check(self) -> None:
+        self.checks += 1
+        if self._probe is not None:
+            pv = self._pragma_version()
+            if self._pragma is not None and pv != self._pragma:
+                self.rescans += 1
+                self._bump(self._versions)
+            self._pragma = pv
+            return
+
+        self.rescans += 1
+        from db import engine
+        with engine.connect() as conn:
+            prints = self._fingerprints(conn)
+        changed = [name for name, fp in prints.items() if self._prints.get(name) != fp]
+        if changed and self._prints:
+            self._bump(changed)
+        self._prints = prints
+
+    # ---- API
+    @property
+    def sees_updates(self) -> bool:
+        """Замечает ли проверка UPDATE на месте (только через PRAGMA data_version)."""
+        return self._probe is not None
+
+    def _ready(self) -> bool:
+        return self._pragma is not None if self._probe is not None else bool(self._prints)
+
+    def refresh(self, force: bool = False) -> None:
+        """
+        Проверка не чаще раза в interval. Если проба занята (идёт проверка в
+        другом потоке или own_write), без force не ждём — остаются текущие версии.
+        """
+        now = time.monotonic()
+        if not force and self._ready() and now - self._checked < self.check_interval:
+            return
+        if not self._lock.acquire(blocking=force or not self._ready()):
+            return
+        try:
+            if force or not self._ready() or now - self._checked >= self.check_interval:
+                self._checked = now
+                self._check()
+        finally:
+            self._lock.release()
+
+    @contextmanager
+    def own_write(self) -> Iterator[Any]:
+        """
+        Транзакция для записей самого приложения в таблицы кэшей. На SQLite — через
+        соединение-пробу: свой коммит не меняет её PRAGMA data_version, а чужие
+        коммиты (в том числе сделанные во время записи) остаются видны.
+        Держит пробу на время записи — писать коротко и не на пути запроса.
+        """
+        if self._probe is None:
+            from db import engine
+            with engine.begin() as conn:
+                yield conn
+            return
+        self.refresh()          # база для сравнения data_version — до своей записи
+        with self._lock:
+            try:
+                yield self._probe
+                self._probe.commit()
+            except BaseException:
+                self._probe.rollback()
+                raise
+
+    def table(self, name: str) -> int:
+        """Версия таблицы (счётчик замеченных изменений)."""
+        self.refresh()
+        return self._versions.get(name, 0)
+
+    def stamp(self, *names: str) -> Tuple[int, ...]:
+        """Кортеж версий нескольких таблиц — готовый кусок ключа кэша."""
+        self.refresh()
+        return tuple(self._versions.get(n, 0) for n in names)
+
+    def stats(self) -> Dict[str, Any]:
+        self.refresh()
+        with self._lock:
+            return {
+                "backend": "sqlite_pragma" if self._probe is not None else "fingerprint",
+                "check_interval": self.check_interval,
+                "generation": self.generation,
+                "pragma_data_version": self._pragma,
+                "tables": {name: {"version": v, "fingerprint": list(self._prints.get(name, ()))}
+                           for name, v in self._versions.items()},
+                "checks": self.checks,
+                "rescans": self.rescans,
+                "last_change": self.last_change,
+            }
+
+
+def content_aggregates(pk: Column, columns: Sequence[Column]) -> List[Any]:
+    """
+    SQL-агрегаты отпечатка: count, max(pk) и по каждой числовой колонке sum(c) и
+    sum(pk*c) (NULL -> -1). Видят вставки, удаления и правки значений на месте;
+    pk — целочисленный первичный ключ. Годится и для GROUP BY.
+    """
+    aggs: List[Any] = [func.count(), func.max(pk)]
+    for c in columns:
+        v = func.coalesce(c, literal(-1))
+        aggs += [func.sum(v), func.sum(pk * v)]
+    return aggs
+
+
+def content_digest(values: Iterable[Any]) -> str:
+    """Короткий хэш строки агрегатов (или любого кортежа) — для ключей и мета-таблиц."""
+    h = hashlib.blake2b(digest_size=12)
+    h.update(repr(tuple(values)).encode())
+    return h.hexdigest()
+
+
+DATA_VERSION = DataVersion(check_interval=float(os.environ.get("BETMAKER_DATA_VERSION_CHECK_SEC", "1")))
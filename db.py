@@ -0,0 +1,143 @@
+# db.py — общий слой БД: один engine, одна рефлексия, разрешённые один раз колонки
+from __future__ import annotations
+from typing import Any, Dict, Tuple
+import os
+import time
+
+from sqlalchemy import create_engine, event, MetaData, Table, Column
+
+DB_URL = os.environ.get(
+    "BETMAKER_DB_URL",
+    "sqlite:///C:/Users/HomeComp/PycharmProjects/pythonProject/UKparserToBD/betmaker.sqlite3"
+)
+IS_SQLITE = DB_URL.startswith("sqlite")
+
+# ================= ENGINE =================
+POOL_SIZE = int(os.environ.get("BETMAKER_DB_POOL_SIZE", "8"))
+MAX_OVERFLOW = int(os.environ.get("BETMAKER_DB_MAX_OVERFLOW", "8"))
+
+# PRAGMA для SQLite: WAL (читатели не блокируют запись), mmap и кэш страниц
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("BETMAKER_SQLITE_JOURNAL", "WAL"),
+    "synchronous": "NORMAL",
+    "mmap_size": int(os.environ.get("BETMAKER_SQLITE_MMAP", str(256 * 1024 * 1024))),
+    "cache_size": int(os.environ.get("BETMAKER_SQLITE_CACHE_KB", str(64 * 1024))) * -1,   # <0 -> KiB
+    "temp_store": "MEMORY",
+}
+
+_t0 = time.perf_counter()
+
+_engine_kwargs: Dict[str, Any] = {"future": True, "pool_pre_ping": not IS_SQLITE}
+if not (IS_SQLITE and ":memory:" in DB_URL):
+    _engine_kwargs.update(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW)
+if IS_SQLITE:
+    _engine_kwargs["connect_args"] = {"check_same_thread": False}
+
+engine = create_engine(DB_URL, **_engine_kwargs)
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            try:
+                cur.execute(f"PRAGMA {name}={value}")
+            except Exception:
+                pass    # read-only файл и т.п. — работаем с настройками по умолчанию
+        cur.close()
+
+_t_engine = time.perf_counter()
+meta = MetaData()
+meta.reflect(bind=engine)
+_t_reflect = time.perf_counter()
+
+Leagues: Table = meta.tables["leagues"]
+Seasons: Table = meta.tables["seasons"]
+Teams:   Table = meta.tables["teams"]
+Matches: Table = meta.tables["matches"]
+Odds1x2: Table | None = meta.tables.get("odds_1x2")
+OddsOU:  Table | None = meta.tables.get("odds_ou")
+
+# =============== COLUMNS ===================
+def col(tbl: Table | None, *candidates: str) -> Column | None:
+    """Первая существующая колонка из кандидатов (или None)."""
+    if tbl is None:
+        return None
+    keys = set(tbl.c.keys())
+    for name in candidates:
+        if name in keys:
+            return tbl.c[name]
+    return None
+
+# stat_type -> (кандидаты home, кандидаты away); cards = жёлтые
+STAT_COLUMN_CANDIDATES: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "goals":   (("FTHG",), ("FTAG",)),
+    # в основной схеме away-колонка называется AS_ (с подчёркиванием!)
+    "shots":   (("HS", "HomeShots", "shots_home", "SH", "S_H"),
+                ("AS_", "AS", "AwayShots", "shots_away", "SA", "S_A")),
+    "sot":     (("HST", "HomeShotsOnTarget", "sot_home", "HSoT"),
+                ("AST", "AwayShotsOnTarget", "sot_away", "ASoT")),
+    "corners": (("HC", "HomeCorners", "corners_home"),
+                ("AC", "AwayCorners", "corners_away")),
+    "cards":   (("HY", "HomeYellows", "cards_home", "cards_y_home", "YH"),
+                ("AY", "AwayYellows", "cards_away", "cards_y_away", "YA")),
+}
+
+STAT_COLUMNS: Dict[str, Tuple[Column | None, Column | None]] = {
+    st: (col(Matches, *h), col(Matches, *a)) for st, (h, a) in STAT_COLUMN_CANDIDATES.items()
+}
+
+def stat_columns(stat_type: str) -> Tuple[Column | None, Column | None]:
+    """(home_col, away_col) для stat_type; (None, None), если статы нет в схеме."""
+    return STAT_COLUMNS.get((stat_type or "goals").lower(), (None, None))
+
+ODDS_1X2_COLUMNS: Dict[str, Column | None] = {
+    "bookmaker":  col(Odds1x2, "bookmaker", "bk", "bookie"),
+    "is_closing": col(Odds1x2, "is_closing", "closing", "isclose"),
+    "home":       col(Odds1x2, "home", "one", "H"),
+    "draw":       col(Odds1x2, "draw", "X", "D"),
+    "away":       col(Odds1x2, "away", "two", "A"),
+}
+ODDS_OU_COLUMNS: Dict[str, Column | None] = {
+    "bookmaker":  col(OddsOU, "bookmaker", "bk", "bookie"),
+    "is_closing": col(OddsOU, "is_closing", "closing", "isclose"),
+    "line":       col(OddsOU, "line", "total_line", "ou_line"),
+    "over":       col(OddsOU, "over", "o", "over_odds"),
+    "under":      col(OddsOU, "under", "u", "under_odds"),
+}
+
+STARTUP: Dict[str, Any] = {
+    "engine_ms": round((_t_engine - _t0) * 1000.0, 2),
+    "reflect_ms": round((_t_reflect - _t_engine) * 1000.0, 2),
+    "total_ms": round((time.perf_counter() - _t0) * 1000.0, 2),
+    "tables": sorted(meta.tables),
+}
+
+# =============== DIAG ======================
+def _sqlite_pragma_values() -> Dict[str, Any]:
+    out = {}
+    with engine.connect() as conn:
+        for name in SQLITE_PRAGMAS:
+            out[name] = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+    return out
+
+def pool_stats() -> Dict[str, Any]:
+    pool = engine.pool
+    out: Dict[str, Any] = {"class": type(pool).__name__, "status": pool.status()}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, name, None)
+        if callable(fn):
+            out[name] = fn()
+    return out
+
+def diag() -> Dict[str, Any]:
+    out: Dict[str, Any] = {
+        "dialect": engine.dialect.name,
+        "startup": STARTUP,
+        "pool": pool_stats(),
+        "stat_columns": {st: [c.name if c is not None else None for c in pair]
+                         for st, pair in STAT_COLUMNS.items()},
+    }
+    if IS_SQLITE:
+        out["pragmas"] = _sqlite_pragma_values()
+    return out
@@ -0,0 +1,187 @@
+# db_indexes.py — составные индексы под «горячие» запросы эндпоинтов
+#
+#   python -m db_indexes report     # каких индексов не хватает
+#   python -m db_indexes create     # создать недостающие (+ ANALYZE на SQLite)
+#   python -m db_indexes explain    # план каждого типового запроса; full scan помечается
+#
+# Набор индексов собран из реальных форм запросов: matches по (league_id, season_id)
+# с ORDER BY date, по парам команд (h2h, /api/teams), odds_* по match_id + is_closing/bookmaker.
+# Индекс считается найденным, если нужные колонки — префикс уже существующего индекса.
+from __future__ import annotations
+from typing import Any, Dict, List, NamedTuple, Tuple
+import argparse
+
+from sqlalchemy import Index, select, func, or_, and_, inspect
+
+from db import (engine, meta, IS_SQLITE, Seasons, Matches, Odds1x2, OddsOU,
+                ODDS_1X2_COLUMNS, ODDS_OU_COLUMNS, stat_columns)
+
+
+class IndexSpec(NamedTuple):
+    table: str
+    columns: Tuple[str, ...]
+    used_by: str
+
+    @property
+    def name(self) -> str:
+        return "ix_" + self.table + "_" + "_".join(c.lower() for c in self.columns)
+
+
+def _names(*cols) -> Tuple[str, ...]:
+    """Имена существующих колонок; всё после первой отсутствующей отбрасывается."""
+    out = []
+    for c in cols:
+        if c is None:
+            break
+        out.append(c.name)
+    return tuple(out)
+
+
+def index_specs() -> List[IndexSpec]:
+    specs = [
+        IndexSpec("seasons", ("league_id", "label"), "season ids by label"),
+        IndexSpec("matches", ("league_id", "season_id", "date"),
+                  "timeseries, superprog/handicaps fit, stat counts"),
+        IndexSpec("matches", ("league_id", "home_team_id", "away_team_id", "date"),
+                  "h2h_odds matches, /api/teams (home)"),
+        IndexSpec("matches", ("league_id", "away_team_id"), "/api/teams (away)"),
+    ]
+    if Odds1x2 is not None:
+        specs.append(IndexSpec("odds_1x2", ("match_id",) + _names(
+            ODDS_1X2_COLUMNS["is_closing"], ODDS_1X2_COLUMNS["bookmaker"]), "h2h_odds 1X2"))
+    if OddsOU is not None:
+        specs.append(IndexSpec("odds_ou", ("match_id",) + _names(
+            ODDS_OU_COLUMNS["is_closing"], ODDS_OU_COLUMNS["bookmaker"], ODDS_OU_COLUMNS["line"]),
+            "h2h_odds OU"))
+    return [s for s in specs if s.table in meta.tables
+            and all(c in meta.tables[s.table].c for c in s.columns)]
+
+
+def _existing(conn, table: str) -> List[Tuple[str, Tuple[str, ...]]]:
+    insp = inspect(conn)
+    out = [(ix["name"], tuple(ix["column_names"])) for ix in insp.get_indexes(table)]
+    for uc in insp.get_unique_constraints(table):
+        out.append((uc["name"] or "unique", tuple(uc["column_names"])))
+    pk = insp.get_pk_constraint(table).get("constrained_columns") or []
+    if pk:
+        out.append(("primary key", tuple(pk)))
+    return out
+
+
+def report(conn) -> List[Dict[str, Any]]:
+    out = []
+    for spec in index_specs():
+        found = None
+        for name, cols in _existing(conn, spec.table):
+            if cols[:len(spec.columns)] == spec.columns:
+                found = name
+                break
+        out.append({
+            "table": spec.table, "columns": list(spec.columns), "used_by": spec.used_by,
+            "name": spec.name, "present": found is not None, "existing": found,
+        })
+    return out
+
+
+def create_missing(conn) -> List[str]:
+    created = []
+    for item in report(conn):
+        if item["present"]:
+            continue
+        tbl = meta.tables[item["table"]]
+        Index(item["name"], *[tbl.c[c] for c in item["columns"]]).create(conn, checkfirst=True)
+        created.append(item["name"])
+    if created and IS_SQLITE:
+        conn.exec_driver_sql("ANALYZE")
+    return created
+
+
+# ---- типовые запросы эндпоинтов (формы — как в app / handicaps / h2h)
+def _sample(conn) -> Dict[str, Any] | None:
+    r = conn.execute(
+        select(Matches.c.id, Matches.c.league_id, Matches.c.season_id,
+               Matches.c.home_team_id, Matches.c.away_team_id).limit(1)
+    ).first()
+    return dict(r._mapping) if r is not None else None
+
+
+def endpoint_queries(s: Dict[str, Any]) -> Dict[str, Any]:
+    lid, sid, h, a = s["league_id"], s["season_id"], s["home_team_id"], s["away_team_id"]
+    mids = [s["id"]]
+    hg, ag = stat_columns("goals")
+    q: Dict[str, Any] = {
+        "seasons by label": select(Seasons.c.id)
+            .where(Seasons.c.league_id == lid, Seasons.c.label.in_(["x"])),
+        "timeseries": select(Matches.c.date, Matches.c.home_team_id, Matches.c.away_team_id)
+            .where(Matches.c.league_id == lid, Matches.c.season_id.in_([sid]))
+            .where(or_(Matches.c.home_team_id.in_([h]), Matches.c.away_team_id.in_([h])))
+            .order_by(Matches.c.date.asc()),
+        "fit matches (superprog/handicaps)": select(Matches.c.date, hg, ag)
+            .where(Matches.c.league_id == lid, Matches.c.season_id.in_([sid]))
+            .where(hg.isnot(None), ag.isnot(None))
+            .order_by(Matches.c.date.asc()),
+        "season stat counts": select(Matches.c.season_id, func.count())
+            .where(Matches.c.league_id == lid).group_by(Matches.c.season_id),
+        "teams (home)": select(Matches.c.home_team_id).where(Matches.c.league_id == lid),
+        "teams (away)": select(Matches.c.away_team_id).where(Matches.c.league_id == lid),
+        "h2h strict": select(Matches.c.id, Matches.c.date)
+            .where(Matches.c.league_id == lid, Matches.c.home_team_id == h, Matches.c.away_team_id == a)
+            .order_by(Matches.c.date.asc()),
+        "h2h both": select(Matches.c.id, Matches.c.date)
+            .where(Matches.c.league_id == lid)
+            .where(or_(and_(Matches.c.home_team_id == h, Matches.c.away_team_id == a),
+                       and_(Matches.c.home_team_id == a, Matches.c.away_team_id == h)))
+            .order_by(Matches.c.date.asc()),
+    }
+    for label, tbl, cols in (("h2h odds 1X2", Odds1x2, ODDS_1X2_COLUMNS),
+                             ("h2h odds OU", OddsOU, ODDS_OU_COLUMNS)):
+        if tbl is None:
+            continue
+        stmt = select(tbl.c.match_id).where(tbl.c.match_id.in_(mids))
+        if cols["is_closing"] is not None:
+            stmt = stmt.where(cols["is_closing"] == 1)
+        q[label] = stmt
+        if cols["bookmaker"] is not None:
+            q[label + " (bookmaker)"] = stmt.where(cols["bookmaker"] == "x")
+    return q
+
+
+def explain(conn) -> List[Dict[str, Any]]:
+    s = _sample(conn)
+    if s is None:
+        return []
+    prefix = "EXPLAIN QUERY PLAN " if IS_SQLITE else "EXPLAIN "
+    out = []
+    for label, stmt in endpoint_queries(s).items():
+        sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+        plan = [" ".join(str(v) for v in r[-1:]) if IS_SQLITE else " ".join(str(v) for v in r)
+                for r in conn.exec_driver_sql(prefix + sql).all()]
+        if IS_SQLITE:
+            full = any(p.startswith("SCAN ") and " USING " not in p for p in plan)
+        else:
+            full = any("Seq Scan" in p or "ALL" in p.split() for p in plan)
+        out.append({"query": label, "full_scan": full, "plan": plan})
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="db_indexes: composite indexes for endpoint queries")
+    ap.add_argument("command", choices=["report", "create", "explain"])
+    args = ap.parse_args(argv)
+    with engine.begin() as conn:
+        if args.command == "create":
+            print("created:", create_missing(conn) or "nothing")
+        if args.command in ("report", "create"):
+            for item in report(conn):
+                mark = "ok     " if item["present"] else "MISSING"
+                print(f"{mark} {item['table']}({', '.join(item['columns'])})"
+                      f"  [{item['existing'] or item['name']}]  — {item['used_by']}")
+        else:
+            for item in explain(conn):
+                print(("FULL SCAN " if item["full_scan"] else "ok        ") + item["query"])
+                for p in item["plan"]:
+                    print("    " + p)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# dc_engine.py — общий векторный движок Dixon–Coles для /api/superprog и /api/handicaps
+from __future__ import annotations
+from typing import Iterable, List, Tuple
+from datetime import datetime
+
+import numpy as np
+
+
+def _timestamp(dt) -> float:
+    if isinstance(dt, str):
+        try:
+            return datetime.fromisoformat(dt).timestamp()
+        except ValueError:
+            return 0.0
+    if isinstance(dt, datetime):
+        return dt.timestamp()
+    return 0.0
+
+
+def match_arrays(matches: List[dict], team_ids_set: Iterable[int],
+                 home_key: str = "HVAL", away_key: str = "AVAL"):
+    """
+    Переводит список матчей-словарей в массивы:
+    (teams, home_idx, away_idx, hv, av, ts). Матчи с пустой статой
+    или с командой вне team_ids_set отбрасываются.
+    """
+    teams = sorted(team_ids_set)
+    idx = {tid: i for i, tid in enumerate(teams)}
+
+    hi: List[int] = []; ai: List[int] = []
+    hv: List[float] = []; av: List[float] = []
+    ts: List[float] = []
+    for m in matches:
+        h = m[home_key]; a = m[away_key]
+        if h is None or a is None:
+            continue
+        i = idx.get(m['home_team_id']); j = idx.get(m['away_team_id'])
+        if i is None or j is None:
+            continue
+        hi.append(i); ai.append(j)
+        hv.append(h); av.append(a)
+        ts.append(_timestamp(m['date']))
+
+    return (
+        teams,
+        np.asarray(hi, dtype=np.intp),
+        np.asarray(ai, dtype=np.intp),
+        np.asarray(hv, dtype=np.float64),
+        np.asarray(av, dtype=np.float64),
+        np.asarray(ts, dtype=np.float64),
+    )
+
+
+def decay_weights(ts: np.ndarray, half_life_days: float) -> np.ndarray:
+    """Веса 2^(-age/half_life), возраст считается от самого свежего матча."""
+    if ts.size == 0 or half_life_days <= 0:
+        return np.ones(ts.size, dtype=np.float64)
+    age_days = np.maximum(0.0, (ts.max() - ts) / 86400.0)
+    return np.exp2(-age_days / half_life_days)
+
+
+def fit_arrays(n_teams: int, home_idx: np.ndarray, away_idx: np.ndarray,
+               hv: np.ndarray, av: np.ndarray, w: np.ndarray,
+               max_iter: int = 60, tol: float = 1e-6,
+               init: Tuple[np.ndarray, np.ndarray, float] | None = None,
+               ) -> Tuple[np.ndarray, np.ndarray, float, int, bool]:
+    """
+    Лог-пуассоновская регрессия «атака/оборона + home_adv».
+    Демпфированный диагональный Ньютон (шаг 0.25), как в исходном цикле, но
+    градиент и диагональ гессиана копятся через bincount.
+
+    init=(atk, dfn, home_adv) — тёплый старт: пробуем полный шаг и принимаем
+    его, только если невязка (центрированный шаг Ньютона g/h) в новой точке
+    конечна и упала хотя бы вдвое; иначе откат к принятой точке и шаг вдвое,
+    до 0.25 — дальше как у холодного фита.
+    Сходимость меряем по центрированным приращениям: общий сдвиг atk и dfn
+    на константу λ не меняет и всё равно снимается нормировкой.
+    Возвращает (atk, dfn, home_adv, n_iter, converged).
+    """
+    nT = n_teams
+    if init is not None:
+        atk = np.array(init[0], dtype=np.float64)
+        dfn = np.array(init[1], dtype=np.float64)
+        home_adv = float(init[2])
+        step = 1.0
+    else:
+        atk = np.zeros(nT)
+        dfn = np.zeros(nT)
+        home_adv = 0.20
+        step = 0.25
+
+    n_iter = 0
+    converged = False
+    base = None        # принятая точка: (atk, dfn, home_adv, невязка, направление Ньютона)
+    for n_iter in range(1, max_iter + 1):
+        if nT:
+            atk -= atk.mean()
+            dfn -= dfn.mean()
+
+        with np.errstate(over="ignore", invalid="ignore"):
+            lam_h = np.exp(atk[home_idx] - dfn[away_idx] + home_adv)
+            lam_a = np.exp(atk[away_idx] - dfn[home_idx])
+            rh = w * (hv - lam_h)
+            ra = w * (av - lam_a)
+            wlh = w * lam_h
+            wla = w * lam_a
+
+            g_atk = np.bincount(home_idx, rh, nT) + np.bincount(away_idx, ra, nT)
+            g_dfn = -np.bincount(away_idx, rh, nT) - np.bincount(home_idx, ra, nT)
+            g_h = float(rh.sum())
+
+            h_atk = 1e-6 + np.bincount(home_idx, wlh, nT) + np.bincount(away_idx, wla, nT)
+            h_dfn = 1e-6 + np.bincount(away_idx, wlh, nT) + np.bincount(home_idx, wla, nT)
+            h_h = 1e-6 + float(wlh.sum())
+
+            u_atk = g_atk / h_atk
+            u_dfn = g_dfn / h_dfn
+            u_h = g_h / h_h
+            res = abs(u_h)
+            if nT:
+                res = max(res,
+                          float(np.abs(u_atk - u_atk.mean()).max()),
+                          float(np.abs(u_dfn - u_dfn.mean()).max()))
+
+        if base is not None and step > 0.25 and not res <= 0.5 * base[3]:
+            # шаг не уменьшил невязку хотя бы вдвое (или переполнил exp) — откат и полшага
+            step = max(0.25, step * 0.5)
+            b_atk, b_dfn, b_h, _, (p_atk, p_dfn, p_h) = base
+            atk = b_atk + step * p_atk
+            dfn = b_dfn + step * p_dfn
+            home_adv = b_h + step * p_h
+            continue
+        if step > 0.25:
+            base = (atk.copy(), dfn.copy(), home_adv, res, (u_atk, u_dfn, u_h))
+
+        atk += step * u_atk
+        dfn += step * u_dfn
+        home_adv += step * u_h
+
+        if step * res < tol:
+            converged = True
+            break
+
+    if nT:
+        atk -= atk.mean()
+        dfn -= dfn.mean()
+    return atk, dfn, float(home_adv), n_iter, converged
+
+
+def fit_matches(matches: List[dict], team_ids_set: Iterable[int], half_life_days: float,
+                home_key: str = "HVAL", away_key: str = "AVAL",
+                max_iter: int = 60, tol: float = 1e-6, init=None):
+    """
+    Полный цикл: матчи -> массивы -> веса -> фит.
+    init=(teams, atk, dfn, home_adv) прошлой модели — тёплый старт; команды,
+    которых в ней не было, стартуют с нуля.
+    Если тёплый фит не сошёлся за max_iter — повтор с холодного старта.
+    Возвращает (teams, atk, dfn, home_adv, info), atk/dfn — списки float по teams,
+    info = {"iterations", "converged", "warm_start"[, "warm_fallback"]}.
+    """
+    teams, hi, ai, hv, av, ts = match_arrays(matches, team_ids_set, home_key, away_key)
+    w = decay_weights(ts, half_life_days)
+
+    seed = None
+    if init is not None and teams:
+        prev = {tid: i for i, tid in enumerate(init[0])}
+        atk0 = np.array([init[1][prev[t]] if t in prev else 0.0 for t in teams])
+        dfn0 = np.array([init[2][prev[t]] if t in prev else 0.0 for t in teams])
+        seed = (atk0, dfn0, init[3])
+
+    atk, dfn, home_adv, n_iter, converged = fit_arrays(
+        len(teams), hi, ai, hv, av, w, max_iter=max_iter, tol=tol, init=seed,
+    )
+    info = {"iterations": n_iter, "converged": converged, "warm_start": seed is not None}
+    if seed is not None and not converged:
+        # тёплый старт не сошёлся — холодный фит с нуля
+        atk, dfn, home_adv, n_cold, converged = fit_arrays(
+            len(teams), hi, ai, hv, av, w, max_iter=max_iter, tol=tol,
+        )
+        info = {"iterations": n_iter + n_cold, "converged": converged, "warm_start": False,
+                "warm_fallback": True}
+    return teams, atk.tolist(), dfn.tolist(), home_adv, info
@@ -0,0 +1,106 @@
+# fit_pool.py — тяжёлые фиты моделей вне event loop и вне GIL веб-процесса
+#
+# Фит (dc_engine.fit_matches) уходит в ограниченный ProcessPoolExecutor, роут его
+# только ждёт (await) — лёгкие /api/teams, /api/seasons не стоят в очереди за фитом.
+# Одинаковые одновременные фиты (тот же ключ модели) не дублируются: второй и
+# следующие запросы ждут уже запущенную задачу (FIT_FLIGHTS, см. coalesce).
+#   BETMAKER_FIT_WORKERS=0 — фит в потоке без отдельных процессов (отладка, тесты).
+# Воркеры стартуют через spawn и заново импортируют __main__: скрипт запуска сервера
+# должен прятать запуск под if __name__ == "__main__" (uvicorn app:app — уже так).
+# Иначе пул ломается сразу; после второго BrokenProcessPool подряд FitPool
+# переключается на потоки (fallback в stats) — медленнее, но фиты работают.
+from __future__ import annotations
+from typing import Any, Callable, Dict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import multiprocessing
+import os
+import threading
+
+from starlette.concurrency import run_in_threadpool
+
+from coalesce import Coalescer
+
+
+class FitPool:
+    def __init__(self, workers: int):
+        self.workers = max(0, int(workers))
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.running = 0
+        self.restarts = 0
+        self.fallback = False          # пул не поднимается — фиты в потоках
+        self.last_error: str | None = None
+
+    # ---- пул процессов (ленивый; spawn — воркеры не наследуют соединения и потоки сервера)
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _reset(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+                self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """fn(*args, **kwargs) в процессе пула; fn и аргументы должны пиклиться."""
+        with self._lock:
+            self.submitted += 1
+            self.running += 1
+        try:
+            if self.workers == 0 or self.fallback:
+                return await run_in_threadpool(fn, *args, **kwargs)
+            pool = self._pool()
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(pool, _call, fn, args, kwargs)
+            except BrokenProcessPool:
+                # упавший воркер ломает весь пул — пересоздаём и повторяем один раз
+                self._reset(pool)
+            pool = self._pool()
+            try:
+                return await loop.run_in_executor(pool, _call, fn, args, kwargs)
+            except BrokenProcessPool as e:
+                # второй раз подряд — воркеры не стартуют (см. заголовок), дальше потоки
+                self._reset(pool)
+                with self._lock:
+                    self.fallback = True
+                    self.last_error = repr(e)
+                return await run_in_threadpool(fn, *args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    def shutdown(self) -> None:
+        with self._lock:
+            ex, self._executor = self._executor, None
+        if ex is not None:
+            ex.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "mode": "process" if self.workers and not self.fallback else "thread",
+                "fallback": self.fallback,
+                "last_error": self.last_error,
+                "started": self._executor is not None,
+                "submitted": self.submitted,
+                "running": self.running,
+                "restarts": self.restarts,
+            }
+
+
+def _call(fn: Callable, args, kwargs):
+    return fn(*args, **kwargs)
+
+
+FIT_FLIGHTS = Coalescer("model_fit")
+FIT_POOL = FitPool(int(os.environ.get("BETMAKER_FIT_WORKERS", str(min(2, os.cpu_count() or 1)))))
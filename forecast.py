@@ -0,0 +1,432 @@
+# forecast.py — /api/forecast: прогнозы ▲ prog / ◆ kprog / ★ bprog на сервере
+#
+#   GET /api/forecast?league_id=1&team_ids=5,7&season=2024_2025&stat_type=goals&ha_mode=all&k=2&tol=0
+#
+# Раньше predictPatternK / kernelForecast / bayesPoissonForecast / bayesSkellamForecast
+# считались в браузере по всей мультисезонной истории команды (slice/map на каждое
+# окно при каждой перерисовке). Здесь — те же методы векторно:
+#   * ряды метрик (for/against/total, фора, роллинг-3, EWMA) — по массивам numpy;
+#   * окна истории — sliding_window_view (без копий), веса ядра — одним выражением;
+#     ▲ берёт только окна внутри одного сезона (как predictPatternK), ◆ — по всей
+#     истории подряд (как kernelForecast);
+#   * приоры Gamma для ★ — по лиге: моменты (n, Σx, Σx²) за O(1) из league_moments
+#     (for/against/тотал/фора); для роллинга и EWMA — по рядам команд лиги, один раз
+#     на (лига, стата) до смены данных (data_version).
+# Ответ — только значения прогнозов и веса, без истории.
+from __future__ import annotations
+from typing import Any, Dict, List, Tuple
+from collections import OrderedDict
+import os
+import threading
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from fastapi import APIRouter, Query, HTTPException
+from pydantic import BaseModel
+from sqlalchemy import select
+
+from db import engine, meta, Matches, stat_columns
+from refdata import REFDATA
+from data_version import DATA_VERSION
+from league_moments import MOMENTS, SERIES_KINDS, series_moments
+
+router = APIRouter()
+
+# =============== МЕТРИКИ ===============
+# stat_type -> префикс форных ключей (как в charts.js: goal_diff, corner_diff, ...)
+DIFF_PREFIX: Dict[str, str] = {
+    "goals": "goal", "corners": "corner", "cards": "cards", "shots": "shots", "sot": "sot",
+}
+
+# ядро ◆: (k, sigma при tol=0, sigma при tol>0) — для тоталов/форы и для for/against
+KERNEL_CFG: Dict[str, Tuple[Tuple[int, float, float], Tuple[int, float, float]]] = {
+    "goals":   ((3, 0.35, 1.20), (2, 0.30, 0.95)),
+    "corners": ((3, 0.55, 1.60), (2, 0.45, 1.30)),
+    "cards":   ((3, 0.40, 1.10), (2, 0.35, 0.95)),
+    "shots":   ((3, 1.8, 4.5),   (2, 1.4, 3.5)),
+    "sot":     ((3, 0.6, 1.6),   (2, 0.55, 1.4)),
+}
+KINDS = ("for", "against", "total", "diff", "roll3", "ewma", "against_neg")
+EWMA_ALPHA = 1.0 - 0.5 ** (1.0 / 5.0)      # HL = 5 матчей
+HA_MODES = ("all", "home", "away")
+
+
+def metric_keys(stat_type: str) -> Dict[str, str]:
+    """Ключи метрик дашборда для статы -> вид ряда (KINDS)."""
+    d = DIFF_PREFIX[stat_type]
+    return {
+        f"total_{stat_type}": "total",
+        f"{stat_type}_for": "for",
+        f"{stat_type}_against": "against",
+        f"{d}_diff": "diff",
+        f"{d}_diff_roll3": "roll3",
+        f"{d}_diff_ewma": "ewma",
+        f"{stat_type}_against_neg": "against_neg",
+    }
+
+
+def _roll3(x: np.ndarray) -> np.ndarray:
+    c = np.cumsum(x)
+    out = c.copy()
+    out[3:] -= c[:-3]
+    return out / np.minimum(np.arange(1, len(x) + 1), 3)
+
+
+def ewma(x: np.ndarray, alpha: float = EWMA_ALPHA, block: int = 256) -> np.ndarray:
+    """
+    e[0] = x[0], e[i] = α·x[i] + (1−α)·e[i−1]. Внутри блока — замкнутая форма через
+    cumsum (β^-i ограничена длиной блока), между блоками переносится последнее значение.
+    """
+    out = np.empty_like(x)
+    if not len(x):
+        return out
+    beta = 1.0 - alpha
+    carry = x[0]
+    for s in range(0, len(x), block):
+        blk = x[s:s + block]
+        i = np.arange(len(blk))
+        acc = np.cumsum(alpha * blk * beta ** -i)
+        out[s:s + block] = beta ** (i + 1) * carry + beta ** i * acc
+        carry = out[s + len(blk) - 1]
+    return out
+
+
+def series(kind: str, vf: np.ndarray, va: np.ndarray) -> np.ndarray:
+    """Ряд метрики по значениям «за»/«против» (матчи по дате, одна команда)."""
+    if kind == "for":
+        return vf
+    if kind == "against":
+        return va
+    if kind == "total":
+        return vf + va
+    if kind == "against_neg":
+        return -va
+    diff = vf - va
+    if kind == "roll3":
+        return _roll3(diff)
+    if kind == "ewma":
+        return ewma(diff)
+    return diff
+
+
+# =============== ДАННЫЕ ЛИГИ ===============
+class LeagueFrame:
+    """
+    Матчи лиги по одной стате (по дате) + моменты рядов, зависящих от порядка матчей
+    (роллинг, EWMA), для приоров: prior[ha][kind] — массив (сезоны × [n, Σx, Σx²])
+    по рядам всех команд лиги. Остальные виды — из league_moments.
+    """
+    __slots__ = ("league_id", "stat_type", "labels", "sids", "season", "home", "away", "hv", "av",
+                 "prior", "stamp")
+
+    def __init__(self, league_id: int, stat_type: str, labels: List[str], sids: List[int],
+                 season: np.ndarray, home: np.ndarray, away: np.ndarray,
+                 hv: np.ndarray, av: np.ndarray, stamp):
+        self.league_id = league_id
+        self.stat_type = stat_type
+        self.labels = labels
+        self.sids = sids
+        self.season = season
+        self.home = home
+        self.away = away
+        self.hv = hv
+        self.av = av
+        self.stamp = stamp
+        self.prior = self._moments()
+
+    def team_rows(self, team_id: int, ha_mode: str):
+        """(сезон, «за», «против») матчей команды в порядке дат, с фильтром H/A."""
+        is_home = self.home == team_id
+        mask = is_home if ha_mode == "home" else (self.away == team_id) if ha_mode == "away" \
+            else is_home | (self.away == team_id)
+        idx = np.flatnonzero(mask)
+        h = is_home[idx]
+        return (self.season[idx], np.where(h, self.hv[idx], self.av[idx]),
+                np.where(h, self.av[idx], self.hv[idx]))
+
+    def _moments(self) -> Dict[str, Dict[str, np.ndarray]]:
+        ns = len(self.labels)
+        teams = np.union1d(self.home, self.away)
+        kinds = [k for k in KINDS if k not in SERIES_KINDS]
+        out = {ha: {k: np.zeros((ns, 3)) for k in kinds} for ha in HA_MODES}
+        for ha in HA_MODES:
+            for tid in teams:
+                sidx, vf, va = self.team_rows(int(tid), ha)
+                if not len(sidx):
+                    continue
+                n = np.bincount(sidx, minlength=ns)
+                for kind in kinds:
+                    x = series(kind, vf, va)
+                    m = out[ha][kind]
+                    m[:, 0] += n
+                    m[:, 1] += np.bincount(sidx, weights=x, minlength=ns)
+                    m[:, 2] += np.bincount(sidx, weights=x * x, minlength=ns)
+        return out
+
+    def prior_moments(self, ha_mode: str, kind: str, exclude: int | None) -> Tuple[float, float, float]:
+        """(n, Σx, Σx²) по всем сезонам лиги, кроме exclude (индекс прогнозируемого сезона)."""
+        if kind in SERIES_KINDS:
+            m = MOMENTS.get().pooled(self.league_id, self.stat_type, ha_mode,
+                                     self.sids[exclude] if exclude is not None else None)
+            return series_moments(m, kind)
+        m = self.prior[ha_mode][kind]
+        tot = m.sum(axis=0)
+        if exclude is not None:
+            tot = tot - m[exclude]
+        return float(tot[0]), float(tot[1]), float(tot[2])
+
+
+def _load_frame(conn, league_id: int, stat_type: str, stamp) -> LeagueFrame:
+    hcol, acol = stat_columns(stat_type)
+    seasons = REFDATA.get(conn, meta).league_seasons(league_id)
+    sid_list = sorted(seasons)
+    pos = {sid: i for i, sid in enumerate(sid_list)}
+    rows = conn.execute(
+        select(Matches.c.season_id, Matches.c.home_team_id, Matches.c.away_team_id,
+               hcol.label("HVAL"), acol.label("AVAL"))
+        .where(Matches.c.league_id == league_id, hcol.isnot(None), acol.isnot(None))
+        .order_by(Matches.c.date.asc(), Matches.c.id.asc())
+    ).all()
+    rows = [r for r in rows if r.season_id in pos]
+    return LeagueFrame(
+        league_id=league_id, stat_type=stat_type,
+        labels=[seasons[sid] for sid in sid_list], sids=sid_list,
+        season=np.fromiter((pos[r.season_id] for r in rows), dtype=np.int64, count=len(rows)),
+        home=np.fromiter((r.home_team_id for r in rows), dtype=np.int64, count=len(rows)),
+        away=np.fromiter((r.away_team_id for r in rows), dtype=np.int64, count=len(rows)),
+        hv=np.fromiter((float(r.HVAL) for r in rows), dtype=np.float64, count=len(rows)),
+        av=np.fromiter((float(r.AVAL) for r in rows), dtype=np.float64, count=len(rows)),
+        stamp=stamp,
+    )
+
+
+class LeagueFrames:
+    """LRU кадров по (league_id, stat_type); кадр перечитывается после смены matches/seasons."""
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = max(1, int(maxsize))
+        self._data: "OrderedDict[Tuple[int, str], LeagueFrame]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, conn, league_id: int, stat_type: str) -> LeagueFrame:
+        key = (int(league_id), stat_type)
+        stamp = DATA_VERSION.stamp("matches", "seasons")
+        with self._lock:
+            fr = self._data.get(key)
+            if fr is not None and fr.stamp == stamp:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return fr
+        fr = _load_frame(conn, league_id, stat_type, stamp)
+        with self._lock:
+            self._data[key] = fr
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            self.loads += 1
+        return fr
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "loads": self.loads,
+                "matches": sum(len(f.season) for f in self._data.values()),
+            }
+
+
+FRAMES = LeagueFrames(int(os.environ.get("BETMAKER_FORECAST_FRAMES", "32")))
+
+
+# =============== МЕТОДЫ ===============
+def _windows(hist: np.ndarray, k: int, sidx: np.ndarray | None = None):
+    """
+    Окна длины k и значение сразу после каждого: (m × k), (m,). Без копирования;
+    с sidx (сезон каждой точки) — только окна, у которых и значение после лежат
+    в одном сезоне (тогда копия отобранных окон).
+    """
+    if k < 1 or len(hist) <= k:
+        return np.empty((0, max(k, 1))), np.empty(0)
+    win, nxt = sliding_window_view(hist, k)[:-1], hist[k:]
+    if sidx is None:
+        return win, nxt
+    same = sidx[:-k] == sidx[k:]          # сезоны идут подряд: хватает концов
+    return win[same], nxt[same]
+
+
+def pattern_forecast(cur: np.ndarray, hist: np.ndarray, k: int, tol: float,
+                     hist_sidx: np.ndarray | None = None) -> Tuple[float | None, int]:
+    """
+    ▲ prog: окна истории, совпавшие с последними k значениями (tol=0 — точно, иначе
+    ±tol). hist_sidx — сезоны точек истории: окна через границу сезона не берутся.
+    """
+    if len(cur) < k:
+        return None, 0
+    win, nxt = _windows(hist, k, hist_sidx)
+    d = win - cur[-k:]
+    ok = (d == 0).all(axis=1) if tol == 0 else (np.abs(d) <= tol).all(axis=1)
+    tau = 0.20 if tol == 0 else 0.90
+    w = np.exp(-(d * d).sum(axis=1) / (2 * tau * tau)) * ok
+    den = w.sum()
+    if den <= 0:
+        return None, 0
+    return float((w * nxt).sum() / den), int(ok.sum())
+
+
+def kernel_forecast(cur: np.ndarray, hist: np.ndarray, stat_type: str, kind: str,
+                    tol: float) -> Tuple[float | None, float]:
+    """◆ kprog: гауссово ядро по расстоянию окна истории до последних k значений."""
+    wide, narrow = KERNEL_CFG[stat_type]
+    k, s0, s1 = narrow if kind in ("for", "against", "against_neg") else wide
+    sigma = s0 if tol == 0 else s1
+    if len(cur) < k:
+        return None, 0.0
+    win, nxt = _windows(hist, k)
+    d = win - cur[-k:]
+    w = np.exp(-(d * d).sum(axis=1) / (2 * sigma * sigma))
+    w = np.where(w > 1e-9, w, 0.0)
+    den = w.sum()
+    if den == 0:
+        return None, 0.0
+    return float((w * nxt).sum() / den), float(den)
+
+
+def gamma_from_moments(m: float, v: float) -> Tuple[float, float]:
+    if not (np.isfinite(m) and m > 0) or not (np.isfinite(v) and v > 0):
+        return 1.0, 1.0 / max(m, 1e-6)
+    if v <= m + 1e-6:
+        a = 1e6
+        return a, a / max(m, 1e-6)
+    alpha = m * m / (v - m)
+    beta = alpha / m
+    if not (np.isfinite(alpha) and np.isfinite(beta)) or alpha <= 0 or beta <= 0:
+        return 1.0, 1.0 / max(m, 1e-6)
+    return alpha, beta
+
+
+def _mean_var(n: float, s: float, ss: float) -> Tuple[float, float]:
+    m = s / n
+    return m, max(ss - n * m * m, 0.0) / (n - 1 if n > 1 else 1)
+
+
+def bayes_poisson(cur: np.ndarray, prior: Tuple[float, float, float]) -> float | None:
+    """★ bprog: Gamma-приор по лиге + пуассоновское правдоподобие ряда сезона."""
+    n, s, ss = prior
+    if n <= 0:
+        return None
+    alpha, beta = gamma_from_moments(*_mean_var(n, s, ss))
+    return (alpha + float(cur.sum())) / (beta + len(cur))
+
+
+def bayes_skellam(cf: np.ndarray, ca: np.ndarray, prior_f: Tuple[float, float, float],
+                  prior_a: Tuple[float, float, float]) -> float | None:
+    """★ bprog для форы по голам: λ_за − λ_против, у каждой свой Gamma-приор по лиге."""
+    if prior_f[0] <= 0:
+        return None
+    lam = []
+    for (n, s, ss), x in ((prior_f, cf), (prior_a, ca)):
+        m, v = _mean_var(n, s, ss)
+        alpha, beta = gamma_from_moments(max(m, 0.01), max(v, 0.02))
+        lam.append((alpha + float(x.sum())) / (beta + len(x)))
+    return lam[0] - lam[1]
+
+
+# =============== SCHEMAS ===============
+class MetricForecast(BaseModel):
+    pattern: float | None = None      # ▲
+    pattern_count: int = 0
+    kernel: float | None = None       # ◆
+    kernel_weight: float = 0.0
+    bayes: float | None = None        # ★
+    bayes_model: str = "poisson"      # poisson | skellam
+
+class TeamForecast(BaseModel):
+    team_id: int
+    n: int                            # матчей в сезоне (с учётом H/A): прогноз — точка n+1
+    metrics: Dict[str, MetricForecast]
+
+class ForecastOut(BaseModel):
+    league_id: int
+    season: str
+    stat_type: str
+    ha_mode: str
+    k: int
+    tol: float
+    teams: List[TeamForecast]
+
+
+def team_forecast(fr: LeagueFrame, team_id: int, season_idx: int, stat_type: str, ha_mode: str,
+                  metrics: Dict[str, str], k: int, tol: float) -> TeamForecast:
+    """
+    Текущий ряд — матчи сезона; история — все остальные сезоны лиги подряд
+    (роллинг/EWMA считаются по ней целиком, как на графике). ▲ ищет окна внутри
+    одного сезона истории, ◆ — по всей истории.
+    """
+    sidx, vf, va = fr.team_rows(team_id, ha_mode)
+    cur = sidx == season_idx
+    cf, ca, hf, ha_ = vf[cur], va[cur], vf[~cur], va[~cur]
+    hsidx = sidx[~cur]
+    out: Dict[str, MetricForecast] = {}
+    for key, kind in metrics.items():
+        cs, hs = series(kind, cf, ca), series(kind, hf, ha_)
+        p, pc = pattern_forecast(cs, hs, k, tol, hsidx)
+        kv, kw = kernel_forecast(cs, hs, stat_type, kind, tol)
+        if stat_type == "goals" and kind == "diff":
+            b = bayes_skellam(cf, ca, fr.prior_moments(ha_mode, "for", season_idx),
+                              fr.prior_moments(ha_mode, "against", season_idx))
+            model = "skellam"
+        else:
+            b = bayes_poisson(cs, fr.prior_moments(ha_mode, kind, season_idx))
+            model = "poisson"
+        out[key] = MetricForecast(pattern=p, pattern_count=pc, kernel=kv, kernel_weight=kw,
+                                  bayes=b, bayes_model=model)
+    return TeamForecast(team_id=team_id, n=int(cur.sum()), metrics=out)
+
+
+@router.get("/api/forecast", response_model=ForecastOut)
+def api_forecast(
+    league_id: int = Query(..., ge=1),
+    team_ids: str = Query(...),
+    season: str = Query(...),
+    stat_type: str = Query("goals", regex="^(goals|corners|cards|shots|sot)$"),
+    ha_mode: str = Query("all", regex="^(all|home|away)$"),
+    metrics: str = Query("", description="comma-separated metric keys; пусто — все для stat_type"),
+    k: int = Query(2, ge=1, le=6),
+    tol: float = Query(0, ge=0, le=10),
+):
+    try:
+        team_list = list(dict.fromkeys(int(x) for x in team_ids.split(",") if x.strip()))
+    except Exception:
+        raise HTTPException(400, "Invalid team_ids")
+    if not team_list:
+        raise HTTPException(400, "team_ids is required")
+
+    hcol, acol = stat_columns(stat_type)
+    if hcol is None or acol is None:
+        raise HTTPException(400, f"Unsupported stat_type: {stat_type}")
+    known = metric_keys(stat_type)
+    wanted = [x.strip() for x in metrics.split(",") if x.strip()]
+    bad = [x for x in wanted if x not in known]
+    if bad:
+        raise HTTPException(400, f"Unsupported metrics: {','.join(bad)}")
+    chosen = {m: known[m] for m in wanted} if wanted else known
+
+    with engine.connect() as conn:
+        fr = FRAMES.get(conn, league_id, stat_type)
+    if season not in fr.labels:
+        raise HTTPException(404, "No seasons found")
+    season_idx = fr.labels.index(season)
+
+    return ForecastOut(
+        league_id=league_id, season=season, stat_type=stat_type, ha_mode=ha_mode, k=k, tol=tol,
+        teams=[team_forecast(fr, tid, season_idx, stat_type, ha_mode, chosen, k, tol)
+               for tid in team_list],
+    )
@@ -0,0 +1,166 @@
+# form.py — /api/form: форма команд (скользящие и сезонные средние, медианы, EWMA)
+#
+#   GET /api/form?league_id=1&seasons=2024_2025&stats=goals,corners&window=5&half_life=5[&team_ids=5,7]
+#
+# Для каждой команды, стороны (all / home / away) и статы — по значениям «за»,
+# «против», тотал и фора:
+#   last_mean  — среднее последних window матчей (SQL: AVG() OVER ... ROWS window-1 PRECEDING),
+#   mean       — среднее за выбранные сезоны (SQL: AVG() OVER PARTITION BY команда[, сторона]),
+#   last_median / median — медианы тех же окон (numpy),
+#   ewma       — экспоненциальное среднее с полураспадом half_life матчей (numpy).
+# Один SELECT на стату: матчи разворачиваются в строки «команда — матч» (UNION ALL
+# хозяев и гостей), оконные агрегаты считает база. Ответ — числа на команду,
+# без точек: объём зависит от числа команд, а не матчей.
+from __future__ import annotations
+from typing import Dict, List
+
+import numpy as np
+from fastapi import APIRouter, Query, HTTPException
+from pydantic import BaseModel
+from sqlalchemy import select, func, literal, union_all
+
+from db import engine, meta, Matches, stat_columns
+from refdata import REFDATA
+from forecast import ewma
+
+router = APIRouter()
+
+FORM_STATS = ("goals", "corners", "cards", "shots", "sot")
+SPLITS = {"home": "H", "away": "A"}
+
+
+class FormValue(BaseModel):
+    last_mean: float | None = None
+    last_median: float | None = None
+    mean: float | None = None
+    median: float | None = None
+    ewma: float | None = None
+
+class FormStat(BaseModel):
+    n: int
+    metrics: Dict[str, FormValue]     # for / against / total / diff
+
+class TeamForm(BaseModel):
+    team_id: int
+    splits: Dict[str, Dict[str, FormStat]]      # all|home|away -> stat -> ...
+
+class FormOut(BaseModel):
+    league_id: int
+    seasons: List[str]
+    window: int
+    half_life: float
+    teams: List[TeamForm]
+
+
+def _team_rows(league_id: int, sids: List[int], stat_type: str, team_ids: List[int] | None):
+    """Строки «команда — матч» (хозяева ∪ гости) с непустой статой."""
+    h, a = stat_columns(stat_type)
+    parts = []
+    for team_col, ha, vf, va in ((Matches.c.home_team_id, "H", h, a),
+                                 (Matches.c.away_team_id, "A", a, h)):
+        q = (select(Matches.c.id.label("mid"), Matches.c.date.label("date"),
+                    team_col.label("team_id"), literal(ha).label("ha"),
+                    vf.label("vf"), va.label("va"))
+             .where(Matches.c.league_id == league_id, Matches.c.season_id.in_(sids),
+                    h.isnot(None), a.isnot(None)))
+        if team_ids:
+            q = q.where(team_col.in_(team_ids))
+        parts.append(q)
+    return union_all(*parts).subquery("tp")
+
+
+def _query(tp, window: int):
+    """
+    Оконные агрегаты по команде (all) и по команде+стороне (side): среднее последних
+    window матчей на каждой строке и среднее за весь раздел.
+    """
+    order = (tp.c.date, tp.c.mid)
+    rows = (-(window - 1), 0)
+    vals = {"for": tp.c.vf, "against": tp.c.va, "total": tp.c.vf + tp.c.va, "diff": tp.c.vf - tp.c.va}
+    cols = [tp.c.team_id, tp.c.ha, tp.c.vf, tp.c.va]
+    for part, by in (("all", (tp.c.team_id,)), ("side", (tp.c.team_id, tp.c.ha))):
+        for name, v in vals.items():
+            cols.append(func.avg(v).over(partition_by=by, order_by=order, rows=rows)
+                        .label(f"{part}_last_{name}"))
+            cols.append(func.avg(v).over(partition_by=by).label(f"{part}_mean_{name}"))
+    return select(*cols).order_by(tp.c.team_id, *order)
+
+
+def _stat_form(vf: np.ndarray, va: np.ndarray, last_row, part: str, window: int,
+               alpha: float) -> FormStat:
+    """Сводка по одному разделу: SQL-средние с последней строки раздела + медианы/EWMA."""
+    x = np.vstack([vf, va, vf + va, vf - va])
+    med = np.median(x, axis=1)
+    last_med = np.median(x[:, -window:], axis=1)
+    # EWMA линейна: тотал и фора — сумма и разность EWMA «за» и «против»
+    ef, ea = float(ewma(vf, alpha)[-1]), float(ewma(va, alpha)[-1])
+    ew = (ef, ea, ef + ea, ef - ea)
+    out = {}
+    for i, name in enumerate(("for", "against", "total", "diff")):
+        out[name] = FormValue(
+            last_mean=float(getattr(last_row, f"{part}_last_{name}")),
+            mean=float(getattr(last_row, f"{part}_mean_{name}")),
+            last_median=float(last_med[i]),
+            median=float(med[i]),
+            ewma=ew[i],
+        )
+    return FormStat(n=len(vf), metrics=out)
+
+
+@router.get("/api/form", response_model=FormOut)
+def api_form(
+    league_id: int = Query(..., ge=1),
+    seasons: str = Query("", description="comma-separated labels; пусто — текущий сезон лиги"),
+    stats: str = Query(",".join(FORM_STATS), description="comma-separated: goals,corners,cards,shots,sot"),
+    team_ids: str = Query("", description="comma-separated; пусто — все команды"),
+    window: int = Query(5, ge=1, le=50),
+    half_life: float = Query(5.0, gt=0, le=100),
+):
+    stat_list = list(dict.fromkeys(x.strip() for x in stats.split(",") if x.strip()))
+    bad = [x for x in stat_list if x not in FORM_STATS]
+    if bad or not stat_list:
+        raise HTTPException(400, f"Unsupported stats: {','.join(bad) or '—'}")
+    stat_list = [st for st in stat_list if all(c is not None for c in stat_columns(st))]
+    try:
+        team_list = [int(x) for x in team_ids.split(",") if x.strip()]
+    except Exception:
+        raise HTTPException(400, "Invalid team_ids")
+
+    with engine.connect() as conn:
+        ref = REFDATA.get(conn, meta)
+        by_sid = ref.league_seasons(league_id)
+        labels = [x.strip() for x in seasons.split(",") if x.strip()]
+        if not labels:
+            labels = [lbl for sid, lbl in by_sid.items() if ref.season_current.get(sid)]
+        sids = list(ref.season_ids(league_id, labels).values())
+        if not sids:
+            raise HTTPException(404, "No seasons found")
+        per_stat = {st: conn.execute(_query(_team_rows(league_id, sids, st, team_list), window)).all()
+                    for st in stat_list}
+
+    alpha = 1.0 - 0.5 ** (1.0 / half_life)
+    teams: Dict[int, Dict[str, Dict[str, FormStat]]] = {}
+    for st, rows in per_stat.items():
+        if not rows:
+            continue
+        tid = np.fromiter((r.team_id for r in rows), dtype=np.int64, count=len(rows))
+        side = np.fromiter((r.ha == "H" for r in rows), dtype=bool, count=len(rows))
+        vf = np.fromiter((float(r.vf) for r in rows), dtype=np.float64, count=len(rows))
+        va = np.fromiter((float(r.va) for r in rows), dtype=np.float64, count=len(rows))
+        # строки отсортированы по команде и дате: границы разделов — по смене team_id
+        starts = np.flatnonzero(np.r_[True, tid[1:] != tid[:-1]])
+        ends = np.r_[starts[1:], len(rows)]
+        for s, e in zip(starts, ends):
+            splits = teams.setdefault(int(tid[s]), {})
+            splits.setdefault("all", {})[st] = _stat_form(vf[s:e], va[s:e], rows[e - 1], "all",
+                                                          window, alpha)
+            for split, ha in SPLITS.items():
+                idx = s + np.flatnonzero(side[s:e] == (ha == "H"))
+                if len(idx):
+                    splits.setdefault(split, {})[st] = _stat_form(
+                        vf[idx], va[idx], rows[idx[-1]], "side", window, alpha)
+
+    return FormOut(
+        league_id=league_id, seasons=labels, window=window, half_life=half_life,
+        teams=[TeamForm(team_id=t, splits=teams[t]) for t in sorted(teams)],
+    )
@@ -1,46 +1,23 @@
 # h2h.py — стабильная версия /api/h2h_odds с optional open/close
 from __future__ import annotations
 from typing import List, Dict, Any, Tuple
-import os
 from collections import defaultdict
 
 from fastapi import APIRouter, Query, HTTPException
 from pydantic import BaseModel
-from sqlalchemy import create_engine, MetaData, Table, select, and_, or_
-
-DB_URL = os.environ.get(
-    "BETMAKER_DB_URL",
-    "sqlite:///C:/Users/HomeComp/PycharmProjects/pythonProject/UKparserToBD/betmaker.sqlite3"
-)
-engine = create_engine(DB_URL, future=True)
-meta = MetaData()
-meta.reflect(bind=engine)
-
-Leagues: Table   = meta.tables["leagues"]
-Seasons: Table   = meta.tables["seasons"]
-Teams:   Table   = meta.tables["teams"]
-Matches: Table   = meta.tables["matches"]
-Odds1x2: Table   = meta.tables.get("odds_1x2")
-OddsOU:  Table   = meta.tables.get("odds_ou")
+from sqlalchemy import select, and_, or_, func, literal, union_all, Float
 
-router = APIRouter()
+from db import engine, meta, Matches, Odds1x2, OddsOU, ODDS_1X2_COLUMNS, ODDS_OU_COLUMNS
+from refdata import REFDATA
+import odds_consensus
 
-def _col(tbl: Table | None, *candidates: str):
-    if tbl is None:
-        return None
-    keys = set(tbl.c.keys())
-    for name in candidates:
-        if name in keys:
-            return tbl.c[name]
-    return None
+router = APIRouter()
 
 def _name_map(conn) -> Dict[int, str]:
-    rows = conn.execute(select(Teams.c.id, Teams.c.name)).all()
-    return {int(r.id): r.name for r in rows}
+    return REFDATA.get(conn, meta).team_name
 
 def _season_map(conn) -> Dict[int, str]:
-    rows = conn.execute(select(Seasons.c.id, Seasons.c.label)).all()
-    return {int(r.id): r.label for r in rows}
+    return REFDATA.get(conn, meta).season_label
 
 def _fetch_h2h_matches(conn, league_id:int, home_team_id:int, away_team_id:int, orientation:str):
     base = select(
@@ -65,9 +42,152 @@ def _fetch_h2h_matches(conn, league_id:int, home_team_id:int, away_team_id:int,
         )
     return conn.execute(q.order_by(Matches.c.date.asc())).all()
 
+def _split_state(rows):
+    """rows(match_id, st, ...) -> {mid: {st: row}}"""
+    out: Dict[int, Dict[Any, Any]] = defaultdict(dict)
+    for r in rows:
+        out[int(r.match_id)][r.st] = r
+    return out
+
+def _consensus_1x2(conn, match_ids: List[int], bookmaker: str | None,
+                   use_closing: bool, with_open: bool):
+    """
+    Средние 1X2 по букмекерам на матч. Один GROUP BY (match_id, is_closing):
+    суммы и количества непустых коэффициентов, состояния сводим в Python.
+    close = is_closing=1 (или все строки, если use_closing=false / колонки нет),
+    open = is_closing=0. Возвращает {"close"|"open": (one, draw, two)}.
+    """
+    bk_col    = ODDS_1X2_COLUMNS["bookmaker"]
+    close_col = ODDS_1X2_COLUMNS["is_closing"]
+    fields = (("one", ODDS_1X2_COLUMNS["home"]), ("draw", ODDS_1X2_COLUMNS["draw"]),
+              ("two", ODDS_1X2_COLUMNS["away"]))
+
+    st = close_col if close_col is not None else literal(1)
+    sel = [Odds1x2.c.match_id, st.label("st")]
+    for name, c in fields:
+        sel += [func.sum(c).label(f"s_{name}"), func.count(c).label(f"n_{name}")]
+    q = select(*sel).where(Odds1x2.c.match_id.in_(match_ids))
+    if bookmaker and bk_col is not None:
+        q = q.where(bk_col == bookmaker)
+    if close_col is not None and use_closing and not with_open:
+        q = q.where(close_col == 1)
+    q = q.group_by(Odds1x2.c.match_id, *([close_col] if close_col is not None else []))
+
+    def _mean(groups, name):
+        s = sum(float(getattr(g, f"s_{name}") or 0.0) for g in groups)
+        n = sum(int(getattr(g, f"n_{name}") or 0) for g in groups)
+        return s / n if n else None
+
+    out = {"close": ({}, {}, {}), "open": ({}, {}, {})}
+    for mid, by_st in _split_state(conn.execute(q).all()).items():
+        if close_col is None or not use_closing:
+            close_groups = list(by_st.values())
+            if bookmaker and bk_col is not None and 1 in by_st:
+                close_groups = [by_st[1]]    # один букмекер: его последняя (закрывающая) котировка
+        else:
+            close_groups = [g for k, g in by_st.items() if k == 1]
+        open_groups = [g for k, g in by_st.items() if k == 0] if with_open else []
+        for state, groups in (("close", close_groups), ("open", open_groups)):
+            if not groups:
+                continue
+            for dst, (name, _) in zip(out[state], fields):
+                dst[mid] = _mean(groups, name)
+    return out
+
+def _ou_targets(targets: List[float]):
+    """Подзапрос с целевыми линиями: SELECT :t AS target UNION ALL ..."""
+    parts = [select(literal(float(t), Float).label("target")) for t in targets]
+    return (parts[0] if len(parts) == 1 else union_all(*parts)).subquery("tgt")
+
+def _consensus_ou(conn, match_ids: List[int], bookmaker: str | None,
+                  targets: List[float], line_tol: float, with_open: bool):
+    """
+    OU-консенсус на матч для каждой целевой линии: у каждого букмекера берём
+    ближайшую к target линию в пределах line_tol (ROW_NUMBER по |line - target|),
+    затем усредняем по букмекерам. Строки odds_ou читаются один раз — join
+    с набором целей, одно окно на все цели и оба состояния (is_closing 1/0).
+    Возвращает {target: {"close"|"open": (line, over, under)}}.
+    """
+    bk_col    = ODDS_OU_COLUMNS["bookmaker"]
+    close_col = ODDS_OU_COLUMNS["is_closing"]
+    line_col  = ODDS_OU_COLUMNS["line"]
+    over_col  = ODDS_OU_COLUMNS["over"]
+    under_col = ODDS_OU_COLUMNS["under"]
+
+    out = {float(t): {"close": ({}, {}, {}), "open": ({}, {}, {})} for t in targets}
+    if not targets:
+        return out
+
+    tgt = _ou_targets(targets)
+    st = close_col if close_col is not None else literal(1)
+    diff = func.abs(line_col - tgt.c.target)
+    partition = [tgt.c.target, OddsOU.c.match_id]
+    if close_col is not None:
+        partition.append(close_col)
+    if bk_col is not None:
+        partition.append(func.coalesce(bk_col, ""))
+    order = [diff] + list(OddsOU.primary_key.columns)
+
+    ranked = (
+        select(
+            tgt.c.target.label("target"),
+            OddsOU.c.match_id.label("match_id"), st.label("st"),
+            line_col.label("line"), over_col.label("over"), under_col.label("under"),
+            func.row_number().over(partition_by=partition, order_by=order).label("rn"),
+        )
+        .select_from(OddsOU.join(tgt, diff <= float(line_tol)))
+        .where(OddsOU.c.match_id.in_(match_ids), line_col.isnot(None))
+    )
+    if close_col is not None:
+        ranked = ranked.where(close_col.in_([1, 0]) if with_open else close_col == 1)
+    if bookmaker and bk_col is not None:
+        ranked = ranked.where(bk_col == bookmaker)
+    ranked = ranked.subquery()
+
+    q = (
+        select(ranked.c.target, ranked.c.match_id, ranked.c.st,
+               func.avg(ranked.c.line).label("line"),
+               func.avg(ranked.c.over).label("over"),
+               func.avg(ranked.c.under).label("under"))
+        .where(ranked.c.rn == 1)
+        .group_by(ranked.c.target, ranked.c.match_id, ranked.c.st)
+    )
+
+    for r in conn.execute(q).all():
+        state = "close" if r.st == 1 else "open"
+        mid = int(r.match_id)
+        for dst, v in zip(out[float(r.target)][state], (r.line, r.over, r.under)):
+            dst[mid] = float(v) if v is not None else None
+    return out
+
+def _ou_all_lines(conn, match_ids: List[int], bookmaker: str | None) -> List[float]:
+    """Все различные OU-линии у данных матчей (для lines=all)."""
+    bk_col = ODDS_OU_COLUMNS["bookmaker"]
+    line_col = ODDS_OU_COLUMNS["line"]
+    q = (select(line_col).distinct()
+         .where(OddsOU.c.match_id.in_(match_ids), line_col.isnot(None)))
+    if bookmaker and bk_col is not None:
+        q = q.where(bk_col == bookmaker)
+    return sorted(float(r[0]) for r in conn.execute(q).all())
+
+def _parse_lines(lines: str | None) -> List[float] | str | None:
+    if lines is None or not lines.strip():
+        return None
+    if lines.strip().lower() == "all":
+        return "all"
+    try:
+        return sorted({float(x) for x in lines.split(",") if x.strip()})
+    except ValueError:
+        raise HTTPException(400, "lines: список чисел через запятую или all")
+
+def _line_key(t: float) -> str:
+    return f"{t:g}"
+
 class H2HSeriesOut(BaseModel):
     points: List[Dict[str, Any]]
     meta: Dict[str, Any]
+    # lines=...: "2.5" -> ряд OU по тем же матчам и в том же порядке, что points
+    ou_lines: Dict[str, List[Dict[str, Any]]] = {}
 
 @router.get("/api/h2h_odds", response_model=H2HSeriesOut)
 def api_h2h_odds(
@@ -77,25 +197,27 @@ def api_h2h_odds(
     bookmaker: str | None = Query(None, description="Если колонки нет — игнорируется"),
     line: float = Query(2.5),
     line_tol: float = Query(0.05, ge=0.0, le=1.0),
+    lines: str | None = Query(None, description="доп. OU-линии: 1.5,2.5,3.5 или all -> ou_lines"),
     use_closing: bool = Query(True, description="true -> is_closing=1 для close (если колонка есть)"),
     include_open: bool = Query(False, description="вернуть *_open из is_closing=0 (если колонка есть)"),
     orientation: str = Query("strict", regex="^(strict|both)$"),
 ):
     if Odds1x2 is None or OddsOU is None:
         raise HTTPException(500, "odds_* таблицы не найдены в БД")
+    ladder = _parse_lines(lines)
 
     # columns (динамично)
-    bk1_col     = _col(Odds1x2, "bookmaker", "bk", "bookie")
-    close1_col  = _col(Odds1x2, "is_closing", "closing", "isclose")
-    home_col    = _col(Odds1x2, "home", "one", "H")
-    draw_col    = _col(Odds1x2, "draw", "X", "D")
-    away_col    = _col(Odds1x2, "away", "two", "A")
-
-    bkou_col    = _col(OddsOU, "bookmaker", "bk", "bookie")
-    closeou_col = _col(OddsOU, "is_closing", "closing", "isclose")
-    line_col    = _col(OddsOU, "line", "total_line", "ou_line")
-    over_col    = _col(OddsOU, "over", "o", "over_odds")
-    under_col   = _col(OddsOU, "under", "u", "under_odds")
+    bk1_col     = ODDS_1X2_COLUMNS["bookmaker"]
+    close1_col  = ODDS_1X2_COLUMNS["is_closing"]
+    home_col    = ODDS_1X2_COLUMNS["home"]
+    draw_col    = ODDS_1X2_COLUMNS["draw"]
+    away_col    = ODDS_1X2_COLUMNS["away"]
+
+    bkou_col    = ODDS_OU_COLUMNS["bookmaker"]
+    closeou_col = ODDS_OU_COLUMNS["is_closing"]
+    line_col    = ODDS_OU_COLUMNS["line"]
+    over_col    = ODDS_OU_COLUMNS["over"]
+    under_col   = ODDS_OU_COLUMNS["under"]
 
     if home_col is None or draw_col is None or away_col is None:
         raise HTTPException(500, "В odds_1x2 нет обязательных колонок (home/draw/away).")
@@ -114,105 +236,47 @@ def api_h2h_odds(
             })
         match_ids = [int(r.match_id) for r in match_rows]
 
-        # ---- helpers ----
-        def fetch_1x2(state: str):
-            where_ = [Odds1x2.c.match_id.in_(match_ids)]
-            if state == "close" and use_closing and close1_col is not None:
-                where_.append(close1_col == 1)
-            if state == "open" and close1_col is not None:
-                where_.append(close1_col == 0)
-            if bookmaker and bk1_col is not None:
-                where_.append(bk1_col == bookmaker)
-
-            sel = [Odds1x2.c.match_id, home_col.label("one"), draw_col.label("draw"), away_col.label("two")]
-            if bk1_col is not None:
-                sel.append(bk1_col.label("bookmaker"))
-            rows = conn.execute(select(*sel).where(and_(*where_))).all()
-
-            r_one: Dict[int, float | None]  = {}
-            r_draw: Dict[int, float | None] = {}
-            r_two: Dict[int, float | None]  = {}
-            if bookmaker and bk1_col is not None:
-                for r in rows:
-                    mid = int(r.match_id)
-                    r_one[mid]  = float(r.one)  if r.one  is not None else None
-                    r_draw[mid] = float(r.draw) if r.draw is not None else None
-                    r_two[mid]  = float(r.two)  if r.two  is not None else None
-            else:
-                acc: Dict[int, Dict[str, list]] = defaultdict(lambda: {"one": [], "draw": [], "two": []})
-                for r in rows:
-                    mid = int(r.match_id)
-                    if r.one  is not None:  acc[mid]["one"].append(float(r.one))
-                    if r.draw is not None:  acc[mid]["draw"].append(float(r.draw))
-                    if r.two  is not None:  acc[mid]["two"].append(float(r.two))
-                for mid, d in acc.items():
-                    r_one[mid]  = sum(d["one"])/len(d["one"])   if d["one"]  else None
-                    r_draw[mid] = sum(d["draw"])/len(d["draw"]) if d["draw"] else None
-                    r_two[mid]  = sum(d["two"])/len(d["two"])   if d["two"]  else None
-            return r_one, r_draw, r_two
-
-        def fetch_ou(state: str):
-            where_ = [OddsOU.c.match_id.in_(match_ids)]
-            if state == "close" and closeou_col is not None:
-                where_.append(closeou_col == 1)
-            if state == "open" and closeou_col is not None:
-                where_.append(closeou_col == 0)
-
-            sel = [OddsOU.c.match_id, line_col.label("line"), over_col.label("over"), under_col.label("under")]
-            if bkou_col is not None:
-                sel.append(bkou_col.label("bookmaker"))
-            rows = conn.execute(select(*sel).where(and_(*where_))).all()
-
-            best_per_mid_book: Dict[Tuple[int, str], Tuple[float, float | None, float | None]] = {}
-            for r in rows:
-                if r.line is None:
-                    continue
-                diff = abs(float(r.line) - float(line))
-                if diff > float(line_tol):
-                    continue
-                mid = int(r.match_id)
-                bk = str(getattr(r, "bookmaker", "") or "")
-                prev = best_per_mid_book.get((mid, bk))
-                if (prev is None) or (abs(prev[0] - line) > diff):
-                    best_per_mid_book[(mid, bk)] = (
-                        float(r.line),
-                        float(r.over) if r.over is not None else None,
-                        float(r.under) if r.under is not None else None
-                    )
-
-            grouped: Dict[int, list] = defaultdict(list)
-            for (mid, bk), tup in best_per_mid_book.items():
-                if bookmaker and bkou_col is not None and bk != bookmaker:
-                    continue
-                grouped[mid].append(tup)
-
-            r_line: Dict[int, float | None]  = {}
-            r_over: Dict[int, float | None]  = {}
-            r_under: Dict[int, float | None] = {}
-            for mid, arr in grouped.items():
-                if not arr: continue
-                Ls = [t[0] for t in arr if t[0] is not None]
-                Os = [t[1] for t in arr if t[1] is not None]
-                Us = [t[2] for t in arr if t[2] is not None]
-                r_line[mid]  = sum(Ls)/len(Ls) if Ls else None
-                r_over[mid]  = sum(Os)/len(Os) if Os else None
-                r_under[mid] = sum(Us)/len(Us) if Us else None
-            return r_line, r_over, r_under
+        # ---- консенсус по матчам: по одному сгруппированному запросу на рынок
+        want_open = include_open and (close1_col is not None or closeou_col is not None)
+        # материализованный odds_consensus, если он свежий и не нужен фильтр по букмекеру
+        open_1x2 = want_open and close1_col is not None
+        open_ou = want_open and closeou_col is not None
+        fresh = odds_consensus.is_fresh()
+        ou_from_table = fresh and not (bookmaker and bkou_col is not None)
+
+        # все OU-цели (основная line + lines) считаются одним проходом
+        if ladder == "all":
+            ladder = (odds_consensus.ou_lines(conn, match_ids) if ou_from_table
+                      else _ou_all_lines(conn, match_ids, bookmaker))
+        targets = sorted({float(line), *(ladder or [])})
+
+        x12 = ou_by_target = None
+        if fresh and not (bookmaker and bk1_col is not None):
+            x12 = odds_consensus.read_1x2(conn, match_ids, use_closing, open_1x2)
+        if ou_from_table:
+            ou_by_target = odds_consensus.read_ou(conn, match_ids, targets, line_tol, open_ou)
+        source = {"1x2": "raw" if x12 is None else "consensus",
+                  "ou": "raw" if ou_by_target is None else "consensus"}
+        if x12 is None:
+            x12 = _consensus_1x2(conn, match_ids, bookmaker, use_closing, open_1x2)
+        if ou_by_target is None:
+            ou_by_target = _consensus_ou(conn, match_ids, bookmaker, targets, line_tol, open_ou)
+        ou = ou_by_target[float(line)]
 
         # ---- close
-        one_c, draw_c, two_c = fetch_1x2("close")
-        line_c, over_c, under_c = fetch_ou("close")
+        one_c, draw_c, two_c = x12["close"]
+        line_c, over_c, under_c = ou["close"]
 
         # ---- open (опционально)
         one_o = draw_o = two_o = {}
         line_o = over_o = under_o = {}
         has_open = False
-        if include_open and (close1_col is not None or closeou_col is not None):
+        if want_open:
             if close1_col is not None:
-                one_o, draw_o, two_o = fetch_1x2("open")
+                one_o, draw_o, two_o = x12["open"]
                 has_open = True
             if closeou_col is not None:
-                line_o, over_o, under_o = fetch_ou("open")
+                line_o, over_o, under_o = ou["open"]
                 has_open = True
 
         points: List[Dict[str, Any]] = []
@@ -242,17 +306,34 @@ def api_h2h_odds(
             points.append(pt)
         points.sort(key=lambda x: x["date"])
 
+        ou_lines: Dict[str, List[Dict[str, Any]]] = {}
+        for t in (ladder or []):
+            (l_c, o_c, u_c), (l_o, o_o, u_o) = ou_by_target[t]["close"], ou_by_target[t]["open"]
+            ou_lines[_line_key(t)] = [{
+                "match_id": p["match_id"],
+                "date": p["date"],
+                "line":  l_c.get(p["match_id"]),
+                "over":  o_c.get(p["match_id"]),
+                "under": u_c.get(p["match_id"]),
+                "line_open":  l_o.get(p["match_id"]) if has_open else None,
+                "over_open":  o_o.get(p["match_id"]) if has_open else None,
+                "under_open": u_o.get(p["match_id"]) if has_open else None,
+            } for p in points]
+
         return H2HSeriesOut(
             points=points,
+            ou_lines=ou_lines,
             meta={
                 "league_id": league_id,
                 "home_team_id": home_team_id,
                 "away_team_id": away_team_id,
                 "n_matches": len(match_rows),
-                "bookmaker": bookmaker if bk1_col or bkou_col else None,
+                "bookmaker": bookmaker if (bk1_col is not None or bkou_col is not None) else None,
                 "line": line,
                 "line_tol": line_tol,
                 "orientation": orientation,
                 "has_open": has_open,
+                "odds_source": source,
+                "lines": [_line_key(t) for t in (ladder or [])],
             }
         )
@@ -1,314 +1,140 @@
 # handicaps.py
 from __future__ import annotations
-from typing import List, Dict, Tuple
+from typing import Any, List, Dict, Tuple, Literal
 from math import exp
-from datetime import datetime
+import json
 
+import numpy as np
 from fastapi import APIRouter, Query, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy import create_engine, MetaData, Table, select
-
-import os
-DB_URL = os.environ.get(
-    "BETMAKER_DB_URL",
-    "sqlite:///C:/Users/HomeComp/PycharmProjects/pythonProject/UKparserToBD/betmaker.sqlite3"
-)
-engine = create_engine(DB_URL, future=True)
-meta = MetaData()
-meta.reflect(bind=engine)
-
-Leagues: Table = meta.tables["leagues"]
-Seasons: Table = meta.tables["seasons"]
-Teams:   Table = meta.tables["teams"]
-Matches: Table = meta.tables["matches"]
+
+from db import engine, meta, Leagues, Seasons, Teams, col as _col
+from refdata import REFDATA
+from model_cache import FittedModel
+from model_service import model_window, get_model
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter()
 
-def season_sort_key(label: str) -> Tuple[int, int, int]:
-    try:
-        if "_" in label:
-            y1, y2 = map(int, label.split("_"))
-            return (y2, y1, 0)
-        y = int(label)
-        return (y, y, 1)
-    except Exception:
-        return (0, 0, -1)
-
-def _sort_labels_desc(labels: list[str]) -> list[str]:
-    return sorted(labels, key=season_sort_key, reverse=True)
-
-def _col(tbl, *candidates):
-    cols = set(tbl.c.keys())
-    for name in candidates:
-        if name in cols:
-            return tbl.c[name]
-    return None
-
-def _resolve_stat_columns(stat_type: str):
-    """
-    Возвращает пары колонок (home, away) для выбранного типа статистики.
+def _pair_lambdas(model: FittedModel, team_id: int, opponent_id: int | None, mode: str,
+                  idx: Dict[int, int] | None = None) -> Tuple[float, float]:
     """
-    st = (stat_type or "goals").lower()
-    if st == "goals":
-        return Matches.c.FTHG, Matches.c.FTAG
-    if st == "shots":
-        h = _col(Matches, "HS", "HomeShots", "shots_home", "SH", "S_H")
-        a = _col(Matches, "AS_", "AS", "AwayShots", "shots_away", "SA", "S_A")
-        return h, a
-    if st == "sot":
-        h = _col(Matches, "HST", "HomeShotsOnTarget", "sot_home", "HSoT")
-        a = _col(Matches, "AST", "AwayShotsOnTarget", "sot_away", "ASoT")
-        return h, a
-    if st == "corners":
-        h = _col(Matches, "HC", "HomeCorners", "corners_home")
-        a = _col(Matches, "AC", "AwayCorners", "corners_away")
-        return h, a
-    if st == "cards":
-        # берём жёлтые (HY/AY). При желании можно сделать параметр "cards=yellow|red|total".
-        h = _col(Matches, "HY", "HomeYellows", "cards_y_home")
-        a = _col(Matches, "AY", "AwayYellows", "cards_y_away")
-        return h, a
-    return None, None
-
-def _timestamp(dt)->float:
-    if isinstance(dt, str):
-        try:
-            return datetime.fromisoformat(dt).timestamp()
-        except:
-            return 0.0
-    if isinstance(dt, datetime):
-        return dt.timestamp()
-    return 0.0
-
-def _exp_decay(age_days: float, half_life_days: float) -> float:
-    if half_life_days <= 0: return 1.0
-    return 2 ** ( - age_days / half_life_days )
-
-def _fit_dc_strengths(matches, team_ids_set, half_life_days: float, max_iter:int=60, tol:float=1e-6):
+    λ «за» и «против» team_id в паре с opponent_id (None или нет в окне — против
+    «среднего» соперника: atk = dfn = 0). idx — индекс teams -> позиция, батчи
+    строят его один раз.
     """
-    Лог-пуассоновская регрессия «атака/оборона + home_adv».
-    Универсальна для любых счётных метрик (голы, угловые, удары, карточки и т.д.).
-    """
-    teams = sorted(list(team_ids_set))
-    idx = {tid:i for i,tid in enumerate(teams)}
-    nT = len(teams)
-    atk = [0.0]*nT
-    dfn = [0.0]*nT
-    home_adv = 0.20
-
-    def _normalize():
-        if nT == 0: return
-        a_mean = sum(atk)/nT
-        d_mean = sum(dfn)/nT
-        for i in range(nT):
-            atk[i] -= a_mean
-            dfn[i] -= d_mean
-
-    tmax = max((_timestamp(m['date']) for m in matches), default=0.0)
-
-    for _ in range(max_iter):
-        _normalize()
-        g_atk = [0.0]*nT
-        g_dfn = [0.0]*nT
-        g_h   = 0.0
-
-        h_atk = [1e-6]*nT
-        h_dfn = [1e-6]*nT
-        h_h   = 1e-6
-
-        for m in matches:
-            ht = m['home_team_id']; at = m['away_team_id']
-            hv = m['HVAL'];         av = m['AVAL']
-            if hv is None or av is None: 
-                continue
-            i = idx.get(ht); j = idx.get(at)
-            if i is None or j is None: 
-                continue
-
-            age_days = max(0.0, (tmax - _timestamp(m['date']))/86400.0)
-            w = _exp_decay(age_days, half_life_days)
-
-            lam_h = exp(atk[i] - dfn[j] + home_adv)
-            lam_a = exp(atk[j] - dfn[i])
-
-            g_atk[i] += w*(hv - lam_h)
-            g_dfn[j] += w*(-hv + lam_h)
-            g_atk[j] += w*(av - lam_a)
-            g_dfn[i] += w*(-av + lam_a)
-            g_h      += w*(hv - lam_h)
-
-            h_atk[i] += w*lam_h
-            h_dfn[j] += w*lam_h
-            h_atk[j] += w*lam_a
-            h_dfn[i] += w*lam_a
-            h_h      += w*lam_h
-
-        step = 0.25
-        for i in range(nT):
-            atk[i] += step * g_atk[i]/h_atk[i]
-            dfn[i] += step * g_dfn[i]/h_dfn[i]
-        home_adv += step * g_h / h_h
-
-        if max(
-            max(abs(step*g_atk[i]/h_atk[i]) for i in range(nT)) if nT else 0.0,
-            max(abs(step*g_dfn[i]/h_dfn[i]) for i in range(nT)) if nT else 0.0,
-            abs(step*g_h/h_h),
-        ) < tol:
-            break
-
-    _normalize()
-    return teams, atk, dfn, home_adv
-
-def _load_matches_for_league(league_id:int, season_labels:list[str], stat_type:str, conn):
-    hcol, acol = _resolve_stat_columns(stat_type)
-    if hcol is None or acol is None:
-        raise HTTPException(400, f"Unsupported stat_type: {stat_type}")
-
-    sids = [r[0] for r in conn.execute(
-        select(Seasons.c.id).where(Seasons.c.league_id==league_id, Seasons.c.label.in_(season_labels))
-    ).all()]
-    if not sids:
-        return [], set()
-
-    rows = conn.execute(
-        select(Matches.c.date, Matches.c.home_team_id, Matches.c.away_team_id,
-               hcol.label("HVAL"), acol.label("AVAL"))
-        .where(Matches.c.league_id==league_id, Matches.c.season_id.in_(sids))
-        .order_by(Matches.c.date.asc())
-    ).all()
-
-    matches = []
-    teams = set()
-    for r in rows:
-        d, h, a, hv, av = r.date, int(r.home_team_id), int(r.away_team_id), r.HVAL, r.AVAL
-        if hv is None or av is None:
-            continue
-        teams.add(h); teams.add(a)
-        try:
-            hv = int(hv)
-            av = int(av)
-        except:
-            # на случай float-колонок — округляем
-            hv = int(round(float(hv)))
-            av = int(round(float(av)))
-        matches.append({
-            'date': str(d), 'home_team_id': h, 'away_team_id': a,
-            'HVAL': hv, 'AVAL': av,
-        })
-    return matches, teams
-
-def _extend_seasons_until_enough(league_id:int, chosen_labels:list[str], stat_type:str, conn, min_matches:int=50):
-    all_rows = conn.execute(
-        select(Seasons.c.label).where(Seasons.c.league_id == league_id)
-    ).all()
-    all_labels = _sort_labels_desc([r.label for r in all_rows])
-
-    window = list(chosen_labels)
-    seen = set(window)
-
-    while True:
-        matches, _ = _load_matches_for_league(league_id, window, stat_type, conn)
-        if len(matches) >= min_matches:
-            return window
-        last_idx = max((all_labels.index(l) for l in window if l in all_labels), default=-1)
-        next_idx = last_idx + 1
-        if next_idx >= len(all_labels):
-            return window
-        nxt = all_labels[next_idx]
-        if nxt not in seen:
-            window.append(nxt)
-            seen.add(nxt)
-
-def _pair_lambdas(teams, atk, dfn, home_adv, team_id:int, opponent_id:int|None, mode:str)->Tuple[float,float]:
-    idx = {tid:i for i,tid in enumerate(teams)}
+    if idx is None:
+        idx = {tid: i for i, tid in enumerate(model.teams)}
     if team_id not in idx:
-        raise HTTPException(404, "team_id not present in this league/seasons window")
-
+        raise HTTPException(404, f"team_id {team_id} not present in this league/seasons window")
+    atk, dfn, home_adv = model.atk, model.dfn, model.home_adv
     i = idx[team_id]
-    if opponent_id is not None and opponent_id in idx:
-        j = idx[opponent_id]
-        if mode == 'home':
-            lam_for = exp(atk[i] - dfn[j] + home_adv)
-            lam_agn = exp(atk[j] - dfn[i])
-        elif mode == 'away':
-            lam_for = exp(atk[i] - dfn[j])
-            lam_agn = exp(atk[j] - dfn[i] + home_adv)
-        else:  # all
-            lam_home_for = exp(atk[i] - dfn[j] + home_adv)
-            lam_home_agn = exp(atk[j] - dfn[i])
-            lam_away_for = exp(atk[i] - dfn[j])
-            lam_away_agn = exp(atk[j] - dfn[i] + home_adv)
-            lam_for = 0.5*(lam_home_for + lam_away_for)
-            lam_agn = 0.5*(lam_home_agn + lam_away_agn)
-        return float(lam_for), float(lam_agn)
-
-    # против «среднего» соперника
-    a_avg = 0.0; d_avg = 0.0
+    j = idx.get(opponent_id) if opponent_id is not None else None
+    a_opp, d_opp = (atk[j], dfn[j]) if j is not None else (0.0, 0.0)
+    at_home = (exp(atk[i] - d_opp + home_adv), exp(a_opp - dfn[i]))
+    away = (exp(atk[i] - d_opp), exp(a_opp - dfn[i] + home_adv))
     if mode == 'home':
-        lam_for = exp(atk[i] - d_avg + home_adv)
-        lam_agn = exp(a_avg - dfn[i])
+        lam_for, lam_agn = at_home
     elif mode == 'away':
-        lam_for = exp(atk[i] - d_avg)
-        lam_agn = exp(a_avg - dfn[i] + home_adv)
-    else:
-        lam_for = 0.5*(exp(atk[i] - d_avg + home_adv) + exp(atk[i] - d_avg))
-        lam_agn = 0.5*(exp(a_avg - dfn[i]) + exp(a_avg - dfn[i] + home_adv))
+        lam_for, lam_agn = away
+    else:  # all
+        lam_for = 0.5*(at_home[0] + away[0])
+        lam_agn = 0.5*(at_home[1] + away[1])
     return float(lam_for), float(lam_agn)
 
-def _poisson_pmf(lam: float, k: int) -> float:
-    if k < 0: 
-        return 0.0
-    p = exp(-lam)
-    for i in range(1, k+1):
-        p *= lam / i
-    return p
-
-def _joint_prob_table(l1: float, l2: float, max_g: int = 12) -> List[List[float]]:
-    ph = [_poisson_pmf(l1, k) for k in range(max_g+1)]
-    pa = [_poisson_pmf(l2, k) for k in range(max_g+1)]
-    return [[ph[h]*pa[a] for a in range(max_g+1)] for h in range(max_g+1)]
-
-def _moneyline_probs(l1: float, l2: float, max_g:int=12) -> Dict[str,float]:
-    tbl = _joint_prob_table(l1, l2, max_g=max_g)
-    pH = sum(tbl[h][a] for h in range(max_g+1) for a in range(max_g+1) if h > a)
-    pD = sum(tbl[h][a] for h in range(max_g+1) for a in range(max_g+1) if h == a)
-    pA = 1.0 - pH - pD
-    return {"home": pH, "draw": pD, "away": pA}
-
-def _ah_probs(l1: float, l2: float, line: float, team_is_home: bool, max_g:int=12) -> Dict[str,float]:
-    q = abs(line*2 - round(line*2))
-    if q > 1e-9:  # четвертные
-        if line > 0:
-            l1a = line - 0.25
-            l1b = line + 0.25
-        else:
-            l1a = line + 0.25
-            l1b = line - 0.25
-        p1 = _ah_probs(l1, l2, l1a, team_is_home, max_g=max_g)
-        p2 = _ah_probs(l1, l2, l1b, team_is_home, max_g=max_g)
-        return {
-            "cover": 0.5*(p1["cover"] + p2["cover"]),
-            "push":  0.5*(p1["push"]  + p2["push"]),
-            "lose":  0.5*(p1["lose"]  + p2["lose"]),
-        }
-
-    tbl = _joint_prob_table(l1, l2, max_g=max_g)
-    cover = push = lose = 0.0
-    for h in range(max_g+1):
-        for a in range(max_g+1):
-            p = tbl[h][a]
-            margin = (h - a) if team_is_home else (a - h)
-            if margin > line + 1e-12:
-                cover += p
-            elif abs(margin - line) <= 1e-12:
-                push += p
-            else:
-                lose += p
-    return {"cover": cover, "push": push, "lose": lose}
+def _poisson_vec(lam, max_g: int) -> np.ndarray:
+    """
+    P(X=k), k=0..max_g — рекуррентно, без факториалов. lam — число или массив
+    любой формы: k идёт последней осью.
+    """
+    lam = np.asarray(lam, dtype=float)
+    ratios = np.empty(lam.shape + (max_g + 1,))
+    ratios[..., 0] = np.exp(-lam)
+    ratios[..., 1:] = lam[..., None] / np.arange(1, max_g + 1)
+    return np.cumprod(ratios, axis=-1)
+
+# обрезка сетки счёта на команду: хвост за ней ~1e-5 при λ до ~3 (голы, карточки),
+# ~7 (угловые, удары в створ) и ~20 (удары)
+GRID_SIZE: Dict[str, int] = {"goals": 12, "cards": 12, "corners": 20, "sot": 20, "shots": 40}
+
+def _grid_size(stat_type: str) -> int:
+    return GRID_SIZE.get(stat_type, 12)
+
+def _margin_dist(l1: float, l2: float, max_g: int = 12) -> np.ndarray:
+    """
+    Распределение разницы h - a по обрезанной таблице (Skellam-вектор):
+    индекс k соответствует разнице k - max_g. Суммы диагоналей сетки
+    считаем свёрткой маргиналов.
+    """
+    return np.convolve(_poisson_vec(l1, max_g), _poisson_vec(l2, max_g)[::-1])
+
+def _total_dist(l1: float, l2: float, max_g: int = 12) -> np.ndarray:
+    """
+    Распределение тотала h + a по той же обрезанной таблице: индекс k — тотал k
+    (суммы антидиагоналей сетки = свёртка маргиналов).
+    """
+    return np.convolve(_poisson_vec(l1, max_g), _poisson_vec(l2, max_g))
+
+def _moneyline_from_margin(margin: np.ndarray) -> Dict[str,float]:
+    g = (len(margin) - 1) // 2
+    pH = float(margin[g+1:].sum())
+    pD = float(margin[g])
+    return {"home": pH, "draw": pD, "away": 1.0 - pH - pD}
+
+def _ladder(pmf: np.ndarray, lo: int, lines) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    above/push/below для линейки порогов по распределению целой величины
+    (последняя ось pmf, индекс k — значение lo + k; ведущие оси — батч).
+    above: X > line, push: X == line; четвертные — среднее двух соседних
+    половинных/целых линий. Все линии — одно чтение из кумулятивных сумм.
+    Возвращает массивы формы (..., len(lines)).
+    """
+    lines = np.asarray(lines, dtype=float)
+    quarter = np.abs(lines*2 - np.round(lines*2)) > 1e-9
+    parts = np.stack([np.where(quarter, lines - 0.25, lines),
+                      np.where(quarter, lines + 0.25, lines)])       # (2, L)
+    n = pmf.shape[-1]
+    cdf = np.cumsum(pmf, axis=-1)
+    total = cdf[..., -1][..., None, None]
+    k = np.floor(parts + 1e-12).astype(int) - lo                     # P(X <= line)
+    kk = np.clip(k, 0, n - 1)
+    le = np.where(k < 0, 0.0, np.where(k >= n, total, cdf[..., kk]))
+    is_int = (np.abs(parts - np.round(parts)) <= 1e-12) & (k >= 0) & (k < n)
+    push = np.where(is_int, pmf[..., kk], 0.0)
+    above = total - le
+    below = total - above - push
+    return above.mean(axis=-2), push.mean(axis=-2), below.mean(axis=-2)
+
+def _ah_ladder(margin: np.ndarray, lines: List[float], team_is_home: bool) -> List[Dict[str,float]]:
+    """
+    cover/push/lose для всей линейки по одному вектору разниц (см. _ladder):
+    cover — margin > line, push — margin == line.
+    """
+    m = margin if team_is_home else margin[::-1]
+    g = (len(m) - 1) // 2
+    cover, push, lose = _ladder(m, -g, lines)
+    return [{"cover": float(c), "push": float(p), "lose": float(l)} for c, p, l in zip(cover, push, lose)]
+
+def _total_quotes(total: np.ndarray, lines: List[float]) -> List["TotalQuote"]:
+    """Тотальная линейка (over/push/under) по вектору тотала — см. _ladder."""
+    over, push, under = _ladder(total, 0, lines)
+    return [TotalQuote(line=float(ln), over=float(o), push=float(p), under=float(u),
+                       fair_odds_over=_fair_decimal(float(o)))
+            for ln, o, p, u in zip(lines, over, push, under)]
 
 def _fair_decimal(p: float) -> float:
     return float('inf') if p <= 0 else 1.0/p
 
+DEFAULT_AH_LINES = "-1.5,-1,-0.75,-0.5,-0.25,0,+0.25,+0.5,+0.75,+1,+1.5"
+DEFAULT_TOTAL_LINES: Dict[str, str] = {
+    "goals":   "0.5,1.5,2.5,3.5,4.5",
+    "corners": "7.5,8.5,9.5,10.5,11.5,12.5",
+    "cards":   "2.5,3.5,4.5,5.5,6.5",
+    "shots":   "19.5,21.5,23.5,25.5,27.5",
+    "sot":     "6.5,7.5,8.5,9.5,10.5",
+}
+
 class AHQuote(BaseModel):
     line: float
     cover: float
@@ -316,6 +142,13 @@ class AHQuote(BaseModel):
     lose: float
     fair_odds_cover: float
 
+class TotalQuote(BaseModel):
+    line: float
+    over: float
+    push: float
+    under: float
+    fair_odds_over: float
+
 class AHPreviewOut(BaseModel):
     team_id: int
     season_labels: list[str]
@@ -327,44 +160,44 @@ class AHPreviewOut(BaseModel):
     moneyline: Dict[str, float]
     asian: List[AHQuote]
     lines: List[float]
+    totals: List[TotalQuote] = []
+    total_lines: List[float] = []
+    meta: Dict[str, Any] = {}
 
-@router.get("/api/handicaps", response_model=AHPreviewOut)
-def api_handicaps(
-    league_id: int = Query(..., ge=1),
-    team_id: int   = Query(..., ge=1),
-    seasons: str   = Query(..., description="comma-separated season labels"),
-    stat_type: str = Query("goals", regex="^(goals|corners|cards|shots|sot)$"),
-    ha_mode: str   = Query("all", regex="^(all|home|away)$"),
-    opponent_id: int | None = Query(None),
-    half_life_days: float = Query(180.0, ge=1.0, le=2000.0),
-    lines: str = Query("-1.5,-1,-0.75,-0.5,-0.25,0,+0.25,+0.5,+0.75,+1,+1.5"),
-):
-    season_labels = [s.strip() for s in seasons.split(",") if s.strip()]
-    if not season_labels:
-        raise HTTPException(400, "seasons required")
-
+def _parse_lines(lines: str) -> List[float]:
     try:
-        line_vals = [float(x.strip()) for x in lines.split(",") if x.strip()]
+        return [float(x.strip()) for x in lines.split(",") if x.strip()]
     except:
         raise HTTPException(400, "Bad line in 'lines'")
 
-    with engine.begin() as conn:
-        season_labels = _extend_seasons_until_enough(league_id, season_labels, stat_type, conn, min_matches=50)
-        matches, team_ids_set = _load_matches_for_league(league_id, season_labels, stat_type, conn)
-        if len(matches) < 20:
-            raise HTTPException(404, "Недостаточно данных для оценки")
-
-        teams, atk, dfn, home_adv = _fit_dc_strengths(
-            matches, team_ids_set, half_life_days=half_life_days
-        )
-
-    lam_gf, lam_ga = _pair_lambdas(teams, atk, dfn, home_adv, team_id, opponent_id, ha_mode)
-    mprobs = _moneyline_probs(lam_gf, lam_ga, max_g=20 if stat_type in ("shots","sot") else 12)
+def _handicaps_window(league_id:int, season_labels:list[str], stat_type:str, half_life_days:float):
+    """(окно сезонов, ключ модели) для /api/handicaps."""
+    return model_window(league_id, season_labels, stat_type, half_life_days, min_matches=50)
+
+async def _handicaps_model(league_id:int, season_labels:list[str], stat_type:str, half_life_days:float,
+                           warm_start:bool=True):
+    season_labels, key = await run_in_threadpool(_handicaps_window, league_id, season_labels,
+                                                 stat_type, half_life_days)
+    model = await get_model(key, league_id, season_labels, stat_type, half_life_days, warm_start=warm_start)
+    if model.n_matches < 20:
+        raise HTTPException(404, "Недостаточно данных для оценки")
+    return season_labels, model
+
+def _handicaps_quote(model:FittedModel, season_labels:list[str], stat_type:str, team_id:int,
+                     opponent_id:int|None, ha_mode:str, line_vals:List[float],
+                     total_vals:List[float]=()) -> AHPreviewOut:
+    lam_gf, lam_ga = _pair_lambdas(model, team_id, opponent_id, ha_mode)
+    # одни маргиналы сетки счёта на пару: вектор разниц — азиатская линейка,
+    # вектор тоталов — over/under; каждая линейка читается из кумулятивных сумм
+    g = _grid_size(stat_type)
+    ph, pa = _poisson_vec(lam_gf, g), _poisson_vec(lam_ga, g)
+    margin = np.convolve(ph, pa[::-1])
+    totals = _total_quotes(np.convolve(ph, pa), total_vals)
+    mprobs = _moneyline_from_margin(margin)
 
     def _quotes_for_mode(is_home: bool):
         q = []
-        for ln in line_vals:
-            stats = _ah_probs(lam_gf, lam_ga, ln, team_is_home=is_home, max_g=20 if stat_type in ("shots","sot") else 12)
+        for ln, stats in zip(line_vals, _ah_ladder(margin, line_vals, team_is_home=is_home)):
             q.append(AHQuote(
                 line=float(ln),
                 cover=float(stats["cover"]),
@@ -403,4 +236,220 @@ def api_handicaps(
         moneyline=mprobs,
         asian=asian_quotes,
         lines=[float(x) for x in line_vals],
+        totals=totals,
+        total_lines=[float(x) for x in total_vals],
+        meta={"fit": model.fit_info},
+    )
+
+@router.get("/api/handicaps", response_model=AHPreviewOut)
+async def api_handicaps(
+    league_id: int = Query(..., ge=1),
+    team_id: int   = Query(..., ge=1),
+    seasons: str   = Query(..., description="comma-separated season labels"),
+    stat_type: str = Query("goals", regex="^(goals|corners|cards|shots|sot)$"),
+    ha_mode: str   = Query("all", regex="^(all|home|away)$"),
+    opponent_id: int | None = Query(None),
+    half_life_days: float = Query(180.0, ge=1.0, le=2000.0),
+    lines: str = Query(DEFAULT_AH_LINES),
+    total_lines: str = Query("", description="comma-separated; пусто — линейка по умолчанию для статы"),
+    warm_start: bool = Query(True, description="сид фита от прошлой модели лиги"),
+):
+    season_labels = [s.strip() for s in seasons.split(",") if s.strip()]
+    if not season_labels:
+        raise HTTPException(400, "seasons required")
+    line_vals = _parse_lines(lines)
+    total_vals = _parse_lines(total_lines or DEFAULT_TOTAL_LINES[stat_type])
+
+    season_labels, model = await _handicaps_model(league_id, season_labels, stat_type, half_life_days,
+                                                  warm_start=warm_start)
+
+    return _handicaps_quote(model, season_labels, stat_type, team_id, opponent_id, ha_mode, line_vals, total_vals)
+
+class FixturePair(BaseModel):
+    """Пара «команда — соперник» для батчей (handicaps и superprog)."""
+    team_id: int
+    opponent_id: int | None = None
+    ha_mode: Literal['all', 'home', 'away'] = 'all'
+
+class AHBatchIn(BaseModel):
+    league_id: int
+    seasons: str                         # comma-separated season labels
+    stat_type: Literal['goals', 'corners', 'cards', 'shots', 'sot'] = 'goals'
+    half_life_days: float = 180.0
+    lines: str = DEFAULT_AH_LINES
+    total_lines: str = ""                # пусто — DEFAULT_TOTAL_LINES[stat_type]
+    pairs: List[FixturePair] = []
+    all_pairs: bool = False              # все упорядоченные пары команд окна
+    ha_mode: Literal['all', 'home', 'away'] = 'all'   # режим для all_pairs
+    warm_start: bool = True
+
+class AHBatchOut(BaseModel):
+    season_labels: list[str]
+    stat_type: str
+    n_matches: int
+    teams: List[int]
+    lines: List[float]
+    total_lines: List[float] = []
+    results: List[AHPreviewOut]
+    skipped_team_ids: List[int] = []
+    meta: Dict[str, Any] = {}
+
+@router.post("/api/handicaps/batch", response_model=AHBatchOut)
+async def api_handicaps_batch(req: AHBatchIn):
+    """
+    Один фит на лигу — moneyline, азиатская и тотальная линейки для списка пар (или всех пар).
+    """
+    season_labels = [s.strip() for s in req.seasons.split(",") if s.strip()]
+    if not season_labels:
+        raise HTTPException(400, "seasons required")
+    if not (1.0 <= req.half_life_days <= 2000.0):
+        raise HTTPException(400, "half_life_days must be in [1, 2000]")
+    if not req.pairs and not req.all_pairs:
+        raise HTTPException(400, "pairs or all_pairs required")
+    line_vals = _parse_lines(req.lines)
+    total_vals = _parse_lines(req.total_lines or DEFAULT_TOTAL_LINES[req.stat_type])
+
+    season_labels, model = await _handicaps_model(req.league_id, season_labels, req.stat_type, req.half_life_days,
+                                                  warm_start=req.warm_start)
+
+    if req.all_pairs:
+        pairs = [FixturePair(team_id=t, opponent_id=o, ha_mode=req.ha_mode)
+                 for t in model.teams for o in model.teams if t != o]
+    else:
+        pairs = req.pairs
+
+    # команды вне окна сезонов не валят весь батч — отдаём их отдельным списком
+    known = set(model.teams)
+    # сотни пар — не в event loop
+    results = await run_in_threadpool(lambda: [
+        _handicaps_quote(model, season_labels, req.stat_type, p.team_id, p.opponent_id, p.ha_mode,
+                         line_vals, total_vals)
+        for p in pairs if p.team_id in known
+    ])
+    return AHBatchOut(
+        season_labels=season_labels,
+        stat_type=req.stat_type,
+        n_matches=model.n_matches,
+        teams=model.teams,
+        lines=[float(x) for x in line_vals],
+        total_lines=[float(x) for x in total_vals],
+        results=results,
+        skipped_team_ids=sorted({p.team_id for p in pairs if p.team_id not in known}),
+        meta={"fit": model.fit_info},
+    )
+
+# ===== /api/league_matrix: все упорядоченные пары лиги × все рынки =====
+MATRIX_FIELDS = ("lambda_home", "lambda_away", "home", "draw", "away", "btts",
+                 "ah_cover", "ah_push", "ah_lose", "over", "total_push", "under")
+
+def _grid_reducer(max_g: int) -> np.ndarray:
+    """
+    0/1-матрица ((G+1)², 4G+2): сетка P(h, a), развёрнутая в строку, умножением
+    на неё даёт сразу распределение разницы h - a (первые 2G+1 столбцов, индекс
+    k — разница k - G, как у _margin_dist) и тотала h + a (следующие 2G+1).
+    """
+    h, a = np.divmod(np.arange((max_g + 1) ** 2), max_g + 1)
+    red = np.zeros(((max_g + 1) ** 2, 4 * max_g + 2))
+    red[np.arange(len(h)), h - a + max_g] = 1.0
+    red[np.arange(len(h)), 2 * max_g + 1 + h + a] = 1.0
+    return red
+
+def league_matrix(model: FittedModel, stat_type: str, ah_lines: List[float],
+                  total_lines: List[float]) -> Dict[str, np.ndarray]:
+    """
+    Все рынки для всех упорядоченных пар (хозяева i, гости j) одной моделью:
+    λ (T×T), одна сетка счёта (T×T×(G+1)×(G+1)) на пару, из неё одним умножением —
+    распределения разницы и тотала; 1X2, BTTS, азиатская и тотальная линейки —
+    батчем по всем парам (см. _ladder). Диагональ (i == j) — NaN.
+    """
+    g = _grid_size(stat_type)
+    atk = np.asarray(model.atk, dtype=float)
+    dfn = np.asarray(model.dfn, dtype=float)
+    lam_h = np.exp(atk[:, None] - dfn[None, :] + model.home_adv)
+    lam_a = np.exp(atk[None, :] - dfn[:, None])
+
+    grid = _poisson_vec(lam_h, g)[..., :, None] * _poisson_vec(lam_a, g)[..., None, :]
+    t = len(atk)
+    dists = (grid.reshape(t, t, -1) @ _grid_reducer(g))
+    margin, totals = dists[..., :2 * g + 1], dists[..., 2 * g + 1:]
+
+    out = {
+        "lambda_home": lam_h,
+        "lambda_away": lam_a,
+        "home": margin[..., g + 1:].sum(axis=-1),
+        "draw": margin[..., g],
+        "btts": grid[..., 1:, 1:].sum(axis=(-2, -1)),
+    }
+    out["away"] = 1.0 - out["home"] - out["draw"]
+    out["ah_cover"], out["ah_push"], out["ah_lose"] = _ladder(margin, -g, ah_lines)
+    out["over"], out["total_push"], out["under"] = _ladder(totals, 0, total_lines)
+    diag = np.arange(t)
+    for v in out.values():
+        v[diag, diag] = np.nan
+    return out
+
+def _matrix_json(season_labels: list[str], stat_type: str, model: FittedModel, names: Dict[int, str],
+                 ah_lines: List[float], total_lines: List[float], arrays: Dict[str, np.ndarray],
+                 decimals: int):
+    """
+    JSON по частям: заголовок, затем каждое поле построчно (строка — хозяева i).
+    Массивы [i][j] (и [i][j][line] для линеек), пропуски на диагонали — null.
+    """
+    dumps = lambda x: json.dumps(x, separators=(",", ":"))
+    head = {
+        "format": "matrix",
+        "season_labels": season_labels,
+        "stat_type": stat_type,
+        "n_matches": model.n_matches,
+        "teams": model.teams,
+        "names": {str(tid): names.get(tid, str(tid)) for tid in model.teams},
+        "ah_lines": ah_lines,
+        "total_lines": total_lines,
+        "meta": {"fit": model.fit_info},
+    }
+    yield dumps(head)[:-1]
+    for name in MATRIX_FIELDS:
+        rows = np.round(arrays[name], decimals).tolist()
+        yield f',"{name}":['
+        for i, row in enumerate(rows):
+            row[i] = None
+            yield ("," if i else "") + dumps(row)
+        yield "]"
+    yield "}"
+
+@router.get("/api/league_matrix")
+async def api_league_matrix(
+    league_id: int = Query(..., ge=1),
+    seasons: str   = Query(..., description="comma-separated season labels"),
+    stat_type: str = Query("goals", regex="^(goals|corners|cards|shots|sot)$"),
+    half_life_days: float = Query(180.0, ge=1.0, le=2000.0),
+    ah_lines: str = Query(DEFAULT_AH_LINES),
+    total_lines: str = Query("", description="comma-separated; пусто — линейка по умолчанию для статы"),
+    decimals: int = Query(6, ge=2, le=12),
+    warm_start: bool = Query(True, description="сид фита от прошлой модели лиги"),
+):
+    """
+    Вся лига одним запросом: для каждой пары хозяева × гости — λ, 1X2, BTTS,
+    азиатская линейка (с точки зрения хозяев) и тоталы. Один фит (общий кэш
+    моделей /api/handicaps), одна сетка на пару; ответ — компактные массивы
+    по полям (см. _matrix_json), отдаётся потоком.
+    """
+    season_labels = [s.strip() for s in seasons.split(",") if s.strip()]
+    if not season_labels:
+        raise HTTPException(400, "seasons required")
+    ah_vals = _parse_lines(ah_lines)
+    total_vals = _parse_lines(total_lines or DEFAULT_TOTAL_LINES[stat_type])
+
+    season_labels, model = await _handicaps_model(league_id, season_labels, stat_type, half_life_days,
+                                                  warm_start=warm_start)
+
+    def _build():
+        with engine.connect() as conn:
+            names = REFDATA.get(conn, meta).team_name
+        return names, league_matrix(model, stat_type, ah_vals, total_vals)
+
+    names, arrays = await run_in_threadpool(_build)
+    return StreamingResponse(
+        _matrix_json(season_labels, stat_type, model, names, ah_vals, total_vals, arrays, decimals),
+        media_type="application/json",
     )
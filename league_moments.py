@@ -0,0 +1,433 @@
+# league_moments.py — моменты стат по лиге/сезону/стороне (приоры для /api/forecast)
+#
+#   python -m league_moments rebuild    # пересобрать с нуля
+#   python -m league_moments refresh    # только сезоны с изменившимися матчами
+#   python -m league_moments status
+#
+# Строка = (league_id, season_id, stat_type, ha): n, Σfor, Σfor², Σagainst, Σagainst², Σfor·against
+# по матчам со значением статы, с точки зрения команды: ha='H' — хозяева (for = home),
+# ha='A' — гости (for = away); 'all' = H + A. Из этих сумм за O(1) получаются среднее,
+# дисперсия и ковариация for/against, а также тотал (for+against) и фора (for−against).
+# Суммы аддитивны: пул сезонов = сумма строк, «все, кроме сезона» = итог − строка.
+# У каждого сезона — отпечаток его матчей (league_moments_seasons: count, max id и
+# суммы по колонкам стат, см. data_version.content_aggregates). refresh пересчитывает
+# только сезоны, чей отпечаток разошёлся: догрузка, удаление и правка на месте.
+# Читатель (MOMENTS) держит таблицу в памяти; после смены версии matches
+# (data_version) фоновый поток досчитывает разошедшиеся сезоны, подменяет снимок и
+# пишет их в таблицу (через DATA_VERSION.own_write) — запрос только читает снимок.
+from __future__ import annotations
+from typing import Any, Dict, List, Set, Tuple
+import argparse
+import threading
+import time
+
+import numpy as np
+from fastapi import APIRouter, Query, HTTPException
+from pydantic import BaseModel
+from sqlalchemy import MetaData, Table, Column, Integer, Float, String, select, func, delete, inspect
+from sqlalchemy.exc import OperationalError
+
+from db import engine, meta, Matches, STAT_COLUMNS
+from refdata import REFDATA
+from data_version import DATA_VERSION, content_aggregates, content_digest
+
+_meta = MetaData()
+
+Moments = Table(
+    "league_moments", _meta,
+    Column("league_id", Integer, primary_key=True),
+    Column("season_id", Integer, primary_key=True),
+    Column("stat_type", String(16), primary_key=True),
+    Column("ha", String(1), primary_key=True),             # H | A
+    Column("n", Integer, nullable=False),
+    Column("s_for", Float, nullable=False),
+    Column("ss_for", Float, nullable=False),
+    Column("s_against", Float, nullable=False),
+    Column("ss_against", Float, nullable=False),
+    Column("s_cross", Float, nullable=False),               # Σ for·against
+)
+
+MomentsSeasons = Table(
+    "league_moments_seasons", _meta,
+    Column("season_id", Integer, primary_key=True),
+    Column("fp", String(32), nullable=False),              # отпечаток матчей сезона
+)
+
+MomentsMeta = Table(
+    "league_moments_meta", _meta,
+    Column("key", String(32), primary_key=True),
+    Column("value", Float),
+)
+
+FIELDS = ("n", "s_for", "ss_for", "s_against", "ss_against", "s_cross")
+
+
+def _stats() -> List[str]:
+    return [st for st, (h, a) in STAT_COLUMNS.items() if h is not None and a is not None]
+
+
+def _aggregate(conn, season_ids: List[int] | None = None) -> List[Dict[str, Any]]:
+    """Строки таблицы из matches: один GROUP BY (лига, сезон) на стату, H и A — из одних сумм."""
+    out = []
+    for st in _stats():
+        h, a = STAT_COLUMNS[st]
+        q = (select(Matches.c.league_id, Matches.c.season_id, func.count(),
+                    func.sum(h), func.sum(h * h), func.sum(a), func.sum(a * a), func.sum(h * a))
+             .where(h.isnot(None), a.isnot(None))
+             .group_by(Matches.c.league_id, Matches.c.season_id))
+        if season_ids is not None:
+            q = q.where(Matches.c.season_id.in_(season_ids))
+        for lid, sid, n, sh, ssh, sa, ssa, sx in conn.execute(q).all():
+            if lid is None or sid is None:
+                continue
+            base = dict(league_id=int(lid), season_id=int(sid), stat_type=st, n=int(n),
+                        s_cross=float(sx or 0))
+            out.append(dict(base, ha="H", s_for=float(sh or 0), ss_for=float(ssh or 0),
+                            s_against=float(sa or 0), ss_against=float(ssa or 0)))
+            out.append(dict(base, ha="A", s_for=float(sa or 0), ss_for=float(ssa or 0),
+                            s_against=float(sh or 0), ss_against=float(ssh or 0)))
+    return out
+
+
+def _season_prints(conn) -> Dict[int, str]:
+    """Отпечатки сезонов по matches: один GROUP BY по колонкам, из которых строятся суммы."""
+    cols = [Matches.c.league_id] + [c for st in _stats() for c in STAT_COLUMNS[st]]
+    q = (select(Matches.c.season_id, *content_aggregates(Matches.c.id, cols))
+         .where(Matches.c.season_id.isnot(None))
+         .group_by(Matches.c.season_id))
+    return {int(r[0]): content_digest(r[1:]) for r in conn.execute(q).all()}
+
+
+def _stored_prints(conn) -> Dict[int, str]:
+    return {int(sid): fp for sid, fp in conn.execute(
+        select(MomentsSeasons.c.season_id, MomentsSeasons.c.fp)).all()}
+
+
+def _diff(prints: Dict[int, str], stored: Dict[int, str]) -> Tuple[List[int], List[int]]:
+    """(сезоны пересчитать, сезоны удалить)."""
+    changed = sorted(sid for sid, fp in prints.items() if stored.get(sid) != fp)
+    gone = sorted(set(stored) - set(prints))
+    return changed, gone
+
+
+def _write_meta(conn) -> None:
+    conn.execute(delete(MomentsMeta))
+    conn.execute(MomentsMeta.insert(), [{"key": "built_at", "value": time.time()}])
+
+
+def _read_meta(conn) -> Dict[str, float]:
+    return {r.key: r.value for r in conn.execute(select(MomentsMeta.c.key, MomentsMeta.c.value)).all()}
+
+
+def rebuild(conn) -> Dict[str, Any]:
+    """Полная пересборка таблицы."""
+    t0 = time.perf_counter()
+    _meta.create_all(conn)
+    prints = _season_prints(conn)
+    rows = _aggregate(conn)
+    conn.execute(delete(Moments))
+    conn.execute(delete(MomentsSeasons))
+    if rows:
+        conn.execute(Moments.insert(), rows)
+    if prints:
+        conn.execute(MomentsSeasons.insert(), [{"season_id": k, "fp": v} for k, v in prints.items()])
+    _write_meta(conn)
+    return {"mode": "rebuild", "rows": len(rows), "seasons": len(prints),
+            "ms": round((time.perf_counter() - t0) * 1000.0, 1)}
+
+
+def _exists(conn) -> bool:
+    return inspect(conn).has_table("league_moments_seasons")
+
+
+def refresh(conn) -> Dict[str, Any]:
+    """Пересчёт сезонов, чей отпечаток разошёлся с сохранённым."""
+    if not _exists(conn):
+        return rebuild(conn)
+    t0 = time.perf_counter()
+    prints = _season_prints(conn)
+    changed, gone = _diff(prints, _stored_prints(conn))
+    rows = _aggregate(conn, changed) if changed else []
+    if changed or gone:
+        conn.execute(delete(Moments).where(Moments.c.season_id.in_(changed + gone)))
+        conn.execute(delete(MomentsSeasons).where(MomentsSeasons.c.season_id.in_(changed + gone)))
+    if rows:
+        conn.execute(Moments.insert(), rows)
+    if changed:
+        conn.execute(MomentsSeasons.insert(), [{"season_id": k, "fp": prints[k]} for k in changed])
+    _write_meta(conn)
+    return {"mode": "refresh", "seasons": len(changed), "removed": len(gone), "rows": len(rows),
+            "ms": round((time.perf_counter() - t0) * 1000.0, 1)}
+
+
+def status(conn) -> Dict[str, Any]:
+    if not _exists(conn):
+        return {"exists": False}
+    changed, gone = _diff(_season_prints(conn), _stored_prints(conn))
+    return {
+        "exists": True,
+        "rows": int(conn.execute(select(func.count()).select_from(Moments)).scalar_one()),
+        "built_at": _read_meta(conn).get("built_at"),
+        "stale_seasons": changed + gone,
+        "fresh": not (changed or gone),
+    }
+
+
+# =============== чтение ===============
+def series_moments(m: np.ndarray, kind: str) -> Tuple[float, float, float]:
+    """(n, Σx, Σx²) ряда вида kind (см. forecast.KINDS) из вектора FIELDS."""
+    n, sf, ssf, sa, ssa, sx = (float(v) for v in m)
+    if kind == "for":
+        return n, sf, ssf
+    if kind == "against":
+        return n, sa, ssa
+    if kind == "against_neg":
+        return n, -sa, ssa
+    if kind == "total":
+        return n, sf + sa, ssf + ssa + 2 * sx
+    if kind == "diff":
+        return n, sf - sa, ssf + ssa - 2 * sx
+    raise KeyError(kind)
+
+
+SERIES_KINDS = ("for", "against", "against_neg", "total", "diff")
+
+
+class MomentsSnapshot:
+    """Таблица в памяти: строки по (лига, сезон, стата, сторона) и итоги по лиге."""
+    __slots__ = ("rows", "totals", "stamp", "loaded_at")
+
+    def __init__(self, rows: List[Dict[str, Any]], stamp):
+        self.rows: Dict[Tuple[int, int, str, str], np.ndarray] = {}
+        self.totals: Dict[Tuple[int, str, str], np.ndarray] = {}
+        for r in rows:
+            v = np.array([float(r[f]) for f in FIELDS])
+            self.rows[(int(r["league_id"]), int(r["season_id"]), r["stat_type"], r["ha"])] = v
+            tk = (int(r["league_id"]), r["stat_type"], r["ha"])
+            self.totals[tk] = self.totals.get(tk, 0.0) + v
+        self.stamp = stamp
+        self.loaded_at = time.time()
+
+    def _sides(self, ha_mode: str) -> Tuple[str, ...]:
+        return ("H",) if ha_mode == "home" else ("A",) if ha_mode == "away" else ("H", "A")
+
+    def season(self, league_id: int, season_id: int, stat_type: str, ha_mode: str) -> np.ndarray:
+        out = np.zeros(len(FIELDS))
+        for ha in self._sides(ha_mode):
+            out = out + self.rows.get((league_id, season_id, stat_type, ha), 0.0)
+        return out
+
+    def pooled(self, league_id: int, stat_type: str, ha_mode: str,
+               exclude_season_id: int | None = None) -> np.ndarray:
+        """Все сезоны лиги (кроме exclude_season_id) — итог минус строка, без обхода сезонов."""
+        out = np.zeros(len(FIELDS))
+        for ha in self._sides(ha_mode):
+            out = out + self.totals.get((league_id, stat_type, ha), 0.0)
+        if exclude_season_id is not None:
+            out = out - self.season(league_id, exclude_season_id, stat_type, ha_mode)
+        return out
+
+
+class LeagueMoments:
+    """
+    Держит league_moments в памяти. После смены версии matches (data_version) снимок
+    перестраивается в фоновом потоке: таблица + сезоны с разошедшимся отпечатком,
+    досчитанные из matches; до подмены запросы получают прежний снимок. Затем тот
+    же поток пишет эти сезоны в таблицу (refresh); если база только для чтения,
+    ошибка попадает в last_error, а суммы так и считаются в память. Под _lock —
+    только сравнение версии и подмена снимка. Ждать загрузки приходится только
+    первому запросу.
+    """
+
+    def __init__(self):
+        self._snap: MomentsSnapshot | None = None
+        self._lock = threading.Lock()
+        self._first = threading.Lock()   # холодный старт: одна загрузка на всех
+        self._running = False
+        self.loads = 0
+        self.checks = 0
+        self.drifted = 0                 # сезонов досчитано в память при последней загрузке
+        self.last_refresh: Dict[str, Any] | None = None
+        self.last_error: str | None = None
+
+    def _load(self, conn) -> Tuple[List[Dict[str, Any]], Set[int]]:
+        prints = _season_prints(conn)
+        if _exists(conn):
+            changed, gone = _diff(prints, _stored_prints(conn))
+            stale = set(changed) | set(gone)
+            rows = [dict(r._mapping) for r in conn.execute(select(Moments)).all()
+                    if r.season_id not in stale]
+            if changed:
+                rows += _aggregate(conn, changed)
+        else:
+            stale = set(prints)
+            rows = _aggregate(conn)
+        return rows, stale
+
+    def _reload(self) -> Tuple[MomentsSnapshot, Set[int]]:
+        stamp = DATA_VERSION.stamp("matches")      # до чтения: смена во время загрузки не потеряется
+        with engine.connect() as conn:
+            rows, stale = self._load(conn)
+        snap = MomentsSnapshot(rows, stamp)
+        with self._lock:
+            self._snap = snap
+            self.loads += 1
+            self.drifted = len(stale)
+        return snap, stale
+
+    def _persist(self) -> None:
+        try:
+            with DATA_VERSION.own_write() as conn:
+                res = refresh(conn)
+            with self._lock:
+                self.last_refresh, self.last_error = res, None
+        except OperationalError as e:
+            with self._lock:
+                self.last_error = repr(e)
+
+    def _background(self, reload: bool) -> None:
+        try:
+            stale = self._reload()[1] if reload else True
+            if stale:
+                self._persist()
+        except Exception as e:
+            with self._lock:
+                self.last_error = repr(e)
+        finally:
+            with self._lock:
+                self._running = False
+
+    def _start(self, reload: bool) -> None:
+        """Запустить фоновый поток, если он ещё не идёт (вызывать под _lock)."""
+        if not self._running:
+            self._running = True
+            threading.Thread(target=self._background, args=(reload,),
+                             name="league-moments-refresh", daemon=True).start()
+
+    def get(self) -> MomentsSnapshot:
+        stamp = DATA_VERSION.stamp("matches")
+        with self._lock:
+            self.checks += 1
+            snap = self._snap
+            if snap is not None:
+                if snap.stamp != stamp:
+                    self._start(reload=True)
+                return snap
+        with self._first:
+            with self._lock:
+                if self._snap is not None:
+                    return self._snap
+            snap, stale = self._reload()
+        if stale:
+            with self._lock:
+                self._start(reload=False)
+        return snap
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._snap = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snap = self._snap
+            return {
+                "loaded": snap is not None,
+                "loads": self.loads,
+                "checks": self.checks,
+                "rows": len(snap.rows) if snap else 0,
+                "stamp": list(snap.stamp) if snap else None,
+                "drifted_seasons": self.drifted,
+                "refreshing": self._running,
+                "last_refresh": self.last_refresh,
+                "last_error": self.last_error,
+            }
+
+
+MOMENTS = LeagueMoments()
+
+
+# =============== API ===============
+router = APIRouter()
+
+class MomentsOut(BaseModel):
+    n: int
+    sum_for: float
+    sumsq_for: float
+    sum_against: float
+    sumsq_against: float
+    sum_cross: float
+    mean_for: float | None = None
+    var_for: float | None = None
+    mean_against: float | None = None
+    var_against: float | None = None
+    cov: float | None = None          # ковариация for/against
+
+class SeasonMomentsOut(MomentsOut):
+    season: str
+
+class LeagueMomentsOut(BaseModel):
+    league_id: int
+    stat_type: str
+    ha_mode: str
+    seasons: List[SeasonMomentsOut]
+    pooled: MomentsOut                # по перечисленным сезонам
+
+
+def describe(m: np.ndarray) -> Dict[str, Any]:
+    n, sf, ssf, sa, ssa, sx = (float(v) for v in m)
+    out = dict(n=int(n), sum_for=sf, sumsq_for=ssf, sum_against=sa, sumsq_against=ssa, sum_cross=sx)
+    if n > 0:
+        d = n - 1 if n > 1 else 1
+        mf, ma = sf / n, sa / n
+        out.update(mean_for=mf, mean_against=ma, var_for=(ssf - n * mf * mf) / d,
+                   var_against=(ssa - n * ma * ma) / d, cov=(sx - n * mf * ma) / d)
+    return out
+
+
+@router.get("/api/league_moments", response_model=LeagueMomentsOut)
+def api_league_moments(
+    league_id: int = Query(..., ge=1),
+    stat_type: str = Query("goals", regex="^(goals|corners|cards|shots|sot)$"),
+    ha_mode: str = Query("all", regex="^(all|home|away)$"),
+    seasons: str = Query("", description="comma-separated labels; пусто — все сезоны лиги"),
+    exclude_season: str = Query("", description="метка сезона, которую не включать (прогнозируемый)"),
+):
+    if stat_type not in _stats():
+        raise HTTPException(400, f"Unsupported stat_type: {stat_type}")
+    with engine.connect() as conn:
+        by_sid = REFDATA.get(conn, meta).league_seasons(league_id)
+    if not by_sid:
+        raise HTTPException(404, "No seasons found")
+    wanted = [x.strip() for x in seasons.split(",") if x.strip()]
+    sid_by_label = {lbl: sid for sid, lbl in by_sid.items()}
+    labels = [lbl for lbl in wanted if lbl in sid_by_label] if wanted else list(sid_by_label)
+    labels = [lbl for lbl in labels if lbl != exclude_season]
+
+    snap = MOMENTS.get()
+    per = [(lbl, snap.season(league_id, sid_by_label[lbl], stat_type, ha_mode)) for lbl in labels]
+    if not wanted:
+        pooled = snap.pooled(league_id, stat_type, ha_mode, sid_by_label.get(exclude_season))
+    else:
+        pooled = sum((m for _, m in per), np.zeros(len(FIELDS)))
+    return LeagueMomentsOut(
+        league_id=league_id, stat_type=stat_type, ha_mode=ha_mode,
+        seasons=[SeasonMomentsOut(season=lbl, **describe(m)) for lbl, m in per],
+        pooled=MomentsOut(**describe(pooled)),
+    )
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="league_moments: per-league/season stat moments")
+    ap.add_argument("command", choices=["rebuild", "refresh", "status"])
+    args = ap.parse_args(argv)
+    with engine.begin() as conn:
+        if args.command == "rebuild":
+            print(rebuild(conn))
+        elif args.command == "refresh":
+            print(refresh(conn))
+        else:
+            print(status(conn))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# model_cache.py — общий кэш зафиченных моделей Dixon–Coles (superprog + handicaps)
+from __future__ import annotations
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+from collections import OrderedDict
+import os
+import threading
+import time
+
+from sqlalchemy import Column, Table, func, select
+
+from db import IS_SQLITE
+from data_version import DATA_VERSION, content_aggregates, content_digest
+
+
+class FittedModel(NamedTuple):
+    teams: List[int]
+    atk: List[float]
+    dfn: List[float]
+    home_adv: float
+    rho: float
+    n_matches: int
+    fit_info: Dict[str, Any] = {}     # iterations / converged / warm_start
+
+
+ModelKey = Tuple[int, Tuple[str, ...], str, float, Any]
+
+
+def model_key(league_id: int, season_labels: list[str], stat_type: str,
+              half_life_days: float, data_version) -> ModelKey:
+    return (int(league_id), tuple(season_labels), stat_type, float(half_life_days), data_version)
+
+
+# (league_id, сезоны окна, колонки) -> (версия таблицы matches из data_version,
+# время расчёта, отпечаток окна)
+_WINDOW_VERSIONS: Dict[Tuple[int, Tuple[int, ...], Tuple[str, ...]], Tuple[int, float, str]] = {}
+_WINDOW_VERSIONS_LOCK = threading.Lock()
+
+
+def _date_value(c: Column) -> Any:
+    """Дата матча числом — для сумм content_aggregates."""
+    return func.julianday(c) if IS_SQLITE else func.extract("epoch", c)
+
+
+def matches_version(conn, matches: Table, league_id: int, season_ids: Sequence[int],
+                    columns: Sequence[Column]) -> str:
+    """
+    «Версия данных» окна модели: content_aggregates по матчам лиги в сезонах окна —
+    дата, команды и колонки статы (columns). Меняется при догрузке, удалении и правке
+    значений на месте внутри окна; правки других сезонов и других стат ключ не трогают.
+    Пересчёт (один агрегирующий SELECT) — после смены версии таблицы matches; без
+    PRAGMA data_version (не SQLite) UPDATE этот сигнал не видит, поэтому там ещё и
+    не реже раза в check_interval.
+    """
+    sids = tuple(sorted(int(s) for s in season_ids))
+    memo = (int(league_id), sids, tuple(c.name for c in columns))
+    tv = DATA_VERSION.table(matches.name)
+    now = time.monotonic()
+    with _WINDOW_VERSIONS_LOCK:
+        cached = _WINDOW_VERSIONS.get(memo)
+    if cached is not None and cached[0] == tv and (
+            DATA_VERSION.sees_updates or now - cached[1] < DATA_VERSION.check_interval):
+        return cached[2]
+    cols = [_date_value(matches.c.date), matches.c.home_team_id, matches.c.away_team_id, *columns]
+    row = conn.execute(
+        select(*content_aggregates(matches.c.id, cols))
+        .where(matches.c.league_id == league_id, matches.c.season_id.in_(sids))
+    ).one()
+    ver = content_digest(row)
+    with _WINDOW_VERSIONS_LOCK:
+        _WINDOW_VERSIONS[memo] = (tv, now, ver)
+    return ver
+
+
+class ModelCache:
+    """
+    Потокобезопасный LRU с ограничением размера и счётчиками hit/miss.
+    Несошедшиеся фиты (fit_info.converged=False) не кэшируются и не становятся сидом.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = max(1, int(maxsize))
+        self._data: "OrderedDict[ModelKey, FittedModel]" = OrderedDict()
+        # последняя модель по (league_id, stat_type, half_life_days) — для тёплого старта
+        self._latest: "OrderedDict[Tuple[int, str, float], FittedModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.unconverged = 0
+
+    def get(self, key: ModelKey) -> FittedModel | None:
+        with self._lock:
+            model = self._data.get(key)
+            if model is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return model
+
+    def put(self, key: ModelKey, model: FittedModel) -> None:
+        with self._lock:
+            if not (model.fit_info or {}).get("converged", True):
+                self.unconverged += 1
+                return
+            self._data[key] = model
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+            lkey = (key[0], key[2], key[3])
+            self._latest[lkey] = model
+            self._latest.move_to_end(lkey)
+            while len(self._latest) > self.maxsize:
+                self._latest.popitem(last=False)
+
+    def latest(self, league_id: int, stat_type: str, half_life_days: float) -> FittedModel | None:
+        """Последняя зафиченная модель лиги (любая версия данных) — сид для тёплого старта."""
+        with self._lock:
+            return self._latest.get((int(league_id), stat_type, float(half_life_days)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._latest.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "unconverged": self.unconverged,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+MODEL_CACHE = ModelCache(maxsize=int(os.environ.get("BETMAKER_MODEL_CACHE_SIZE", "64")))
@@ -0,0 +1,145 @@
+# model_service.py — окно сезонов, загрузка матчей и фит модели лиги (Dixon–Coles)
+#
+# Общее для /api/superprog, /api/handicaps, /api/league_matrix и refit_snapshots:
+# все они читают и пишут одни и те же ключи MODEL_CACHE / FIT_FLIGHTS /
+# model_snapshots, поэтому модель по ключу строится здесь и только здесь.
+from __future__ import annotations
+from typing import Dict, List, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select, func
+from starlette.concurrency import run_in_threadpool
+
+from db import engine, meta, Matches, stat_columns
+from dc_engine import fit_matches
+from refdata import REFDATA
+from model_cache import MODEL_CACHE, FittedModel, ModelKey, model_key, matches_version
+from fit_pool import FIT_POOL, FIT_FLIGHTS
+import model_snapshots
+
+# rho пока не оценивается — стартовое значение в допустимых границах
+DEFAULT_RHO = 0.05
+
+
+def season_sort_key(label: str) -> Tuple[int, int, int]:
+    try:
+        if "_" in label:
+            y1, y2 = map(int, label.split("_"))
+            return (y2, y1, 0)
+        y = int(label)
+        return (y, y, 1)
+    except Exception:
+        return (0, 0, -1)
+
+def _sort_labels_desc(labels: list[str]) -> list[str]:
+    return sorted(labels, key=season_sort_key, reverse=True)
+
+def fit_stat_columns(stat_type: str):
+    """(home_col, away_col) статы; колонок нет в схеме — 400."""
+    hcol, acol = stat_columns(stat_type)
+    if hcol is None or acol is None:
+        raise HTTPException(400, f"Unsupported stat_type: {stat_type}")
+    return hcol, acol
+
+def load_matches(league_id: int, season_labels: list[str], stat_type: str, conn):
+    """Матчи окна с непустой статой (по дате) в формате dc_engine + множество команд."""
+    hcol, acol = fit_stat_columns(stat_type)
+    sids = list(REFDATA.get(conn, meta).season_ids(league_id, season_labels).values())
+    if not sids:
+        return [], set()
+
+    rows = conn.execute(
+        select(Matches.c.date, Matches.c.home_team_id, Matches.c.away_team_id,
+               hcol.label("HVAL"), acol.label("AVAL"))
+        .where(Matches.c.league_id == league_id, Matches.c.season_id.in_(sids))
+        .where(hcol.isnot(None), acol.isnot(None))
+        .order_by(Matches.c.date.asc())
+    ).all()
+
+    matches = []
+    teams = set()
+    for r in rows:
+        h, a = int(r.home_team_id), int(r.away_team_id)
+        teams.add(h); teams.add(a)
+        matches.append({
+            'date': str(r.date), 'home_team_id': h, 'away_team_id': a,
+            # float-колонки статы — округляем до счёта
+            'HVAL': int(round(float(r.HVAL))), 'AVAL': int(round(float(r.AVAL))),
+        })
+    return matches, teams
+
+def season_stat_counts(league_id: int, stat_type: str, conn) -> Dict[str, int]:
+    """label -> число матчей с непустой статой. Один GROUP BY по всем сезонам лиги."""
+    hcol, acol = fit_stat_columns(stat_type)
+    labels = REFDATA.get(conn, meta).league_seasons(league_id)
+    out = {lbl: 0 for lbl in labels.values()}
+    rows = conn.execute(
+        select(Matches.c.season_id, func.count())
+        .where(Matches.c.league_id == league_id, hcol.isnot(None), acol.isnot(None))
+        .group_by(Matches.c.season_id)
+    ).all()
+    for sid, n in rows:
+        lbl = labels.get(sid)
+        if lbl is not None:
+            out[lbl] += int(n)
+    return out
+
+def extend_seasons(league_id: int, chosen_labels: list[str], stat_type: str, conn,
+                   min_matches: int = 50) -> List[str]:
+    """
+    Расширяем окно сезонов назад, пока не наберём нужное число матчей с непустой статой.
+    Считаем по готовым счётчикам сезонов — сами матчи здесь не грузим.
+    """
+    counts = season_stat_counts(league_id, stat_type, conn)
+    all_labels = _sort_labels_desc(list(counts))
+
+    window = list(chosen_labels)
+    total = sum(counts.get(l, 0) for l in set(window))
+    while total < min_matches:
+        # следующий более старый сезон
+        last_idx = max((all_labels.index(l) for l in window if l in all_labels), default=-1)
+        if last_idx + 1 >= len(all_labels):
+            break  # больше нечего добавлять
+        nxt = all_labels[last_idx + 1]
+        window.append(nxt)
+        total += counts.get(nxt, 0)
+    return window
+
+def model_window(league_id: int, season_labels: list[str], stat_type: str, half_life_days: float,
+                 min_matches: int) -> Tuple[List[str], ModelKey]:
+    """(окно сезонов, ключ модели) — синхронно, для run_in_threadpool."""
+    with engine.connect() as conn:
+        labels = extend_seasons(league_id, season_labels, stat_type, conn, min_matches=min_matches)
+        sids = REFDATA.get(conn, meta).season_ids(league_id, labels).values()
+        ver = matches_version(conn, Matches, league_id, sids, fit_stat_columns(stat_type))
+        return labels, model_key(league_id, labels, stat_type, half_life_days, ver)
+
+async def get_model(key: ModelKey, league_id: int, season_labels: list[str], stat_type: str,
+                    half_life_days: float, warm_start: bool = True) -> FittedModel:
+    """
+    Модель лиги из общего кэша; при промахе — снимок с диска (model_snapshots),
+    иначе загрузка матчей (в потоке) и фит dc_engine в пуле процессов (fit_pool),
+    с тёплым стартом от последней модели этой лиги/статы/half-life.
+    Одновременные промахи по одному ключу ждут один и тот же фит.
+    """
+    model = MODEL_CACHE.get(key)
+    if model is not None:
+        return model
+
+    async def _build() -> FittedModel:
+        def _load():
+            with engine.connect() as conn:
+                return load_matches(league_id, season_labels, stat_type, conn)
+        built = await run_in_threadpool(model_snapshots.fetch, key)
+        if built is None:
+            matches, team_ids_set = await run_in_threadpool(_load)
+            init = MODEL_CACHE.latest(league_id, stat_type, half_life_days) if warm_start else None
+            seed = (init.teams, init.atk, init.dfn, init.home_adv) if init is not None else None
+            teams, atk, dfn, home_adv, info = await FIT_POOL.run(
+                fit_matches, matches, team_ids_set, half_life_days, init=seed)
+            built = FittedModel(teams, atk, dfn, home_adv, DEFAULT_RHO, len(matches), info)
+            await run_in_threadpool(model_snapshots.store, key, built)
+        MODEL_CACHE.put(key, built)
+        return built
+
+    return await FIT_FLIGHTS.run(key, _build, label=stat_type)
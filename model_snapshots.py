@@ -0,0 +1,262 @@
+# model_snapshots.py — снимки зафиченных моделей лиг на диске (переживают рестарт)
+#
+#   python -m model_snapshots rebuild [--force]   # зафитить все лиги × статы × half-life
+#                                                 # по умолчанию; --force — сначала очистить
+#   python -m model_snapshots status
+#   python -m model_snapshots clear
+#
+# Строка = модель с ключом (league_id, окно сезонов, stat_type, half_life_days) и
+# версией данных окна (data_ver) — той же, что в ключе MODEL_CACHE
+# (model_cache.matches_version); снимок годен, только пока она совпадает.
+# Несошедшиеся фиты (fit_info.converged=False) не сохраняются.
+# Параметры — сырые float64/int64 массивы (teams / atk / dfn), без JSON.
+# Запись — через DATA_VERSION.own_write(): снимки не сбрасывают кэши.
+# Заполняют таблицу фиты на пути запроса с half-life по умолчанию, rebuild и
+# планировщик (SnapshotScheduler; по умолчанию выключен, BETMAKER_SNAPSHOT_INTERVAL_SEC);
+# на промахе MODEL_CACHE модель сначала ищется здесь.
+from __future__ import annotations
+from typing import Any, Awaitable, Callable, Dict
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import (MetaData, Table, Column, Integer, Float, String, Text, LargeBinary,
+                        select, delete, func, inspect)
+
+from starlette.concurrency import run_in_threadpool
+
+from db import engine
+from data_version import DATA_VERSION
+from model_cache import FittedModel, ModelKey
+
+DEFAULT_HALF_LIVES = tuple(
+    float(x) for x in os.environ.get("BETMAKER_SNAPSHOT_HALF_LIVES", "180").split(",") if x.strip()
+)
+
+_meta = MetaData()
+
+Snapshots = Table(
+    "model_snapshots", _meta,
+    Column("league_id", Integer, primary_key=True),
+    Column("seasons", String(255), primary_key=True),      # метки через запятую
+    Column("stat_type", String(16), primary_key=True),
+    Column("half_life_days", Float, primary_key=True),
+    Column("data_ver", String(64), nullable=False),        # версия данных лиги (JSON)
+    Column("teams", LargeBinary, nullable=False),          # int64
+    Column("atk", LargeBinary, nullable=False),            # float64
+    Column("dfn", LargeBinary, nullable=False),            # float64
+    Column("home_adv", Float, nullable=False),
+    Column("rho", Float, nullable=False),
+    Column("n_matches", Integer, nullable=False),
+    Column("fit_info", Text),
+    Column("built_at", Float),
+)
+
+
+class _TableState:
+    """
+    Есть ли таблица текущей схемы: положительный ответ кэшируем, отрицательный
+    перепроверяем раз в N секунд.
+    """
+
+    def __init__(self, recheck_sec: float = 30.0):
+        self.recheck_sec = recheck_sec
+        self._ready = False
+        self._checked: float | None = None
+        self._lock = threading.Lock()
+
+    def mark_ready(self) -> None:
+        with self._lock:
+            self._ready = True
+
+    def exists(self, conn) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self._ready or (self._checked is not None and now - self._checked < self.recheck_sec):
+                return self._ready
+            self._checked = now
+        ok = _current_schema(conn)
+        with self._lock:
+            self._ready = ok
+        return ok
+
+
+def _current_schema(conn) -> bool:
+    insp = inspect(conn)
+    return (insp.has_table("model_snapshots")
+            and "data_ver" in {c["name"] for c in insp.get_columns("model_snapshots")})
+
+
+def _ensure_table(conn) -> None:
+    """Создать таблицу; снимки старой схемы (без data_ver) — просто выбросить."""
+    if inspect(conn).has_table("model_snapshots") and not _current_schema(conn):
+        Snapshots.drop(conn)
+    _meta.create_all(conn)
+    _STATE.mark_ready()
+
+
+_STATE = _TableState()
+
+
+def _data_ver(key: ModelKey) -> str:
+    return json.dumps(key[4])
+
+
+def _pk_where(key: ModelKey):
+    league_id, labels, stat_type, half_life_days, _ = key
+    return (Snapshots.c.league_id == league_id, Snapshots.c.seasons == ",".join(labels),
+            Snapshots.c.stat_type == stat_type, Snapshots.c.half_life_days == half_life_days)
+
+
+def persistent(key: ModelKey) -> bool:
+    """Сохраняем только half-life по умолчанию — таблица не растёт от произвольных запросов."""
+    return key[3] in DEFAULT_HALF_LIVES
+
+
+def load(conn, key: ModelKey) -> FittedModel | None:
+    """Модель для ключа MODEL_CACHE, если снимок построен по той же версии данных."""
+    if not _STATE.exists(conn):
+        return None
+    r = conn.execute(select(Snapshots).where(*_pk_where(key))).first()
+    if r is None or r.data_ver != _data_ver(key):
+        return None
+    info = json.loads(r.fit_info) if r.fit_info else {}
+    info["snapshot"] = True
+    return FittedModel(
+        np.frombuffer(r.teams, dtype=np.int64).tolist(),
+        np.frombuffer(r.atk, dtype=np.float64).tolist(),
+        np.frombuffer(r.dfn, dtype=np.float64).tolist(),
+        float(r.home_adv), float(r.rho), int(r.n_matches), info,
+    )
+
+
+def save(conn, key: ModelKey, model: FittedModel) -> None:
+    _ensure_table(conn)
+    info = {k: v for k, v in (model.fit_info or {}).items() if k != "snapshot"}
+    conn.execute(delete(Snapshots).where(*_pk_where(key)))
+    conn.execute(Snapshots.insert().values(
+        league_id=key[0], seasons=",".join(key[1]), stat_type=key[2], half_life_days=key[3],
+        data_ver=_data_ver(key),
+        teams=np.asarray(model.teams, dtype=np.int64).tobytes(),
+        atk=np.asarray(model.atk, dtype=np.float64).tobytes(),
+        dfn=np.asarray(model.dfn, dtype=np.float64).tobytes(),
+        home_adv=float(model.home_adv), rho=float(model.rho), n_matches=int(model.n_matches),
+        fit_info=json.dumps(info), built_at=time.time(),
+    ))
+
+
+def fetch(key: ModelKey) -> FittedModel | None:
+    with engine.connect() as conn:
+        return load(conn, key)
+
+
+def store(key: ModelKey, model: FittedModel) -> None:
+    if persistent(key) and (model.fit_info or {}).get("converged", True):
+        with DATA_VERSION.own_write() as conn:
+            save(conn, key, model)
+
+
+def status(conn) -> Dict[str, Any]:
+    if not _current_schema(conn):
+        return {"exists": False}
+    rows = conn.execute(
+        select(Snapshots.c.stat_type, func.count(), func.max(Snapshots.c.built_at),
+               func.sum(func.length(Snapshots.c.atk) + func.length(Snapshots.c.dfn)
+                        + func.length(Snapshots.c.teams)))
+        .group_by(Snapshots.c.stat_type)
+    ).all()
+    return {
+        "exists": True,
+        "half_lives": list(DEFAULT_HALF_LIVES),
+        "by_stat": {r[0]: {"models": int(r[1]), "built_at": r[2], "param_bytes": int(r[3] or 0)}
+                    for r in rows},
+    }
+
+
+def clear(conn) -> Dict[str, Any]:
+    if not _current_schema(conn):
+        return {"deleted": 0}
+    return {"deleted": conn.execute(delete(Snapshots)).rowcount}
+
+
+# =============== фоновый пересчёт ===============
+class SnapshotScheduler:
+    """
+    Раз в interval секунд смотрит версию таблицы matches (data_version); после
+    смены (и один раз при старте) вызывает refit() — тот перефичивает все лиги ×
+    статы × half-life по умолчанию и пишет снимки. interval=0 — выключен.
+    last_error — исключение из refit() или последняя ошибка фита из его отчёта.
+    """
+
+    def __init__(self, refit: Callable[[], Awaitable[Dict[str, Any]]], interval: float):
+        self.refit = refit
+        self.interval = float(interval)
+        self._task: asyncio.Task | None = None
+        self._seen: int | None = None
+        self.runs = 0
+        self.last: Dict[str, Any] | None = None
+        self.last_error: str | None = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                ver = await run_in_threadpool(DATA_VERSION.table, "matches")
+                if ver != self._seen:
+                    self.last = await self.refit()
+                    self._seen = ver
+                    self.runs += 1
+                    self.last_error = self.last.get("last_error")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:          # планировщик не должен умирать от одной ошибки
+                self.last_error = repr(e)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.interval > 0,
+            "running": self._task is not None and not self._task.done(),
+            "interval": self.interval,
+            "runs": self.runs,
+            "seen_matches_version": self._seen,
+            "last": self.last,
+            "last_error": self.last_error,
+        }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="model_snapshots: persisted league model fits")
+    ap.add_argument("command", choices=["rebuild", "status", "clear"])
+    ap.add_argument("--force", action="store_true", help="rebuild: очистить снимки и зафитить заново")
+    args = ap.parse_args(argv)
+    if args.command == "rebuild":
+        if args.force:
+            with engine.begin() as conn:
+                print(clear(conn))
+        # окна сезонов и фит — те же функции, что у эндпоинтов
+        from app import refit_snapshots
+        print(asyncio.run(refit_snapshots()))
+        return
+    with engine.begin() as conn:
+        print(status(conn) if args.command == "status" else clear(conn))
+
+
+if __name__ == "__main__":
+    main()
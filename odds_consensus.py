@@ -0,0 +1,385 @@
+# odds_consensus.py — материализованный консенсус коэффициентов по матчам (для /api/h2h_odds)
+#
+#   python -m odds_consensus rebuild    # пересобрать с нуля
+#   python -m odds_consensus refresh    # только матчи с новыми строками odds_* (по max id)
+#   python -m odds_consensus status
+#
+# Свежесть: в мете лежат водяной знак (max id) и отпечаток содержимого каждой
+# odds-таблицы (data_version.content_aggregates) на момент сборки. Таблица свежая,
+# только пока отпечаток совпадает с текущим — правки и удаления старых строк тоже
+# видны. refresh инкрементален, если строки до водяного знака не менялись, иначе
+# пересобирает. Без целочисленного id строки (одиночный PK или колонка id)
+# материализованный путь выключен — h2h считает по сырым строкам.
+#
+# Строка = (match_id, market, state, line): суммы и количества непустых значений,
+# чтобы средние по нескольким состояниям складывались без повторного чтения сырых строк.
+#   market '1x2': s1/n1 home, s2/n2 draw, s3/n3 away, line = 0, все строки букмекеров;
+#   market 'ou' : s1/n1 line, s2/n2 over, s3/n3 under — по одной строке на букмекера
+#                 для каждой линии (первая по id, как в сыром запросе).
+# state: 1 — closing, 0 — opening, -1 — is_closing пустой (в 1X2 без колонки все строки = 1).
+from __future__ import annotations
+from typing import Any, Dict, List, Tuple
+import argparse
+import threading
+import time
+
+from sqlalchemy import (MetaData, Table, Column, Integer, Float, String, select, func,
+                        literal, delete, union, inspect)
+
+from db import engine, Odds1x2, OddsOU, ODDS_1X2_COLUMNS, ODDS_OU_COLUMNS
+from data_version import DATA_VERSION, content_aggregates, content_digest
+
+_meta = MetaData()
+
+Consensus = Table(
+    "odds_consensus", _meta,
+    Column("match_id", Integer, primary_key=True),
+    Column("market", String(8), primary_key=True),
+    Column("state", Integer, primary_key=True),
+    Column("line", Float, primary_key=True),
+    Column("n_rows", Integer, nullable=False),
+    Column("s1", Float), Column("n1", Integer),
+    Column("s2", Float), Column("n2", Integer),
+    Column("s3", Float), Column("n3", Integer),
+)
+
+ConsensusMeta = Table(
+    "odds_consensus_meta", _meta,
+    Column("key", String(32), primary_key=True),
+    Column("value", Float),
+)
+
+
+def _pk(tbl: Table | None) -> Column | None:
+    """Монотонный id строки: одиночный PK или колонка id; иначе None (таблица не используется)."""
+    if tbl is None:
+        return None
+    cols = list(tbl.primary_key.columns)
+    if len(cols) == 1:
+        return cols[0]
+    return tbl.c.get("id")
+
+
+def _materializable() -> bool:
+    return _pk(Odds1x2) is not None and _pk(OddsOU) is not None
+
+
+def _state(close_col):
+    return func.coalesce(close_col, -1) if close_col is not None else literal(1)
+
+
+def _select_1x2(match_filter=None):
+    close_col = ODDS_1X2_COLUMNS["is_closing"]
+    st = _state(close_col)
+    q = select(
+        Odds1x2.c.match_id, literal("1x2"), st.label("state"), literal(0.0),
+        func.count(),
+        func.sum(ODDS_1X2_COLUMNS["home"]), func.count(ODDS_1X2_COLUMNS["home"]),
+        func.sum(ODDS_1X2_COLUMNS["draw"]), func.count(ODDS_1X2_COLUMNS["draw"]),
+        func.sum(ODDS_1X2_COLUMNS["away"]), func.count(ODDS_1X2_COLUMNS["away"]),
+    )
+    if match_filter is not None:
+        q = q.where(Odds1x2.c.match_id.in_(match_filter))
+    return q.group_by(Odds1x2.c.match_id, st)
+
+
+def _select_ou(match_filter=None):
+    bk_col    = ODDS_OU_COLUMNS["bookmaker"]
+    close_col = ODDS_OU_COLUMNS["is_closing"]
+    line_col  = ODDS_OU_COLUMNS["line"]
+    st = _state(close_col)
+
+    partition = [OddsOU.c.match_id, st, line_col]
+    if bk_col is not None:
+        partition.append(func.coalesce(bk_col, ""))
+    ranked = (
+        select(
+            OddsOU.c.match_id.label("match_id"), st.label("state"), line_col.label("line"),
+            ODDS_OU_COLUMNS["over"].label("over"), ODDS_OU_COLUMNS["under"].label("under"),
+            func.row_number().over(partition_by=partition, order_by=_pk(OddsOU)).label("rn"),
+        )
+        .where(line_col.isnot(None))
+    )
+    if match_filter is not None:
+        ranked = ranked.where(OddsOU.c.match_id.in_(match_filter))
+    ranked = ranked.subquery()
+    return (
+        select(
+            ranked.c.match_id, literal("ou"), ranked.c.state, ranked.c.line,
+            func.count(),
+            func.sum(ranked.c.line), func.count(ranked.c.line),
+            func.sum(ranked.c.over), func.count(ranked.c.over),
+            func.sum(ranked.c.under), func.count(ranked.c.under),
+        )
+        .where(ranked.c.rn == 1)
+        .group_by(ranked.c.match_id, ranked.c.state, ranked.c.line)
+    )
+
+
+def _source_max_ids(conn) -> Tuple[int, int]:
+    m1 = conn.execute(select(func.max(_pk(Odds1x2)))).scalar()
+    m2 = conn.execute(select(func.max(_pk(OddsOU)))).scalar()
+    return int(m1 or 0), int(m2 or 0)
+
+
+def _fp_columns(tbl: Table, cols: Dict[str, Column | None]) -> List[Any]:
+    """Всё, от чего зависит консенсус: match_id, значения, флаг закрытия, букмекер (по длине)."""
+    out: List[Any] = [tbl.c.match_id]
+    out += [c for k, c in cols.items() if c is not None and k != "bookmaker"]
+    if cols["bookmaker"] is not None:
+        out.append(func.length(cols["bookmaker"]))
+    return out
+
+
+def _source_prints(conn, upto: Tuple[int, int] | None = None) -> Tuple[float, float]:
+    """
+    Отпечатки odds_1x2 / odds_ou (строки с id <= upto, если задан). В мете значения
+    Float, поэтому хэш урезан до 52 бит — представим точно.
+    """
+    out = []
+    for i, (tbl, cols) in enumerate(((Odds1x2, ODDS_1X2_COLUMNS), (OddsOU, ODDS_OU_COLUMNS))):
+        pk = _pk(tbl)
+        q = select(*content_aggregates(pk, _fp_columns(tbl, cols)))
+        if upto is not None:
+            q = q.where(pk <= upto[i])
+        out.append(float(int(content_digest(conn.execute(q).one())[:13], 16)))
+    return out[0], out[1]
+
+
+def _write_meta(conn, max_ids: Tuple[int, int], prints: Tuple[float, float]) -> None:
+    conn.execute(delete(ConsensusMeta))
+    conn.execute(ConsensusMeta.insert(), [
+        {"key": "odds_1x2_max_id", "value": max_ids[0]},
+        {"key": "odds_ou_max_id", "value": max_ids[1]},
+        {"key": "odds_1x2_fp", "value": prints[0]},
+        {"key": "odds_ou_fp", "value": prints[1]},
+        {"key": "built_at", "value": time.time()},
+    ])
+
+
+def _built(wm: Dict[str, float]) -> Tuple[Tuple[int, int], Tuple[float, float] | None]:
+    ids = (int(wm.get("odds_1x2_max_id", -1)), int(wm.get("odds_ou_max_id", -1)))
+    if "odds_1x2_fp" not in wm or "odds_ou_fp" not in wm:
+        return ids, None                 # мета старого формата — только rebuild
+    return ids, (wm["odds_1x2_fp"], wm["odds_ou_fp"])
+
+
+def _read_meta(conn) -> Dict[str, float]:
+    return {r.key: r.value for r in conn.execute(select(ConsensusMeta.c.key, ConsensusMeta.c.value)).all()}
+
+
+def _insert_cols():
+    return [c.name for c in Consensus.columns]
+
+
+def _require_source():
+    if Odds1x2 is None or OddsOU is None:
+        raise RuntimeError("odds_1x2 / odds_ou not found")
+    if ODDS_OU_COLUMNS["line"] is None or ODDS_1X2_COLUMNS["home"] is None:
+        raise RuntimeError("odds_* tables lack required columns")
+    if not _materializable():
+        raise RuntimeError("odds_* tables have no integer row id (single-column PK or id)")
+
+
+def rebuild(conn) -> Dict[str, Any]:
+    """Полная пересборка таблицы."""
+    _require_source()
+    t0 = time.perf_counter()
+    _meta.create_all(conn)
+    max_ids = _source_max_ids(conn)
+    conn.execute(delete(Consensus))
+    conn.execute(Consensus.insert().from_select(_insert_cols(), _select_1x2()))
+    conn.execute(Consensus.insert().from_select(_insert_cols(), _select_ou()))
+    _write_meta(conn, max_ids, _source_prints(conn))
+    n = conn.execute(select(func.count()).select_from(Consensus)).scalar_one()
+    return {"mode": "rebuild", "rows": int(n), "max_ids": list(max_ids),
+            "ms": round((time.perf_counter() - t0) * 1000.0, 1)}
+
+
+def refresh(conn) -> Dict[str, Any]:
+    """
+    Инкрементально: пересчитываем только матчи, у которых появились строки
+    с id больше сохранённого водяного знака. Если строки до водяного знака
+    изменились (отпечаток не совпал: правка, удаление) — полная пересборка.
+    """
+    _require_source()
+    if not inspect(conn).has_table("odds_consensus_meta"):
+        return rebuild(conn)
+    (wm1, wm2), built = _built(_read_meta(conn))
+    if built is None or _source_prints(conn, (wm1, wm2)) != built:
+        return rebuild(conn)
+    t0 = time.perf_counter()
+    max_ids = _source_max_ids(conn)
+
+    affected = [int(r[0]) for r in conn.execute(union(
+        select(Odds1x2.c.match_id).where(_pk(Odds1x2) > wm1),
+        select(OddsOU.c.match_id).where(_pk(OddsOU) > wm2),
+    )).all()]
+    if affected:
+        conn.execute(delete(Consensus).where(Consensus.c.match_id.in_(affected)))
+        conn.execute(Consensus.insert().from_select(_insert_cols(), _select_1x2(affected)))
+        conn.execute(Consensus.insert().from_select(_insert_cols(), _select_ou(affected)))
+    _write_meta(conn, max_ids, _source_prints(conn))
+    return {"mode": "refresh", "matches": len(affected), "max_ids": list(max_ids),
+            "ms": round((time.perf_counter() - t0) * 1000.0, 1)}
+
+
+def status(conn) -> Dict[str, Any]:
+    if not _materializable():
+        return {"exists": False, "disabled": "no integer row id in odds_*"}
+    if not inspect(conn).has_table("odds_consensus_meta"):
+        return {"exists": False}
+    wm = _read_meta(conn)
+    ids, built = _built(wm)
+    return {
+        "exists": True,
+        "rows": int(conn.execute(select(func.count()).select_from(Consensus)).scalar_one()),
+        "built_at": wm.get("built_at"),
+        "watermark": list(ids),
+        "source_max_ids": list(_source_max_ids(conn)),
+        "fresh": built is not None and _source_prints(conn) == built,
+    }
+
+
+# =============== чтение для h2h ===============
+class _Freshness:
+    """
+    Ответ is_fresh, закэшированный по версиям odds-таблиц (data_version): на SQLite
+    любой чужой коммит (ingest, CLI rebuild/refresh) меняет версию; без PRAGMA
+    data_version — ещё и не реже раза в check_interval. Отпечаток всей odds-таблицы —
+    сотни мс, поэтому перепроверка идёт в фоновом потоке, а до её конца ответ False:
+    h2h считает по сырым строкам, это всегда верно.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key: Tuple[int, ...] | None = None
+        self._checked = 0.0
+        self._fresh = False
+        self._running = False
+        self.checks = 0
+        self.last_error: str | None = None
+
+    def _check(self, key) -> None:
+        fresh = False
+        try:
+            with engine.connect() as conn:
+                if inspect(conn).has_table("odds_consensus_meta"):
+                    _, built = _built(_read_meta(conn))
+                    fresh = built is not None and _source_prints(conn) == built
+            err = None
+        except Exception as e:
+            err = repr(e)
+        with self._lock:
+            self._key, self._checked, self._fresh = key, time.monotonic(), fresh
+            self._running = False
+            self.checks += 1
+            self.last_error = err
+
+    def get(self) -> bool:
+        key = DATA_VERSION.stamp("odds_1x2", "odds_ou")
+        with self._lock:
+            if key == self._key and (DATA_VERSION.sees_updates
+                                     or time.monotonic() - self._checked < DATA_VERSION.check_interval):
+                return self._fresh
+            if not self._running:
+                self._running = True
+                threading.Thread(target=self._check, args=(key,), name="odds-consensus-fresh",
+                                 daemon=True).start()
+            return False
+
+
+_FRESHNESS = _Freshness()
+
+
+def is_fresh() -> bool:
+    """Таблица есть и построена по текущему содержимому обеих odds-таблиц (см. _Freshness)."""
+    if Odds1x2 is None or OddsOU is None or not _materializable():
+        return False
+    return _FRESHNESS.get()
+
+
+def _mean(groups, k: int):
+    s = sum(float(getattr(g, f"s{k}") or 0.0) for g in groups)
+    n = sum(int(getattr(g, f"n{k}") or 0) for g in groups)
+    return s / n if n else None
+
+
+def read_1x2(conn, match_ids: List[int], use_closing: bool, with_open: bool):
+    """То же, что h2h._consensus_1x2 без фильтра по букмекеру."""
+    rows = conn.execute(
+        select(Consensus).where(Consensus.c.match_id.in_(match_ids), Consensus.c.market == "1x2")
+    ).all()
+    by_mid: Dict[int, Dict[int, Any]] = {}
+    for r in rows:
+        by_mid.setdefault(int(r.match_id), {})[int(r.state)] = r
+
+    has_close_col = ODDS_1X2_COLUMNS["is_closing"] is not None
+    out = {"close": ({}, {}, {}), "open": ({}, {}, {})}
+    for mid, by_st in by_mid.items():
+        close_groups = [by_st[1]] if 1 in by_st else []
+        if not (use_closing and has_close_col):
+            close_groups = list(by_st.values())
+        open_groups = [by_st[0]] if (with_open and 0 in by_st) else []
+        for state, groups in (("close", close_groups), ("open", open_groups)):
+            if not groups:
+                continue
+            for k, dst in enumerate(out[state], start=1):
+                dst[mid] = _mean(groups, k)
+    return out
+
+
+def read_ou(conn, match_ids: List[int], targets: List[float], line_tol: float, with_open: bool):
+    """
+    То же, что h2h._consensus_ou без фильтра по букмекеру: строки всех целей
+    читаются одним запросом и раскладываются по целям в Python. Если у матча
+    в пределах line_tol от цели несколько разных линий, ближайшая линия у
+    разных букмекеров может отличаться — тогда None (нужны сырые строки).
+    """
+    states = [1, 0] if with_open else [1]
+    out = {float(t): {"close": ({}, {}, {}), "open": ({}, {}, {})} for t in targets}
+    if not targets:
+        return out
+    lo = min(targets) - float(line_tol); hi = max(targets) + float(line_tol)
+    rows = conn.execute(
+        select(Consensus)
+        .where(Consensus.c.match_id.in_(match_ids), Consensus.c.market == "ou",
+               Consensus.c.state.in_(states), Consensus.c.line.between(lo, hi))
+    ).all()
+
+    for t, by_state in out.items():
+        seen = set()
+        for r in rows:
+            if abs(r.line - t) > float(line_tol):
+                continue
+            key = (int(r.match_id), int(r.state))
+            if key in seen:
+                return None
+            seen.add(key)
+            for k, dst in enumerate(by_state["close" if r.state == 1 else "open"], start=1):
+                dst[key[0]] = _mean([r], k)
+    return out
+
+
+def ou_lines(conn, match_ids: List[int]) -> List[float]:
+    """Различные OU-линии у матчей (lines=all)."""
+    q = (select(Consensus.c.line).distinct()
+         .where(Consensus.c.match_id.in_(match_ids), Consensus.c.market == "ou"))
+    return sorted(float(r[0]) for r in conn.execute(q).all())
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="odds_consensus: materialized per-match odds consensus")
+    ap.add_argument("command", choices=["rebuild", "refresh", "status"])
+    args = ap.parse_args(argv)
+    with engine.begin() as conn:
+        if args.command == "rebuild":
+            print(rebuild(conn))
+        elif args.command == "refresh":
+            print(refresh(conn))
+        else:
+            print(status(conn))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# refdata.py — кэш справочников (leagues / seasons / teams) для app, h2h, handicaps
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Tuple
+import threading
+import time
+
+from sqlalchemy import MetaData, select
+
+from data_version import DATA_VERSION
+
+
+class RefSnapshot:
+    """
+    Неизменяемый снимок справочников. Все поиски — O(1) по словарям.
+    """
+    __slots__ = ("leagues", "league_order", "season_label", "season_league",
+                 "season_current", "season_id_by_label", "seasons_by_league", "team_name",
+                 "stamp", "loaded_at")
+
+    def __init__(self, leagues: Dict[int, Dict[str, Any]], league_order: List[int],
+                 season_label: Dict[int, str], season_league: Dict[int, int],
+                 season_current: Dict[int, int], team_name: Dict[int, str], stamp):
+        self.leagues = leagues
+        self.league_order = league_order
+        self.season_label = season_label
+        self.season_league = season_league
+        self.season_current = season_current
+        self.season_id_by_label: Dict[Tuple[int, str], int] = {
+            (lid, season_label[sid]): sid for sid, lid in season_league.items()
+        }
+        self.seasons_by_league: Dict[int, Dict[int, str]] = {}
+        for sid, lid in season_league.items():
+            self.seasons_by_league.setdefault(lid, {})[sid] = season_label[sid]
+        self.team_name = team_name
+        self.stamp = stamp
+        self.loaded_at = time.time()
+
+    def team(self, team_id: int) -> str:
+        return self.team_name.get(team_id, str(team_id))
+
+    def season_ids(self, league_id: int, labels: Iterable[str]) -> Dict[str, int]:
+        """label -> season_id для сезонов лиги; неизвестные метки пропускаются."""
+        out = {}
+        for lbl in labels:
+            sid = self.season_id_by_label.get((league_id, lbl))
+            if sid is not None:
+                out[lbl] = sid
+        return out
+
+    def league_seasons(self, league_id: int) -> Dict[int, str]:
+        """season_id -> label для всех сезонов лиги (словарь снимка — не изменять)."""
+        return self.seasons_by_league.get(league_id, {})
+
+
+def _load(conn, meta: MetaData, stamp) -> RefSnapshot:
+    Leagues = meta.tables["leagues"]
+    Seasons = meta.tables["seasons"]
+    Teams = meta.tables["teams"]
+
+    lrows = conn.execute(
+        select(Leagues.c.id, Leagues.c.country, Leagues.c.name)
+        .order_by(Leagues.c.country, Leagues.c.name)
+    ).all()
+    srows = conn.execute(select(Seasons.c.id, Seasons.c.league_id, Seasons.c.label, Seasons.c.is_current)).all()
+    trows = conn.execute(select(Teams.c.id, Teams.c.name)).all()
+
+    return RefSnapshot(
+        leagues={int(r.id): {"id": int(r.id), "country": r.country, "name": r.name} for r in lrows},
+        league_order=[int(r.id) for r in lrows],
+        season_label={int(r.id): r.label for r in srows},
+        season_league={int(r.id): int(r.league_id) for r in srows},
+        season_current={int(r.id): int(r.is_current or 0) for r in srows},
+        team_name={int(r.id): r.name for r in trows},
+        stamp=stamp,
+    )
+
+
+REF_TABLES = ("leagues", "seasons", "teams")
+
+
+class RefData:
+    """
+    Справочники грузятся один раз и перечитываются только при смене версии
+    таблиц leagues/seasons/teams (data_version проверяет её не чаще раза в интервал).
+    """
+
+    def __init__(self):
+        self._snap: RefSnapshot | None = None
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.checks = 0
+
+    def get(self, conn, meta: MetaData) -> RefSnapshot:
+        stamp = DATA_VERSION.stamp(*REF_TABLES)
+        with self._lock:
+            self.checks += 1
+            if self._snap is not None and self._snap.stamp == stamp:
+                return self._snap
+
+        snap = _load(conn, meta, stamp)
+        with self._lock:
+            self._snap = snap
+            self.loads += 1
+        return snap
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._snap = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snap = self._snap
+            return {
+                "loaded": snap is not None,
+                "loads": self.loads,
+                "checks": self.checks,
+                "leagues": len(snap.leagues) if snap else 0,
+                "seasons": len(snap.season_label) if snap else 0,
+                "teams": len(snap.team_name) if snap else 0,
+                "stamp": list(snap.stamp) if snap else None,
+            }
+
+
+REFDATA = RefData()
@@ -0,0 +1,235 @@
+# response_cache.py — кэш готовых ответов GET-эндпоинтов + ETag/304
+#
+# Ключ = (path, нормализованный query, версия данных). Пока версия не сменилась,
+# повторный запрос отдаётся из памяти без SQL и без сериализации; клиент с
+# совпавшим If-None-Match получает 304 без тела. Одинаковые запросы, пришедшие,
+# пока первый ещё считается, ждут его ответ (coalesce), а не считают заново.
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Tuple
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+import hashlib
+import os
+import threading
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from coalesce import Coalescer
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "content_type")
+
+    def __init__(self, body: bytes, etag: str, content_type: bytes):
+        self.body = body
+        self.etag = etag
+        self.content_type = content_type
+
+
+def normalize_query(query_string: bytes) -> Tuple[Tuple[str, str], ...]:
+    """Параметры, отсортированные по имени; порядок значений внутри (team_ids=2,1) сохраняется."""
+    pairs = parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+    return tuple(sorted(pairs))
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """
+    LRU по числу записей и суммарному размеру тел. version_fn() -> hashable:
+    любая смена версии делает все старые ключи недостижимыми (они вытесняются LRU).
+    Саму версию спрашиваем не чаще раза в check_interval секунд.
+    """
+
+    def __init__(self, version_fn: Callable[[], Any], maxsize: int = 512,
+                 max_bytes: int = 64 * 1024 * 1024, check_interval: float = 2.0):
+        self.version_fn = version_fn
+        self.maxsize = max(1, int(maxsize))
+        self.max_bytes = int(max_bytes)
+        self.check_interval = float(check_interval)
+        self._data: "OrderedDict[Tuple, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self._version: Any = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    # ---- версия данных
+    def version_due(self) -> bool:
+        return time.monotonic() - self._checked >= self.check_interval
+
+    def refresh_version(self) -> Any:
+        v = self.version_fn()
+        with self._lock:
+            if v != self._version:
+                self._data.clear()
+                self._bytes = 0
+            self._version = v
+            self._checked = time.monotonic()
+        return v
+
+    @property
+    def version(self) -> Any:
+        return self._version
+
+    # ---- записи
+    def get(self, key: Tuple) -> CachedResponse | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item
+
+    def put(self, key: Tuple, item: CachedResponse) -> None:
+        size = len(item.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._data[key] = item
+            self._bytes += size
+            while len(self._data) > self.maxsize or self._bytes > self.max_bytes:
+                _, ev = self._data.popitem(last=False)
+                self._bytes -= len(ev.body)
+                self.evictions += 1
+
+    def note_not_modified(self) -> None:
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "bytes": self._bytes,
+                "maxsize": self.maxsize,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "version": repr(self._version),
+            }
+
+
+class ResponseCacheMiddleware:
+    """
+    ASGI-middleware: кэширует 200-ответы GET для путей с заданными префиксами.
+    Ставит сильный ETag и Cache-Control (по умолчанию no-cache — браузер всегда
+    ревалидирует, а сервер отвечает 304, пока версия данных та же).
+    """
+
+    def __init__(self, app, cache: ResponseCache, prefixes: Tuple[str, ...],
+                 cache_control: str = "no-cache", flights: Coalescer | None = None):
+        self.app = app
+        self.cache = cache
+        self.prefixes = tuple(prefixes)
+        self.cache_control = cache_control.encode("latin-1")
+        self.flights = flights or Coalescer("responses")
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] != "GET"
+                or not scope["path"].startswith(self.prefixes)):
+            await self.app(scope, receive, send)
+            return
+
+        if self.cache.version_due():
+            await run_in_threadpool(self.cache.refresh_version)
+        version = self.cache.version
+        key = (scope["path"], normalize_query(scope.get("query_string", b"")), version)
+        inm = None
+        for name, value in scope.get("headers", []):
+            if name == b"if-none-match":
+                inm = value.decode("latin-1")
+                break
+
+        item = self.cache.get(key)
+        if item is not None:
+            await self._send_cached(send, item, inm)
+            return
+
+        async def render():
+            start: Dict[str, Any] = {}
+            chunks: List[bytes] = []
+
+            async def capture(message):
+                if message["type"] == "http.response.start":
+                    start.update(message)
+                elif message["type"] == "http.response.body":
+                    chunks.append(message.get("body", b""))
+
+            await self.app(scope, receive, capture)
+            return self._store(key, start, b"".join(chunks))
+
+        status, headers, body, item = await self.flights.run(key, render, label=scope["path"])
+        if item is None:
+            await send({"type": "http.response.start", "status": status,
+                        "headers": headers + [(b"content-length", str(len(body)).encode())]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        await self._send_cached(send, item, inm, extra_headers=headers)
+
+    def _store(self, key, start, body: bytes):
+        """(status, headers, body, CachedResponse | None); кэшируются только 200 без cookie."""
+        headers = [(k, v) for k, v in start.get("headers", []) if k != b"content-length"]
+        status = start.get("status", 200)
+        ctype = next((v for k, v in headers if k == b"content-type"), b"application/json")
+        if status != 200 or any(k == b"set-cookie" for k, _ in headers):
+            return status, headers, body, None
+        item = CachedResponse(body, make_etag(body), ctype)
+        self.cache.put(key, item)
+        return status, headers, body, item
+
+    async def _send_cached(self, send, item: CachedResponse, inm: str | None, extra_headers=None):
+        base = [(b"etag", item.etag.encode("latin-1")), (b"cache-control", self.cache_control)]
+        if etag_matches(inm, item.etag):
+            self.cache.note_not_modified()
+            await send({"type": "http.response.start", "status": 304, "headers": base})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        headers = [(k, v) for k, v in (extra_headers or []) if k not in (b"etag", b"cache-control")]
+        if not any(k == b"content-type" for k, _ in headers):
+            headers.append((b"content-type", item.content_type))
+        headers += base + [(b"content-length", str(len(item.body)).encode())]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": item.body})
+
+
+def default_cache() -> ResponseCache:
+    """Кэш, привязанный к версиям данных из data_version (любая смена таблиц -> сброс)."""
+    from data_version import DATA_VERSION, TRACKED
+
+    return ResponseCache(
+        lambda: DATA_VERSION.stamp(*TRACKED),
+        maxsize=int(os.environ.get("BETMAKER_RESPONSE_CACHE_SIZE", "512")),
+        max_bytes=int(os.environ.get("BETMAKER_RESPONSE_CACHE_MB", "64")) * 1024 * 1024,
+        check_interval=DATA_VERSION.check_interval,
+    )
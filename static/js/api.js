@@ -57,8 +57,40 @@ export async function getTeams(leagueId) {
   return Array.isArray(data) ? data : [];
 }
 
+// статы, которые /api/timeseries/multi отдаёт одним запросом: stat -> префикс полей
+const MULTI_STAT_PREFIX = { goals: 'goals', corners: 'corners', cards: 'cards', shots: 'shots', sot: 'sot' };
+const multiSeriesCache = new Map(); // `${lid}|${ids}|${seasons}` -> Promise<payload>
+const MULTI_SERIES_MAX = 16;        // внутри лиги: самые старые выборки вытесняются
+
+// app.js сбрасывает при смене лиги — вместе со своими кэшами
+export function clearSeriesCache() { multiSeriesCache.clear(); }
+
+function fetchMultiSeries(lid, ids, sez) {
+  const key = `${lid}|${ids}|${sez}`;
+  if (!multiSeriesCache.has(key)) {
+    if (multiSeriesCache.size >= MULTI_SERIES_MAX) multiSeriesCache.delete(multiSeriesCache.keys().next().value);
+    const url = `/api/timeseries/multi?league_id=${lid}&team_ids=${ids}&seasons=${encodeURIComponent(sez)}`;
+    const p = fetchJSON(url).catch(e => { multiSeriesCache.delete(key); throw e; });
+    multiSeriesCache.set(key, p);
+  }
+  return multiSeriesCache.get(key);
+}
+
+// точки одной статы из мульти-ответа: как у старых /api/timeseries_* (счёт — по этой стате)
+function projectStat(data, statType) {
+  const pre = MULTI_STAT_PREFIX[statType];
+  const points = (Array.isArray(data?.points) ? data.points : [])
+    .filter(p => p[`${pre}_for`] !== null && p[`${pre}_for`] !== undefined)
+    .map(p => {
+      const score = p.scores?.[statType] ?? p.score;
+      return { ...p, score, match_label: `${p.match_home} ${score} ${p.match_away}` };
+    });
+  return { seasons: Array.isArray(data?.seasons) ? data.seasons : [], points };
+}
+
 /**
  * statType: 'goals' | 'corners' | 'cards' | 'shots' | 'sot' | 'fouls'
+ * Пять основных стат приходят одним запросом и кэшируются — смена вкладки без похода на сервер.
  */
 export async function getTimeSeries({ leagueId, teamIds, seasons, statType='goals' }) {
   const lid = requireInt('leagueId', leagueId);
@@ -66,15 +98,13 @@ export async function getTimeSeries({ leagueId, teamIds, seasons, statType='goal
   const sez = (seasons || '').toString().trim();
   if (!ids || !sez) throw new Error('teamIds and seasons are required');
 
-  let path = '/api/timeseries';
-  if (statType === 'corners') path = '/api/timeseries_corners';
-  else if (statType === 'cards') path = '/api/timeseries_cards';
-  else if (statType === 'shots') path = '/api/timeseries_shots';
-  else if (statType === 'sot')   path = '/api/timeseries_sot';
-  else if (statType === 'fouls') path = '/api/timeseries_fouls';
-
-  const url = `${path}?league_id=${lid}&team_ids=${ids}&seasons=${encodeURIComponent(sez)}`;
-  const data = await fetchJSON(url);
+  let data;
+  if (MULTI_STAT_PREFIX[statType]) {
+    data = projectStat(await fetchMultiSeries(lid, ids, sez), statType);
+  } else {
+    const path = statType === 'fouls' ? '/api/timeseries_fouls' : '/api/timeseries';
+    data = await fetchJSON(`${path}?league_id=${lid}&team_ids=${ids}&seasons=${encodeURIComponent(sez)}`);
+  }
   if (!data || !Array.isArray(data.points)) {
     console.warn('[API] timeseries returned no points for', { leagueId, teamIds, seasons, statType });
     return { seasons: Array.isArray(data?.seasons) ? data.seasons : [], points: [] };
@@ -94,6 +124,43 @@ export async function getSuperProg({ leagueId, teamId, seasons, haMode='all', st
   return await fetchJSON(url);
 }
 
+/**
+ * Один фит на лигу: λ для всех команд (против «среднего» соперника) или заданных пар.
+ * pairs: [{ team_id, opponent_id?, ha_mode? }]
+ */
+export async function getSuperProgBatch({ leagueId, seasons, pairs, haMode='all', statType='goals', halfLifeDays=180 }) {
+  const lid = requireInt('leagueId', leagueId);
+  const sez = (seasons || '').toString().trim();
+  if (!sez) throw new Error('seasons required');
+  const body = {
+    league_id: lid, seasons: sez, stat_type: statType || 'goals', half_life_days: halfLifeDays,
+    pairs: (pairs || []).map(p => ({ ha_mode: haMode || 'all', ...p })),
+  };
+  const r = await fetch('/api/superprog/batch', {
+    method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(body),
+  });
+  if (!r.ok) {
+    const txt = await r.text().catch(()=> '');
+    console.error('[API ERROR]', r.status, '/api/superprog/batch', txt);
+    throw new Error(`${r.status} ${txt || 'Request failed'}`);
+  }
+  return await r.json();
+}
+
+/**
+ * Прогнозы ▲ prog / ◆ kprog / ★ bprog для команд сезона — считаются на сервере
+ * (/api/forecast), приходят только значения и веса: { teams: [{ team_id, n, metrics: { key: {...} } }] }.
+ */
+export async function getForecast({ leagueId, teamIds, season, statType='goals', haMode='all', k=2, tol=0 }) {
+  const lid = requireInt('leagueId', leagueId);
+  const ids = (teamIds || '').toString().trim();
+  const sez = (season || '').toString().trim();
+  if (!ids || !sez) throw new Error('teamIds and season are required');
+  const url = `/api/forecast?league_id=${lid}&team_ids=${ids}&season=${encodeURIComponent(sez)}`
+            + `&stat_type=${statType || 'goals'}&ha_mode=${haMode || 'all'}&k=${k}&tol=${tol}`;
+  return await fetchJSON(url);
+}
+
 // числа
 export function toNum(x){ const n = Number(x); return Number.isFinite(n) ? n : null; }
 export function mean(arr){ const a = arr.map(toNum).filter(v=>v!==null); const n=a.length; if(!n) return null; return a.reduce((s,v)=>s+v,0)/n; }
@@ -1,5 +1,5 @@
 // /js/app.js
-import { getLeagues, getSeasons, getTeams, getTimeSeries, getSuperProg } from './api.js';
+import { getLeagues, getSeasons, getTeams, getTimeSeries, getSuperProgBatch, getForecast as getForecastApi, clearSeriesCache } from './api.js';
 import { buildSeasonShell, fillChartsForSeason } from './charts.js';
 
 const els = {
@@ -33,8 +33,9 @@ let leagueId = null;
 let seasonsAll = [];
 let teamNames = {};
 let cache = {};      // сезонные точки (по выбору)
-let histCache = {};  // история по команде (мультисезон)
+let forecastCache = {}; // прогнозы ▲◆★ с сервера (по сезону/режиму)
 let sprogCache = {}; // суперпрогнозы
+let sprogBatchCache = {}; // батчи суперпрога: один запрос на лигу/окно/режим
 
 // публичные настройки для charts.js
 window.__GE_STATE__ = {
@@ -48,8 +49,6 @@ window.__GE_STATE__ = {
   getSeasonsAll: () => seasonsAll,
   getLeagueId:   () => leagueId,
   getCache:      () => cache,
-  getHistCache:  () => histCache,
-  setHist(teamId, payload) { histCache[teamId] = payload; },
 };
 
 // helpers
@@ -73,22 +72,29 @@ function selectedTeamIdsRaw(){
 }
 function clearSeasonView(){ if(els.seasonView) els.seasonView.innerHTML = ''; }
 
-// ===== history helper for charts.js =====
-async function ensureHistoryLoaded(teamId){
-  const seasonsKey = seasonsAll.join(',');
-  const TYPE = window.__GE_STATE__.STAT_TYPE;
-  const cacheKey = `${TYPE}|${teamId}|${seasonsKey}`;
-  const h = histCache[cacheKey];
-  if (h) return h;
-  const resp = await getTimeSeries({
-    leagueId,
-    teamIds: String(teamId),
-    seasons: seasonsKey,
-    statType: TYPE
-  });
-  const payload = { pointsAllSeasons: Array.isArray(resp.points) ? resp.points : [], __seasonsKey: seasonsKey };
-  histCache[cacheKey] = payload;
-  return payload;
+// ===== прогнозы для charts.js =====
+// один запрос /api/forecast на выбранные команды и все метрики статы; история остаётся на сервере
+async function getForecast({ teamId, seasonLabel, metricKey }){
+  const { STAT_TYPE, HA_MODE, PATTERN_K, TOL } = window.__GE_STATE__;
+  const ids = selectedTeamIdsRaw();
+  if (!ids.includes(Number(teamId))) ids.push(Number(teamId));
+  const key = `${STAT_TYPE}|${seasonLabel}|${HA_MODE}|${PATTERN_K}|${TOL}|${ids.join(',')}`;
+  if (!forecastCache[key]) {
+    forecastCache[key] = getForecastApi({
+      leagueId, teamIds: ids.join(','), season: seasonLabel,
+      statType: STAT_TYPE, haMode: HA_MODE, k: PATTERN_K, tol: TOL,
+    }).then(resp => {
+      const byTeam = {};
+      (resp?.teams || []).forEach(t => { byTeam[t.team_id] = t.metrics || {}; });
+      return byTeam;
+    }).catch((e)=>{
+      console.warn('[forecast] backend error', e?.message || e);
+      delete forecastCache[key];
+      return null;
+    });
+  }
+  const byTeam = await forecastCache[key];
+  return byTeam?.[Number(teamId)]?.[metricKey] ?? null;
 }
 
 // окно сезонов для бекенда суперпрога: текущий + 5 прошлых
@@ -102,12 +108,26 @@ async function getSuperProgForecast({ teamId, seasonLabel, metricKey }){
   const trainSeasons = (idx >= 0) ? seasonsAll.slice(idx, idx+6) : [seasonLabel];
   const seasonsParam = trainSeasons.join(',');
 
-  const resp = await getSuperProg({
-    leagueId, teamId, seasons: seasonsParam, haMode: HA, statType: TYPE, halfLifeDays: 180
-  }).catch((e)=>{
-    console.warn('[sprog] backend error', e?.message || e);
-    return null;
-  });
+  // один батч на все команды лиги вместо запроса на каждую
+  const batchKey = `${TYPE}|${leagueId}|${seasonsParam}|${HA}`;
+  if (!sprogBatchCache[batchKey]) {
+    const ids = Object.keys(teamNames).map(Number).filter(Number.isInteger);
+    if (!ids.includes(Number(teamId))) ids.push(Number(teamId));
+    sprogBatchCache[batchKey] = getSuperProgBatch({
+      leagueId, seasons: seasonsParam, haMode: HA, statType: TYPE, halfLifeDays: 180,
+      pairs: ids.map(id => ({ team_id: id })),
+    }).then(b => {
+      const byTeam = {};
+      (b?.results || []).forEach(r => { byTeam[r.team_id] = r; });
+      return byTeam;
+    }).catch((e)=>{
+      console.warn('[sprog] backend error', e?.message || e);
+      delete sprogBatchCache[batchKey];
+      return null;
+    });
+  }
+  const byTeam = await sprogBatchCache[batchKey];
+  const resp = byTeam ? byTeam[Number(teamId)] : null;
   if (!resp) return null;
 
   let value = null;
@@ -126,7 +146,7 @@ async function getSuperProgForecast({ teamId, seasonLabel, metricKey }){
   sprogCache[key] = out;
   return out;
 }
-window.__GE_API__ = { ensureHistoryLoaded, getSuperProgForecast };
+window.__GE_API__ = { getForecast, getSuperProgForecast };
 
 // ===== загрузка списков =====
 async function populateLeagues() {
@@ -160,8 +180,10 @@ async function populateTeamsAndSeasons() {
   if (els.season) els.season.innerHTML = seasonsAll.map((s,i)=>`<option value="${i}">${s}</option>`).join('');
 
   cache = {};
-  histCache = {};
+  forecastCache = {};
   sprogCache = {};
+  sprogBatchCache = {};
+  clearSeriesCache();
   validateShowButton();
   setStatus('');
 }
@@ -235,14 +257,16 @@ els.league.addEventListener('change', async (e) => {
   if (els.team1) els.team1.innerHTML = '';
   if (els.team2) els.team2.innerHTML = '<option value="">— не выбрано —</option>';
   cache = {};
-  histCache = {};
+  forecastCache = {};
   sprogCache = {};
+  sprogBatchCache = {};
+  clearSeriesCache();
   await populateTeamsAndSeasons();
 });
 [els.season, els.team1, els.team2].forEach(el=>{
   el.addEventListener('change', ()=>{
     cache = {};
-    histCache = {};
+    forecastCache = {};
     sprogCache = {};
     validateShowButton();
   });
@@ -261,7 +285,7 @@ els.typePills?.addEventListener('click', (e) => {
   // Пользователь сам управляет режимом через «Тоталы/Фора».
   // Очищаем кэши и перерисовываем.
   cache = {};
-  histCache = {};
+  forecastCache = {};
   sprogCache = {};
   showSeason();
 });
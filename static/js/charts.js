@@ -1,7 +1,7 @@
 // /js/charts.js
 // Использует window.Chart, window['chartjs-plugin-annotation'],
 // window.__GE_STATE__ (STAT_TYPE, HA_MODE, PATTERN_K, TOL, HANDICAP_MODE, getTeamNames, getSeasonsAll)
-// и window.__GE_API__ (ensureHistoryLoaded, getSuperProgForecast)
+// и window.__GE_API__ (getForecast, getSuperProgForecast)
 
 function color(i){
   const p = ['#6EE7B7','#93C5FD','#FCA5A5','#FCD34D','#A78BFA','#A7F3D0','#F9A8D4','#FDBA74','#34D399','#60A5FA','#F87171','#FBBF24','#C4B5FD','#F472B6','#FB923C'];
@@ -168,186 +168,6 @@ function maxYFromDatasets(dsets){
   return m;
 }
 
-/* === простые прогнозы (▲, ◆) === */
-function predictPatternK(currentRows, historyRows, K=2, tol=1){
-  if(currentRows.length < K) return { value:null, count:0 };
-  const pat = currentRows.slice(-K).map(r => toNum(r.y));
-  if(pat.some(v=>v===null)) return { value:null, count:0 };
-
-  // разделим на сезоны по x==1
-  const seasons = []; let cur = [];
-  for(const r of historyRows){ if(r.x===1 && cur.length){ seasons.push(cur); cur=[]; } cur.push(r); }
-  if(cur.length) seasons.push(cur);
-
-  const tau = (tol === 0) ? 0.20 : 0.90;
-
-  let num=0, den=0, cnt=0;
-  for(const s of seasons){
-    const vals = s.map(r => toNum(r.y));
-    for(let i=0; i + K < vals.length; i++){
-      let ok = true, d2 = 0;
-      for(let j=0;j<K;j++){
-        const a = vals[i+j], b = pat[j];
-        if(a===null || b===null){ ok=false; break; }
-        if(tol===0 ? (a!==b) : (Math.abs(a-b)>tol)){ ok=false; break; }
-        d2 += (a-b)*(a-b);
-      }
-      if(!ok) continue;
-      const nxt = vals[i+K];
-      if(nxt===null) continue;
-      const w = Math.exp(- d2 / (2*tau*tau));
-      num += w * nxt; den += w; cnt++;
-    }
-  }
-  if(den>0) return { value: num/den, count: cnt };
-  return { value:null, count:0 };
-}
-
-/* === kernel-прогноз === */
-function kernelForecast(currentRows, historyRows, metricKey, tol){
-  const base = {
-    // goals — фора
-    goal_diff:{k:3,sigma0:0.35,sigma1:1.20},
-    goal_diff_roll3:{k:3,sigma0:0.35,sigma1:1.20},
-    goal_diff_ewma:{k:3,sigma0:0.35,sigma1:1.20},
-    goals_against_neg:{k:2,sigma0:0.30,sigma1:0.95},
-
-    // corners — фора
-    corner_diff:{k:3,sigma0:0.55,sigma1:1.60},
-    corner_diff_roll3:{k:3,sigma0:0.55,sigma1:1.60},
-    corner_diff_ewma:{k:3,sigma0:0.55,sigma1:1.60},
-    corners_against_neg:{k:2,sigma0:0.45,sigma1:1.30},
-
-    // cards — фора
-    cards_diff:{k:3,sigma0:0.40,sigma1:1.10},
-    cards_diff_roll3:{k:3,sigma0:0.40,sigma1:1.10},
-    cards_diff_ewma:{k:3,sigma0:0.40,sigma1:1.10},
-    cards_against_neg:{k:2,sigma0:0.35,sigma1:0.95},
-
-    // shots — фора
-    shots_diff:{k:3,sigma0:1.8,sigma1:4.5},
-    shots_diff_roll3:{k:3,sigma0:1.8,sigma1:4.5},
-    shots_diff_ewma:{k:3,sigma0:1.8,sigma1:4.5},
-    shots_against_neg:{k:2,sigma0:1.4,sigma1:3.5},
-
-    // SOT — фора
-    sot_diff:{k:3,sigma0:0.6,sigma1:1.6},
-    sot_diff_roll3:{k:3,sigma0:0.6,sigma1:1.6},
-    sot_diff_ewma:{k:3,sigma0:0.6,sigma1:1.6},
-    sot_against_neg:{k:2,sigma0:0.55,sigma1:1.4},
-
-    // тоталы/обычные
-    total_goals:{k:3,sigma0:0.35,sigma1:1.20},
-    goals_for:{k:2,sigma0:0.30,sigma1:0.95},
-    goals_against:{k:2,sigma0:0.30,sigma1:0.95},
-
-    total_corners:{k:3,sigma0:0.55,sigma1:1.60},
-    corners_for:{k:2,sigma0:0.45,sigma1:1.30},
-    corners_against:{k:2,sigma0:0.45,sigma1:1.30},
-
-    total_cards:{k:3,sigma0:0.40,sigma1:1.10},
-    cards_for:{k:2,sigma0:0.35,sigma1:0.95},
-    cards_against:{k:2,sigma0:0.35,sigma1:0.95},
-
-    total_shots:{k:3,sigma0:1.8,sigma1:4.5},
-    shots_for:{k:2,sigma0:1.4,sigma1:3.5},
-    shots_against:{k:2,sigma0:1.4,sigma1:3.5},
-
-    total_sot:{k:3,sigma0:0.6,sigma1:1.6},
-    sot_for:{k:2,sigma0:0.55,sigma1:1.4},
-    sot_against:{k:2,sigma0:0.55,sigma1:1.4},
-  };
-  const cfg = base[metricKey] || { k:2, sigma0:0.35, sigma1:1.0 };
-  const sigma = (tol === 0) ? cfg.sigma0 : cfg.sigma1;
-  const k = cfg.k;
-
-  if(currentRows.length < k) return { value:null, weight:0 };
-  const pat = currentRows.slice(-k).map(p => toNum(p.y));
-  if(pat.some(v => v===null)) return { value:null, weight:0 };
-
-  let num = 0, den = 0;
-  for (let i=0; i + k < historyRows.length; i++) {
-    const wwin = historyRows.slice(i, i+k).map(p => toNum(p.y));
-    if(wwin.some(v => v===null)) continue;
-
-    let d2 = 0;
-    for (let t=0; t<k; t++) d2 += (wwin[t] - pat[t])**2;
-    const w = Math.exp(- d2 / (2 * sigma * sigma));
-
-    const next = toNum(historyRows[i+k].y);
-    if (w > 1e-9 && next !== null) { num += w * next; den += w; }
-  }
-  if (den === 0) return { value:null, weight:0 };
-  return { value: num / den, weight: den };
-}
-
-/* ===== Байес: Пуассон (тоталы/обычные) и Skellam (фора по голам) ===== */
-function gammaFromMoments(m, v){
-  if(!(isFinite(m) && m>0) || !(isFinite(v) && v>0)) return {alpha: 1, beta: 1/Math.max(m,1e-6)};
-  if(v <= m + 1e-6){ const a=1e6, b=a/Math.max(m,1e-6); return { alpha:a, beta:b }; }
-  const alpha = (m*m) / (v - m);
-  const beta  = alpha / m;
-  if(!isFinite(alpha) || !isFinite(beta) || alpha<=0 || beta<=0){
-    return { alpha: 1, beta: 1/Math.max(m,1e-6) };
-  }
-  return { alpha, beta };
-}
-
-function bayesPoissonForecast(curSeries, leagueHistVals){
-  const A = leagueHistVals.map(toNum).filter(v=>v!==null);
-  if(A.length === 0){ return { value:null, alpha:0, beta:0 }; }
-  const m = mean(A);
-  const v = (()=>{ const mu=m; const dif=A.map(x=> (x-mu)*(x-mu) ); return dif.reduce((s,x)=>s+x,0)/(A.length-1||1); })();
-  const { alpha, beta } = gammaFromMoments(m, v);
-
-  const cur = curSeries.map(r=>toNum(r.y)).filter(v=>v!==null);
-  const sumy = cur.reduce((s,x)=>s+x,0);
-  const n = cur.length;
-
-  const alphaPost = alpha + sumy;
-  const betaPost  = beta  + n;
-  const lambdaHat = alphaPost / betaPost;
-
-  return { value: lambdaHat, alpha: alphaPost, beta: betaPost };
-}
-
-function bayesSkellamForecast(curRowsGfGa, leagueRowsGfGa){
-  const toPairs = rows => rows.map(r=>({
-    gf: toNum(r.goals_for),
-    ga: toNum(r.goals_against)
-  })).filter(q=>q.gf!==null && q.ga!==null);
-
-  const L = toPairs(leagueRowsGfGa);
-  if(!L.length) return { value:null };
-
-  const meanVar = arr => {
-    const a = arr.filter(v=>v!==null);
-    if(!a.length) return {m:0.8, v:1.2};
-    const m = a.reduce((s,x)=>s+x,0)/a.length;
-    const v = a.reduce((s,x)=>s+(x-m)*(x-m),0)/Math.max(1,a.length-1);
-    return { m: Math.max(m, 0.01), v: Math.max(v, 0.02) };
-  };
-  const { m:mf, v:vf } = meanVar(L.map(q=>q.gf));
-  const { m:ma, v:va } = meanVar(L.map(q=>q.ga));
-  const { alpha:af, beta:bf } = gammaFromMoments(mf, vf);
-  const { alpha:aa, beta:ba } = gammaFromMoments(ma, va);
-
-  const C = toPairs(curRowsGfGa);
-  const sumGF = C.reduce((s,q)=>s+q.gf,0);
-  const sumGA = C.reduce((s,q)=>s+q.ga,0);
-  const n = C.length;
-
-  const alphaF = af + sumGF;
-  const betaF  = bf + n;
-  const alphaA = aa + sumGA;
-  const betaA  = ba + n;
-
-  const lambdaF = alphaF / betaF;
-  const lambdaA = alphaA / betaA;
-
-  return { value: lambdaF - lambdaA, lambdaF, lambdaA, alphaF, betaF, alphaA, betaA };
-}
-
 /* ===== UI построение ===== */
 export function buildSeasonShell(seasonLabel, idx){
   const holder = document.createElement('div');
@@ -655,18 +475,16 @@ export async function fillChartsForSeason(seasonLabel, chartObjs, points){
       const curSeries = perTeamSeries[tid][m.key];
       if(curSeries.length < 2) continue;
 
-      const hist = await window.__GE_API__.ensureHistoryLoaded(tid);
-      const allHist = (hist.pointsAllSeasons || []).filter(p => p.season !== seasonLabel);
-      const histRows = seriesFor(allHist, null, tid, HA_MODE, m.key);
+      // ▲ ◆ ★ — считает сервер (/api/forecast) по истории лиги
+      const f = await window.__GE_API__.getForecast({ teamId: tid, seasonLabel, metricKey: m.key });
       const xNext = curSeries.length + 1;
 
       let progText = '', kText = '', bText = '', sText = '';
 
       // ▲ prog
       if(document.getElementById('showForecast')?.checked){
-        const r1 = predictPatternK(curSeries, histRows, window.__GE_STATE__.PATTERN_K, window.__GE_STATE__.TOL);
-        if(r1.value !== null){
-          const y1 = r1.value;
+        if(f && f.pattern !== null){
+          const y1 = f.pattern;
           const rounded = (Math.round(y1*10)/10).toFixed(1);
           chart.data.datasets.push({
             label: `${(teamNames[tid]||'') } prog`,
@@ -685,7 +503,7 @@ export async function fillChartsForSeason(seasonLabel, chartObjs, points){
 
       // ◆ kprog
       if(document.getElementById('showKernel')?.checked){
-        const { value: y2 } = kernelForecast(curSeries, histRows, m.key, window.__GE_STATE__.TOL);
+        const y2 = f ? f.kernel : null;
         if(y2 !== null){
           const rounded = (Math.round(y2*10)/10).toFixed(1);
           chart.data.datasets.push({
@@ -705,23 +523,8 @@ export async function fillChartsForSeason(seasonLabel, chartObjs, points){
 
       // ★ bprog
       if(document.getElementById('showBayes')?.checked){
-        let y3 = null;
-
-        // Skellam — только для goal_diff (голы)
-        if (STAT_TYPE === 'goals' && HANDICAP_MODE && m.key === 'goal_diff') {
-          const curPairs = perTeamSeries[tid]['goal_diff'].map((_, i) => ({
-            goals_for: perTeamSeries[tid]['goals_for']?.[i]?.y ?? null,
-            goals_against: perTeamSeries[tid]['goals_against']?.[i]?.y ?? null
-          }));
-          const histPairs = (hist.pointsAllSeasons || []).filter(p => p.team_id===tid)
-            .map(p => ({ goals_for: toNum(p.goals_for), goals_against: toNum(p.goals_against) }));
-          const b = bayesSkellamForecast(curPairs, histPairs);
-          if (b && b.value !== null) y3 = b.value;
-        } else {
-          const leagueVals = histRows.map(r=>toNum(r.y)).filter(v=>v!==null);
-          const b = bayesPoissonForecast(curSeries, leagueVals);
-          if (b && b.value !== null) y3 = b.value;
-        }
+        // Skellam (фора по голам) или Пуассон с Gamma-приором по лиге
+        const y3 = f ? f.bayes : null;
 
         if(y3 !== null){
           const rounded = (Math.round(y3*10)/10).toFixed(1);
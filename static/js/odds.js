@@ -12,12 +12,31 @@ const els = {
   cou:     document.getElementById('chartOU'),
   chkBoth: document.getElementById('chkBoth'),
   chkOpen: document.getElementById('chkOpen'),
+  ouLine:  document.getElementById('ouLine'),
+  ouTitle: document.getElementById('ouLineTitle'),
 };
 
+// все линии тоталов приходят одним запросом (ou_lines), смена линии — без нового запроса
+const OU_LINES = ['1.5', '2.5', '3.5', '4.5'];
+
 let leagueId = null;
 let teamNames = {};
 let chart1x2 = null;
 let chartOU  = null;
+const h2hCache = new Map();   // orientation -> Promise, только для текущей пары
+
+// один запрос /api/h2h_odds на пару+ориентацию: 1X2 и тоталы (все линии) берут его вместе
+function fetchH2H(p, orientation){
+  const pair = `${leagueId}|${p.h}|${p.a}`;
+  if(h2hCache.pair !== pair){ h2hCache.clear(); h2hCache.pair = pair; }
+  if(!h2hCache.has(orientation)){
+    const url = `/api/h2h_odds?league_id=${leagueId}&home_team_id=${p.h}&away_team_id=${p.a}&line=2.5&line_tol=0.05&orientation=${orientation}&include_open=true&lines=${OU_LINES.join(',')}`;
+    const promise = fetchJSON(url);
+    promise.catch(() => { if(h2hCache.get(orientation) === promise) h2hCache.delete(orientation); });
+    h2hCache.set(orientation, promise);
+  }
+  return h2hCache.get(orientation);
+}
 
 // helpers
 function setStatus(msg, isErr=false){
@@ -171,8 +190,7 @@ async function draw1x2(){
   if(chart1x2){ chart1x2.destroy(); chart1x2=null; }
   const p = validParams(); if(!p) return;
 
-  const url = `/api/h2h_odds?league_id=${leagueId}&home_team_id=${p.h}&away_team_id=${p.a}&line=2.5&line_tol=0.05&orientation=strict&include_open=true`;
-  const data = await fetchJSON(url);
+  const data = await fetchH2H(p, 'strict');
   const pts = Array.isArray(data.points) ? data.points : [];
   if(pts.length===0){ setStatus('Нет H2H (строго «дом→гость») или котировок для 1X2.', false); return; }
 
@@ -224,9 +242,13 @@ async function drawTotals(){
   const p = validParams(); if(!p) return;
 
   const orientation = els.chkBoth?.checked ? 'both' : 'strict';
-  const url = `/api/h2h_odds?league_id=${leagueId}&home_team_id=${p.h}&away_team_id=${p.a}&line=2.5&line_tol=0.05&orientation=${orientation}&include_open=true`;
-  const data = await fetchJSON(url);
-  const allPts = Array.isArray(data.points) ? data.points : [];
+  const L = els.ouLine?.value || '2.5';
+  if(els.ouTitle) els.ouTitle.textContent = L;
+
+  const data = await fetchH2H(p, orientation);
+  const basePts = Array.isArray(data.points) ? data.points : [];
+  const series  = data.ou_lines?.[L] || [];
+  const allPts  = basePts.map((bp, i) => ({ ...bp, ...(series[i] || { over:null, under:null, over_open:null, under_open:null }) }));
   const pts = allPts.filter(pt => pt.over != null || pt.under != null || pt.over_open != null || pt.under_open != null);
   if(pts.length===0){
     setStatus(orientation==='both' ? 'Нет OU котировок (оба направления).' : 'Нет OU котировок (строго дом→гость).', false);
@@ -241,23 +263,24 @@ async function drawTotals(){
   const under_o  = pts.map(p => p.under_open ?? null);
 
   const totals = scoreArr.map(s => { const m=s?.match?.(/^(\d+)[–-](\d+)$/); if(!m) return null; return (+m[1])+(+m[2]); });
-  const winOver  = totals.map((t,i)=> over[i]!=null  && t!=null && t>=3);
-  const winUnder = totals.map((t,i)=> under[i]!=null && t!=null && t<=2);
+  const lineNum  = Number(L);
+  const winOver  = totals.map((t,i)=> over[i]!=null  && t!=null && t>lineNum);
+  const winUnder = totals.map((t,i)=> under[i]!=null && t!=null && t<lineNum);
 
   const showOpen = !!els.chkOpen?.checked && (over_o.some(v=>v!=null)||under_o.some(v=>v!=null));
 
   const datasets = [
     // CLOSE — с маркерами ✓/✗ и в тултипе
-    { label:'Over 2.5 (close)',  data:over,  _open:over_o,  _score:scoreArr, _win:winOver,
+    { label:`Over ${L} (close)`,  data:over,  _open:over_o,  _score:scoreArr, _win:winOver,
       borderColor:COLORS.over,  backgroundColor:'transparent', borderWidth:4, fill:false, showLine:true },
-    { label:'Under 2.5 (close)', data:under, _open:under_o, _score:scoreArr, _win:winUnder,
+    { label:`Under ${L} (close)`, data:under, _open:under_o, _score:scoreArr, _win:winUnder,
       borderColor:COLORS.under, backgroundColor:'transparent', borderWidth:4, fill:false, showLine:true },
     // OPEN — без маркеров и НЕ в тултипе
     ...(showOpen ? [
-      { label:'Over 2.5 (open)',  data:over_o,  _open:over_o,  _score:scoreArr, _isOpen:true,
+      { label:`Over ${L} (open)`,  data:over_o,  _open:over_o,  _score:scoreArr, _isOpen:true,
         borderColor:hex2rgba(COLORS.over,0.6),  backgroundColor:'transparent', borderWidth:2, fill:false, showLine:true, borderDash:[3,3],
         pointRadius:0, pointHitRadius:6 },
-      { label:'Under 2.5 (open)', data:under_o, _open:under_o, _score:scoreArr, _isOpen:true,
+      { label:`Under ${L} (open)`, data:under_o, _open:under_o, _score:scoreArr, _isOpen:true,
         borderColor:hex2rgba(COLORS.under,0.6), backgroundColor:'transparent', borderWidth:2, fill:false, showLine:true, borderDash:[3,3],
         pointRadius:0, pointHitRadius:6 },
     ] : [])
@@ -282,6 +305,7 @@ els.league.addEventListener('change', async (e)=>{ const v=Number(e.target.value
 els.home.addEventListener('change', redrawAll);
 els.away.addEventListener('change', redrawAll);
 els.chkBoth && els.chkBoth.addEventListener('change', drawTotals);
+els.ouLine && els.ouLine.addEventListener('change', drawTotals);
 els.chkOpen && els.chkOpen.addEventListener('change', redrawAll);
 
 // boot